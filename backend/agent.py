@@ -0,0 +1,144 @@
+import json
+import os
+import socket
+import socketserver
+import struct
+import time
+from typing import Any, Callable, Dict, Optional
+from .agentClient import agentRunning, defaultSocketPath
+from .passwordManager import PasswordStore
+from .utilities import shortenURLtoWebsiteName, validateEmail, validatePassword
+
+AGENT_IDLE_TIMEOUT: float = 15 * 60
+AGENT_POLL_INTERVAL: float = 1.0
+# Requests are served one connection at a time, so a client that goes quiet is
+# dropped well within the other clients' request timeout.
+AGENT_CONNECTION_TIMEOUT: float = 1.0
+
+
+class AgentRequestHandler(socketserver.StreamRequestHandler):
+    timeout = AGENT_CONNECTION_TIMEOUT
+
+    def handle(self) -> None:
+        try:
+            for line in self.rfile:
+                try:
+                    response = self.server.dispatch(json.loads(line))
+                except (ValueError, KeyError, TypeError) as e:
+                    response = {'ok': False, 'error': f"Malformed request: {e}"}
+                except Exception as e:
+                    # The agent outlives a failed request, e.g. a vault another instance left unreadable.
+                    response = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+                self.wfile.write(json.dumps(response).encode() + b'\n')
+                self.wfile.flush()
+        except TimeoutError:
+            pass
+
+
+class AgentServer(socketserver.UnixStreamServer):
+    def __init__(self, passwordStore: PasswordStore, socketPath: Optional[str] = None, idleTimeout: float = AGENT_IDLE_TIMEOUT):
+        self.passwordStore = passwordStore
+        self.socketPath = socketPath or defaultSocketPath()
+        self.idleTimeout = idleTimeout
+        self.lastActivity = time.monotonic()
+        self.running = True
+        self.timeout = AGENT_POLL_INTERVAL
+        self.commands: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+            'ping': self.ping,
+            'get': self.get,
+            'list': self.list,
+            'add': self.add,
+            'lock': self.lock
+        }
+        self.prepareSocketPath()
+        oldUmask = os.umask(0o177)
+        try:
+            super().__init__(self.socketPath, AgentRequestHandler)
+        finally:
+            os.umask(oldUmask)
+        os.chmod(self.socketPath, 0o600)
+
+    def prepareSocketPath(self) -> None:
+        directory = os.path.dirname(self.socketPath)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        if os.stat(directory).st_uid != os.getuid():
+            raise PermissionError(f"Agent directory {directory} belongs to another user.")
+        os.chmod(directory, 0o700)
+        if os.path.exists(self.socketPath):
+            if agentRunning(self.socketPath):
+                raise RuntimeError(f"An agent is already listening on {self.socketPath}.")
+            os.unlink(self.socketPath)
+
+    def verify_request(self, request: socket.socket, clientAddress: Any) -> bool:
+        # The socket is 0600 already; where the kernel tells us the peer, insist on our own uid.
+        if not hasattr(socket, 'SO_PEERCRED'):
+            return True
+        credentials = request.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+        _, uid, _ = struct.unpack('3i', credentials)
+        return uid == os.getuid()
+
+    def serveUntilIdle(self) -> None:
+        try:
+            while self.running and time.monotonic() - self.lastActivity < self.idleTimeout:
+                self.handle_request()
+        finally:
+            self.server_close()
+            self.passwordStore.close()
+            if os.path.exists(self.socketPath):
+                os.unlink(self.socketPath)
+
+    def dispatch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        self.lastActivity = time.monotonic()
+        command = self.commands.get(request.get('command'))
+        if command is None:
+            return {'ok': False, 'error': f"Unknown command: {request.get('command')}"}
+        # Edits saved by the GUI or another agent since the last request.
+        self.passwordStore.checkForChanges()
+        return command(request)
+
+    def resolveWebsite(self, website: str) -> str:
+        if website in self.passwordStore.passwords:
+            return website
+        return shortenURLtoWebsiteName(website)
+
+    def ping(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        return {'ok': True, 'idleTimeout': self.idleTimeout}
+
+    def get(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        website = self.resolveWebsite(request['website'])
+        emails = self.passwordStore.getEmails(website)
+        email = request.get('email')
+        if not emails:
+            return {'ok': False, 'error': f"No passwords stored for {website}."}
+        if email is None:
+            if len(emails) > 1:
+                return {'ok': False, 'error': f"{website} has {len(emails)} accounts; pass an email.", 'emails': sorted(emails)}
+            email = emails[0]
+        password = self.passwordStore.getPassword(website, email)
+        if password is None:
+            return {'ok': False, 'error': f"No password stored for {email} at {website}."}
+        return {'ok': True, 'website': website, 'email': email, 'password': password}
+
+    def list(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        if request.get('website'):
+            website = self.resolveWebsite(request['website'])
+            return {'ok': True, 'emails': sorted(self.passwordStore.getEmails(website))}
+        return {'ok': True, 'websites': self.passwordStore.search(request.get('query', ''))}
+
+    def add(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        website = shortenURLtoWebsiteName(request['website'])
+        email = request['email']
+        password = request['password']
+        if not validateEmail(email):
+            return {'ok': False, 'error': "Email does not meet validation criteria."}
+        if not validatePassword(password):
+            return {'ok': False, 'error': "Password does not meet criteria."}
+        self.passwordStore.addPassword(website, email, password)
+        self.passwordStore.flush()
+        conflicts, self.passwordStore.conflicts = self.passwordStore.conflicts, []
+        return {'ok': True, 'website': website, 'email': email,
+                'conflicts': [[conflict.website, conflict.email] for conflict in conflicts]}
+
+    def lock(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        self.running = False
+        return {'ok': True}
@@ -0,0 +1,46 @@
+import json
+import os
+import socket
+import tempfile
+from typing import Any, Dict, Optional
+
+AGENT_SOCKET_ENV: str = 'PASSWORD_MANAGER_AGENT_SOCK'
+AGENT_REQUEST_TIMEOUT: float = 5.0
+
+
+class AgentError(Exception):
+    pass
+
+
+def defaultSocketPath() -> str:
+    if os.environ.get(AGENT_SOCKET_ENV):
+        return os.environ[AGENT_SOCKET_ENV]
+    runtimeDir = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(runtimeDir, f'password-manager-{os.getuid()}', 'agent.sock')
+
+
+def sendRequest(request: Dict[str, Any], socketPath: Optional[str] = None, timeout: float = AGENT_REQUEST_TIMEOUT) -> Dict[str, Any]:
+    socketPath = socketPath or defaultSocketPath()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(timeout)
+            connection.connect(socketPath)
+            connection.sendall(json.dumps(request).encode() + b'\n')
+            with connection.makefile('rb') as reader:
+                line = reader.readline()
+    except (FileNotFoundError, ConnectionRefusedError):
+        raise AgentError("No agent is running. Start one with 'python cli.py agent start'.")
+    if not line:
+        raise AgentError("The agent closed the connection.")
+    response = json.loads(line)
+    if not response.get('ok'):
+        raise AgentError(response.get('error', "The agent rejected the request."))
+    return response
+
+
+def agentRunning(socketPath: Optional[str] = None) -> bool:
+    try:
+        sendRequest({'command': 'ping'}, socketPath, timeout=1.0)
+        return True
+    except (AgentError, OSError):
+        return False
@@ -0,0 +1,333 @@
+import base64
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import TYPE_CHECKING, Any, BinaryIO, Dict, Iterator, List, Optional, Set
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDFExpand
+from .encryption import EncryptionManager
+from .journal import JOURNAL_PATH
+from .persistence import atomicWriter, writeAtomically
+from .vaultFormat import CHUNKED_VAULT_PATH, LEGACY_VAULT_PATH, MERKLE_PATH, SQLITE_VAULT_PATH, VAULT_PATH, VaultFormatError, VaultReader, VaultWriter
+from .vaultSync import VaultLock
+
+if TYPE_CHECKING:
+    from .passwordManager import PasswordStore
+
+BACKUP_DIR: str = 'backups'
+BACKUP_VERSION: int = 1
+# After this many incremental snapshots the next one is full, so a restore never
+# reads more than this many segments on top of a full one.
+BACKUP_CHAIN_LIMIT: int = 32
+ENTRY_ID_SIZE: int = 16
+INDEX_MAGIC: bytes = b'PMBACKUPINDEX1'
+# Marks a deletion record; normalised website names never contain a NUL.
+TOMBSTONE_PREFIX: str = '\x00deleted:'
+SALT_PATH: str = 'resources/hashSalt'
+MASTER_HASH_PATH: str = 'data/masterHash'
+
+
+class BackupError(Exception):
+    pass
+
+
+def backupKey(encryptionManager: EncryptionManager) -> bytes:
+    return HKDFExpand(algorithm=hashes.SHA256(), length=32, info=b'backup-index',
+                      backend=default_backend()).derive(encryptionManager.vaultKey)
+
+
+def keyId(key: bytes) -> str:
+    # Identifies the master key a snapshot was made under, without revealing it.
+    return hashlib.blake2b(b'key-id', key=key, digest_size=8).hexdigest()
+
+
+# Keyed BLAKE2b rather than HMAC-SHA256: every entry is hashed twice per backup,
+# and it is about three times faster per call.
+def entryId(key: bytes, website: str, email: str) -> bytes:
+    return hashlib.blake2b(website.encode() + b'\x00' + email.encode(), key=key, digest_size=ENTRY_ID_SIZE).digest()
+
+
+def valueHash(key: bytes, identifier: bytes, password: str) -> bytes:
+    return hashlib.blake2b(identifier + password.encode(), key=key, digest_size=ENTRY_ID_SIZE).digest()
+
+
+class HashingStream:
+    # Passes reads or writes through to a file while hashing every byte, so a
+    # segment's address is computed in the same pass that writes or reads it.
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.digest.update(data)
+        self.size += len(data)
+        return self.stream.write(data)
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.stream.read(size)
+        self.digest.update(data)
+        self.size += len(data)
+        return data
+
+
+class BackupRepository:
+    # Snapshots are small JSON manifests in manifests/, each pointing at one encrypted
+    # segment in segments/, named by the SHA-256 of its bytes. A full snapshot's segment
+    # holds every entry; an incremental one holds only the entries added or changed
+    # since its parent, plus deletion records. The per-entry keyed hashes of the latest
+    # snapshot are kept in `index` to find those changes without reading old segments.
+    def __init__(self, directory: str = BACKUP_DIR):
+        self.directory = directory
+        self.manifestDir = os.path.join(directory, 'manifests')
+        self.segmentDir = os.path.join(directory, 'segments')
+        self.indexPath = os.path.join(directory, 'index')
+        self.lock = VaultLock(os.path.join(directory, 'backup.lock'))
+
+    def manifestPath(self, sequence: int) -> str:
+        return os.path.join(self.manifestDir, f'{sequence:08d}.json')
+
+    def segmentPath(self, address: str) -> str:
+        return os.path.join(self.segmentDir, address[:2], address)
+
+    def sequences(self) -> List[int]:
+        try:
+            names = os.listdir(self.manifestDir)
+        except FileNotFoundError:
+            return []
+        return sorted(int(name[:-5]) for name in names if name.endswith('.json') and name[:-5].isdigit())
+
+    def manifest(self, sequence: int) -> Dict[str, Any]:
+        try:
+            with open(self.manifestPath(sequence)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise BackupError(f"Snapshot {sequence} does not exist.") from None
+
+    def manifests(self) -> List[Dict[str, Any]]:
+        return [self.manifest(sequence) for sequence in self.sequences()]
+
+    def chain(self, manifest: Dict[str, Any]) -> List[Dict[str, Any]]:
+        # The snapshot and its parents back to the full snapshot it builds on, newest first.
+        chain = [manifest]
+        while not chain[-1]['full']:
+            chain.append(self.manifest(chain[-1]['parent']))
+        return chain
+
+    def loadIndex(self, manifest: Optional[Dict[str, Any]], key: bytes) -> Optional[Dict[bytes, bytes]]:
+        # None means the next snapshot has to be full: there is no usable parent.
+        if manifest is None or manifest['keyId'] != keyId(key) or manifest['chainLength'] >= BACKUP_CHAIN_LIMIT:
+            return None
+        try:
+            with open(self.indexPath, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        header, _, body = data.partition(b'\n')
+        expected = INDEX_MAGIC + b' ' + str(manifest['sequence']).encode() + b' ' + hashlib.sha256(body).hexdigest().encode()
+        if header != expected or len(body) % (2 * ENTRY_ID_SIZE):
+            # Written for another snapshot, e.g. a backup interrupted before the index was saved.
+            return None
+        view = memoryview(body)
+        return {bytes(view[offset:offset + ENTRY_ID_SIZE]): bytes(view[offset + ENTRY_ID_SIZE:offset + 2 * ENTRY_ID_SIZE])
+                for offset in range(0, len(body), 2 * ENTRY_ID_SIZE)}
+
+    def saveIndex(self, sequence: int, index: Dict[bytes, bytes]) -> None:
+        body = b''.join(identifier + value for identifier, value in index.items())
+        header = INDEX_MAGIC + b' ' + str(sequence).encode() + b' ' + hashlib.sha256(body).hexdigest().encode()
+        writeAtomically(self.indexPath, header + b'\n' + body)
+
+    def create(self, passwordStore: 'PasswordStore', full: bool = False) -> Optional[Dict[str, Any]]:
+        # Returns the new snapshot's manifest, or None when nothing changed since the last one.
+        # A full snapshot starts a new chain, after which prune can drop the old one.
+        encryptionManager = passwordStore.encryptionManager
+        key = backupKey(encryptionManager)
+        os.makedirs(self.manifestDir, exist_ok=True)
+        os.makedirs(self.segmentDir, exist_ok=True)
+        with self.lock:
+            sequences = self.sequences()
+            parent = self.manifest(sequences[-1]) if sequences else None
+            previous = None if full else self.loadIndex(parent, key)
+            full = previous is None
+            sequence = sequences[-1] + 1 if sequences else 1
+            passwordStore.checkForChanges()
+            with passwordStore.lock:
+                snapshot = {website: dict(entries) for website, entries in passwordStore.passwords.items()}
+
+            index: Dict[bytes, bytes] = {}
+            changed = 0
+            tempFd, tempPath = tempfile.mkstemp(dir=self.segmentDir, suffix='.tmp')
+            try:
+                with os.fdopen(tempFd, 'wb') as f:
+                    stream = HashingStream(f)
+                    with VaultWriter(stream, encryptionManager, kind='backup', sequence=sequence) as writer:
+                        for website, entries in snapshot.items():
+                            for email, secret in entries.items():
+                                password = passwordStore.unsealed(secret)
+                                identifier = entryId(key, website, email)
+                                value = index[identifier] = valueHash(key, identifier, password)
+                                if full or previous.get(identifier) != value:
+                                    writer.write(website, email, password)
+                                    changed += 1
+                        deleted = [] if full else [identifier for identifier in previous if identifier not in index]
+                        for identifier in deleted:
+                            writer.write(TOMBSTONE_PREFIX + identifier.hex(), '', '')
+                    f.flush()
+                    os.fsync(f.fileno())
+                if not full and not changed and not deleted:
+                    os.remove(tempPath)
+                    return None
+                address = stream.digest.hexdigest()
+                segmentPath = self.segmentPath(address)
+                os.makedirs(os.path.dirname(segmentPath), exist_ok=True)
+                os.replace(tempPath, segmentPath)
+            except BaseException:
+                if os.path.exists(tempPath):
+                    os.remove(tempPath)
+                raise
+
+            with open(encryptionManager.saltPath, 'rb') as f:
+                salt = f.read()
+            with open(encryptionManager.hashPasswordPath, 'rb') as f:
+                masterHash = f.read()
+            manifest = {
+                'version': BACKUP_VERSION,
+                'sequence': sequence,
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'full': full,
+                'parent': None if full else parent['sequence'],
+                'chainLength': 0 if full else parent['chainLength'] + 1,
+                'keyId': keyId(key),
+                # What an unlock needs besides the master password, so a snapshot restores on its own.
+                'salt': base64.b64encode(salt).decode(),
+                'masterHash': base64.b64encode(masterHash).decode(),
+                'segment': {'address': address, 'size': stream.size},
+                'entries': len(index),
+                'changed': changed,
+                'deleted': len(deleted)
+            }
+            writeAtomically(self.manifestPath(sequence), json.dumps(manifest, indent=2).encode())
+            self.saveIndex(sequence, index)
+            return manifest
+
+    def segmentProblems(self, manifest: Dict[str, Any]) -> List[str]:
+        # Hashes the segment's ciphertext; nothing is decrypted.
+        segment = manifest['segment']
+        path = self.segmentPath(segment['address'])
+        try:
+            if os.path.getsize(path) != segment['size']:
+                return [f"Snapshot {manifest['sequence']}: segment {segment['address']} has the wrong size."]
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(block)
+        except FileNotFoundError:
+            return [f"Snapshot {manifest['sequence']}: segment {segment['address']} is missing."]
+        if digest.hexdigest() != segment['address']:
+            return [f"Snapshot {manifest['sequence']}: segment {segment['address']} is corrupted."]
+        return []
+
+    def verify(self) -> List[str]:
+        problems = []
+        sequences = set(self.sequences())
+        for manifest in self.manifests():
+            if not manifest['full'] and manifest['parent'] not in sequences:
+                problems.append(f"Snapshot {manifest['sequence']}: parent snapshot {manifest['parent']} is missing.")
+            problems.extend(self.segmentProblems(manifest))
+        return problems
+
+    def prune(self, keep: int) -> List[int]:
+        # Keeps the newest `keep` snapshots restorable, along with the parents they build on,
+        # then deletes every segment no remaining snapshot refers to.
+        if keep < 1:
+            raise ValueError("At least one snapshot has to be kept.")
+        with self.lock:
+            sequences = self.sequences()
+            required: Dict[int, Dict[str, Any]] = {}
+            for sequence in sequences[-keep:]:
+                for manifest in self.chain(self.manifest(sequence)):
+                    required[manifest['sequence']] = manifest
+            removed = [sequence for sequence in sequences if sequence not in required]
+            for sequence in removed:
+                os.remove(self.manifestPath(sequence))
+            referenced = {manifest['segment']['address'] for manifest in required.values()}
+            for root, _, names in os.walk(self.segmentDir, topdown=False):
+                for name in names:
+                    if name not in referenced:
+                        os.remove(os.path.join(root, name))
+                if root != self.segmentDir and not os.listdir(root):
+                    os.rmdir(root)
+            return removed
+
+    def readSegment(self, manifest: Dict[str, Any], encryptionManager: EncryptionManager) -> Iterator[Any]:
+        segment = manifest['segment']
+        try:
+            f = open(self.segmentPath(segment['address']), 'rb')
+        except FileNotFoundError:
+            raise BackupError(f"Snapshot {manifest['sequence']}: segment {segment['address']} is missing.") from None
+        with f:
+            stream = HashingStream(f)
+            try:
+                reader = VaultReader(stream, encryptionManager)
+                if reader.header.get('kind') != 'backup' or reader.header.get('sequence') != manifest['sequence']:
+                    raise BackupError(f"Snapshot {manifest['sequence']}: segment belongs to another snapshot.")
+                yield from reader
+            except VaultFormatError as e:
+                raise BackupError(f"Snapshot {manifest['sequence']}: {e}") from None
+            if stream.digest.hexdigest() != segment['address']:
+                raise BackupError(f"Snapshot {manifest['sequence']}: segment {segment['address']} is corrupted.")
+
+    def restore(self, sequence: int, username: str, password: str, root: str = '.', force: bool = False) -> Dict[str, Any]:
+        # Rebuilds the vault as it was at `sequence` as a binary vault under `root`,
+        # with the salt and master hash it was saved with.
+        manifest = self.manifest(sequence)
+        chain = self.chain(manifest)
+        target = {name: os.path.join(root, path) for name, path in (
+            ('vault', VAULT_PATH), ('salt', SALT_PATH), ('masterHash', MASTER_HASH_PATH))}
+        others = [os.path.join(root, path) for path in (CHUNKED_VAULT_PATH, SQLITE_VAULT_PATH, SQLITE_VAULT_PATH + '-wal',
+                                                        SQLITE_VAULT_PATH + '-shm', LEGACY_VAULT_PATH, JOURNAL_PATH)]
+        if not force and any(os.path.exists(path) for path in [target['vault']] + others):
+            raise BackupError(f"A vault already exists under {os.path.abspath(root)}.")
+        for path in target.values():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        staging = tempfile.mkdtemp(prefix='restore-', dir=os.path.dirname(target['vault']))
+        try:
+            staged = {name: os.path.join(staging, os.path.basename(path)) for name, path in target.items()}
+            writeAtomically(staged['salt'], base64.b64decode(manifest['salt']))
+            writeAtomically(staged['masterHash'], base64.b64decode(manifest['masterHash']))
+            encryptionManager = EncryptionManager(username, password, staged['salt'], staged['masterHash'])
+            if not encryptionManager.verifyPassword(username, password):
+                raise BackupError("Incorrect Details.")
+            key = backupKey(encryptionManager)
+            if any(link['keyId'] != keyId(key) for link in chain):
+                raise BackupError(f"Snapshot {sequence} was not made under this master password.")
+
+            # One pass over the chain, newest segment first: the first record seen for an
+            # entry is its value at this snapshot, and a deletion hides all older ones.
+            seen: Set[bytes] = set()
+            with atomicWriter(staged['vault']) as f:
+                with VaultWriter(f, encryptionManager) as writer:
+                    for link in chain:
+                        for website, email, secret in self.readSegment(link, encryptionManager):
+                            if website.startswith(TOMBSTONE_PREFIX):
+                                seen.add(bytes.fromhex(website[len(TOMBSTONE_PREFIX):]))
+                                continue
+                            identifier = entryId(key, website, email)
+                            if identifier not in seen:
+                                seen.add(identifier)
+                                writer.write(website, email, secret)
+
+            # The merge index describes the replaced vault, and its merge bases no longer apply.
+            for path in others + [os.path.join(root, MERKLE_PATH)]:
+                if os.path.exists(path):
+                    os.remove(path)
+            for name in ('salt', 'masterHash', 'vault'):
+                os.replace(staged[name], target[name])
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        return manifest
@@ -0,0 +1,291 @@
+import hashlib
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from .passwordManager import PasswordStore
+
+# The corpus is the "ordered by hash" SHA-1 download from Have I Been Pwned:
+# one `HASH:COUNT` line per breached password, sorted by uppercase hex hash.
+HASH_LENGTH: int = 40
+PREFIX_INDEX_SUFFIX: str = '.prefix'
+BLOOM_FILTER_SUFFIX: str = '.bloom'
+PREFIX_INDEX_MAGIC: bytes = b'PMPREFIX'
+BLOOM_FILTER_MAGIC: bytes = b'PMBLOOM1'
+# 2^20 prefixes keep each range to a few hundred lines on the full corpus,
+# so an indexed lookup touches one or two pages of it.
+PREFIX_BITS: int = 20
+BLOOM_BITS_PER_ENTRY: int = 10
+# Corpus lines are at least `HASH:1\n`, so this bounds the line count from a file size.
+MIN_LINE_LENGTH: int = HASH_LENGTH + 3
+SCAN_BLOCK_SIZE: int = 4 * 1024 * 1024
+
+PREFIX_HEADER = struct.Struct('<8sBQ')
+BLOOM_HEADER = struct.Struct('<8sQBQ')
+
+
+class BreachCorpusError(Exception):
+    pass
+
+
+def passwordHash(password: str) -> bytes:
+    return hashlib.sha1(password.encode()).hexdigest().upper().encode()
+
+
+def hashPrefix(passwordHash: bytes, bits: int) -> int:
+    return int(passwordHash[:8], 16) >> (32 - bits)
+
+
+def bloomPositions(passwordHash: bytes, bits: int, hashCount: int) -> Iterable[int]:
+    # SHA-1 is already uniform, so two slices of it give the double-hashing pair.
+    first = int(passwordHash[:16], 16)
+    second = int(passwordHash[16:32], 16) | 1
+    return ((first + index * second) % bits for index in range(hashCount))
+
+
+def lineCount(buffer: bytes, start: int, end: int) -> int:
+    countStart = start + HASH_LENGTH + 1
+    lineEnd = buffer.find(b'\n', countStart, end)
+    count = buffer[countStart:lineEnd if lineEnd >= 0 else end].strip()
+    return int(count) if count else 1
+
+
+def searchRange(buffer: bytes, target: bytes, start: int, end: int) -> int:
+    # Binary search over sorted, variable-length lines between two line starts.
+    while start < end:
+        middle = (start + end) // 2
+        lineStart = max(buffer.rfind(b'\n', start, middle) + 1, start)
+        key = buffer[lineStart:lineStart + HASH_LENGTH]
+        if key == target:
+            return lineCount(buffer, lineStart, end)
+        if key < target:
+            lineEnd = buffer.find(b'\n', lineStart, end)
+            if lineEnd < 0:
+                return 0
+            start = lineEnd + 1
+        else:
+            end = lineStart
+    return 0
+
+
+def lowerBound(buffer: bytes, target: bytes, start: int, end: int) -> int:
+    # Offset of the first line whose hash is not below the target.
+    while start < end:
+        middle = (start + end) // 2
+        lineStart = max(buffer.rfind(b'\n', start, middle) + 1, start)
+        if buffer[lineStart:lineStart + HASH_LENGTH] < target:
+            lineEnd = buffer.find(b'\n', lineStart, end)
+            if lineEnd < 0:
+                return end
+            start = lineEnd + 1
+        else:
+            end = lineStart
+    return start
+
+
+def openCorpus(corpusPath: str) -> Tuple[object, mmap.mmap]:
+    f = open(corpusPath, 'rb')
+    try:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise BreachCorpusError(f"Breach corpus {corpusPath} is empty.")
+        return f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except BaseException:
+        f.close()
+        raise
+
+
+def buildPrefixIndex(corpusPath: str, bits: int = PREFIX_BITS) -> str:
+    f, corpus = openCorpus(corpusPath)
+    try:
+        size = len(corpus)
+        offsets = array('Q', [0]) * ((1 << bits) + 1)
+        offsets[-1] = size
+        # Each prefix's first line is found by bisection from the previous one,
+        # so building the index reads a few pages per prefix rather than the whole file.
+        position = 0
+        for prefix in range(1, 1 << bits):
+            target = f'{prefix << (32 - bits):08X}'.encode()
+            position = lowerBound(corpus, target, position, size)
+            offsets[prefix] = position
+    finally:
+        corpus.close()
+        f.close()
+    if sys.byteorder != 'little':
+        offsets.byteswap()
+    indexPath = corpusPath + PREFIX_INDEX_SUFFIX
+    with open(indexPath, 'wb') as out:
+        out.write(PREFIX_HEADER.pack(PREFIX_INDEX_MAGIC, bits, size))
+        offsets.tofile(out)
+    return indexPath
+
+
+def buildBloomFilter(corpusPath: str, bitsPerEntry: int = BLOOM_BITS_PER_ENTRY) -> str:
+    size = os.path.getsize(corpusPath)
+    bits = max(8, size // MIN_LINE_LENGTH * bitsPerEntry)
+    hashCount = max(1, round(bitsPerEntry * math.log(2)))
+    filterBits = bytearray((bits + 7) // 8)
+    with open(corpusPath, 'rb') as f:
+        for line in f:
+            for position in bloomPositions(line[:HASH_LENGTH], bits, hashCount):
+                filterBits[position >> 3] |= 1 << (position & 7)
+    bloomPath = corpusPath + BLOOM_FILTER_SUFFIX
+    with open(bloomPath, 'wb') as out:
+        out.write(BLOOM_HEADER.pack(BLOOM_FILTER_MAGIC, bits, hashCount, size))
+        out.write(filterBits)
+    return bloomPath
+
+
+class BreachCorpus:
+    def __init__(self, corpusPath: str, useIndexes: bool = True):
+        self.corpusPath = corpusPath
+        self.file, self.map = openCorpus(corpusPath)
+        self.size = len(self.map)
+        self.advise('MADV_RANDOM')
+        self.prefixOffsets: Optional[array] = None
+        self.prefixBits = 0
+        self.bloomFile = None
+        self.bloom: Optional[mmap.mmap] = None
+        if useIndexes:
+            self.loadPrefixIndex()
+            self.loadBloomFilter()
+        self.corpusReads = 0
+
+    def advise(self, name: str) -> None:
+        if hasattr(self.map, 'madvise') and hasattr(mmap, name):
+            self.map.madvise(getattr(mmap, name))
+
+    def loadPrefixIndex(self) -> None:
+        try:
+            with open(self.corpusPath + PREFIX_INDEX_SUFFIX, 'rb') as f:
+                header = f.read(PREFIX_HEADER.size)
+                if len(header) < PREFIX_HEADER.size or not header.startswith(PREFIX_INDEX_MAGIC):
+                    raise BreachCorpusError("Prefix index is corrupted.")
+                _, bits, size = PREFIX_HEADER.unpack(header)
+                # An index built for another version of the corpus would point at the wrong lines.
+                if size != self.size:
+                    return
+                offsets = array('Q')
+                offsets.fromfile(f, (1 << bits) + 1)
+        except FileNotFoundError:
+            return
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        self.prefixOffsets = offsets
+        self.prefixBits = bits
+
+    def loadBloomFilter(self) -> None:
+        try:
+            f = open(self.corpusPath + BLOOM_FILTER_SUFFIX, 'rb')
+        except FileNotFoundError:
+            return
+        header = f.read(BLOOM_HEADER.size)
+        if len(header) < BLOOM_HEADER.size or not header.startswith(BLOOM_FILTER_MAGIC):
+            f.close()
+            raise BreachCorpusError("Bloom filter is corrupted.")
+        _, bits, hashCount, size = BLOOM_HEADER.unpack(header)
+        if size != self.size:
+            f.close()
+            return
+        self.bloomFile = f
+        self.bloom = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.bloomBits = bits
+        self.bloomHashCount = hashCount
+
+    def mightContain(self, passwordHash: bytes) -> bool:
+        if self.bloom is None:
+            return True
+        bloom = self.bloom
+        offset = BLOOM_HEADER.size
+        return all(bloom[offset + (position >> 3)] & (1 << (position & 7))
+                   for position in bloomPositions(passwordHash, self.bloomBits, self.bloomHashCount))
+
+    def candidateRange(self, passwordHash: bytes) -> Tuple[int, int]:
+        if self.prefixOffsets is None:
+            return 0, self.size
+        prefix = hashPrefix(passwordHash, self.prefixBits)
+        return self.prefixOffsets[prefix], self.prefixOffsets[prefix + 1]
+
+    def lookup(self, passwordHash: bytes) -> int:
+        passwordHash = passwordHash.upper()
+        if not self.mightContain(passwordHash):
+            return 0
+        self.corpusReads += 1
+        return searchRange(self.map, passwordHash, *self.candidateRange(passwordHash))
+
+    def lookupMany(self, passwordHashes: Iterable[bytes]) -> Dict[bytes, int]:
+        # Sorted queries meet the sorted corpus in one forward pass, and every
+        # query that falls inside the block in hand is bisected in memory.
+        targets = sorted(passwordHash for passwordHash in {hashValue.upper() for hashValue in passwordHashes}
+                         if self.mightContain(passwordHash))
+        counts: Dict[bytes, int] = {}
+        self.advise('MADV_SEQUENTIAL')
+        try:
+            if self.prefixOffsets is not None:
+                self.scanPrefixRanges(targets, counts)
+            else:
+                self.scanBlocks(targets, counts)
+        finally:
+            self.advise('MADV_RANDOM')
+        return counts
+
+    def scanPrefixRanges(self, targets: List[bytes], counts: Dict[bytes, int]) -> None:
+        # Only the prefix ranges that hold a query are read; the rest of the corpus is skipped.
+        index = 0
+        while index < len(targets):
+            prefix = hashPrefix(targets[index], self.prefixBits)
+            block = self.map[self.prefixOffsets[prefix]:self.prefixOffsets[prefix + 1]]
+            self.corpusReads += 1
+            while index < len(targets) and hashPrefix(targets[index], self.prefixBits) == prefix:
+                count = searchRange(block, targets[index], 0, len(block))
+                if count:
+                    counts[targets[index]] = count
+                index += 1
+
+    def scanBlocks(self, targets: List[bytes], counts: Dict[bytes, int]) -> None:
+        position = 0
+        index = 0
+        while index < len(targets) and position < self.size:
+            blockEnd = min(position + SCAN_BLOCK_SIZE, self.size)
+            if blockEnd < self.size:
+                lineEnd = self.map.find(b'\n', blockEnd)
+                blockEnd = self.size if lineEnd < 0 else lineEnd + 1
+            block = self.map[position:blockEnd]
+            self.corpusReads += 1
+            lastKey = block[block.rfind(b'\n', 0, len(block) - 1) + 1:][:HASH_LENGTH]
+            while index < len(targets) and targets[index] <= lastKey:
+                count = searchRange(block, targets[index], 0, len(block))
+                if count:
+                    counts[targets[index]] = count
+                index += 1
+            position = blockEnd
+
+    def close(self) -> None:
+        self.map.close()
+        self.file.close()
+        if self.bloom is not None:
+            self.bloom.close()
+            self.bloomFile.close()
+
+    def __enter__(self) -> 'BreachCorpus':
+        return self
+
+    def __exit__(self, excType, excValue, traceback) -> None:
+        self.close()
+
+
+def auditBreaches(passwordStore: 'PasswordStore', corpus: BreachCorpus, batch: bool = False) -> List[Tuple[str, str, int]]:
+    # Each distinct password is hashed and looked up once, however many accounts share it.
+    accounts: Dict[bytes, List[Tuple[str, str]]] = {}
+    for website, entries in passwordStore.plaintextPasswords().items():
+        for email, password in entries.items():
+            accounts.setdefault(passwordHash(password), []).append((website, email))
+    if batch:
+        counts = corpus.lookupMany(accounts)
+    else:
+        counts = {hashValue: count for hashValue in accounts if (count := corpus.lookup(hashValue))}
+    return sorted((website, email, count) for hashValue, count in counts.items() for website, email in accounts[hashValue])
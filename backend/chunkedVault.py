@@ -0,0 +1,381 @@
+import base64
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from collections.abc import MutableMapping
+from typing import TYPE_CHECKING, Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDFExpand
+from .persistence import atomicWriter
+from .vaultFormat import FILE_SALT_SIZE, HEADER_LENGTH, VAULT_CIPHER, VaultFormatError, buildPreamble, decodeFrame, encodeFrame, fileKey, vaultHeader
+
+if TYPE_CHECKING:
+    from .encryption import EncryptionManager
+
+CHUNK_MAGIC: bytes = b'PMCHUNK'
+CHUNK_VERSION: int = 1
+NONCE_SIZE: int = 12
+TAG_SIZE: int = 16
+
+# Buckets are sized so a lookup decrypts about this many entries; the vault is
+# re-bucketed once the average grows past CHUNK_RESIZE_FACTOR times that.
+CHUNK_TARGET_ENTRIES: int = 128
+CHUNK_RESIZE_FACTOR: int = 4
+MIN_BUCKETS: int = 16
+
+# Rewritten chunks are appended, so the file is compacted once dead chunks
+# outweigh both limits.
+CHUNK_MIN_COMPACT_BYTES: int = 1024 * 1024
+CHUNK_COMPACT_RATIO: float = 1.0
+
+GENERATION = struct.Struct('<Q')
+DIRECTORY_ENTRY = struct.Struct('<QII')
+BUCKET_INDEX = struct.Struct('<I')
+
+Passwords = Dict[str, Dict[str, Any]]
+
+
+def isChunkedVault(path: str) -> bool:
+    return path.endswith('.chunks')
+
+
+def bucketCountFor(entries: int) -> int:
+    buckets = MIN_BUCKETS
+    while buckets * CHUNK_TARGET_ENTRIES < entries:
+        buckets *= 2
+    return buckets
+
+
+def bucketHasher(vaultKey: bytes, fileSalt: bytes) -> Callable[[str], int]:
+    # Keyed, so the bucket layout reveals nothing about which websites are stored.
+    key = HKDFExpand(algorithm=hashes.SHA256(), length=32, info=b'vault-bucket' + fileSalt,
+                     backend=default_backend()).derive(vaultKey)
+    # HMAC-SHA256 with the padded key states hashed once up front; the per-call
+    # key setup otherwise dominates when a whole vault is bucketed.
+    inner = hashlib.sha256(bytes(byte ^ 0x36 for byte in key.ljust(64, b'\0')))
+    outer = hashlib.sha256(bytes(byte ^ 0x5c for byte in key.ljust(64, b'\0')))
+
+    def bucketHash(website: str) -> int:
+        innerHash = inner.copy()
+        innerHash.update(website.encode())
+        outerHash = outer.copy()
+        outerHash.update(innerHash.digest())
+        return int.from_bytes(outerHash.digest()[:8], 'little')
+    return bucketHash
+
+
+def directorySlotSize(buckets: int) -> int:
+    return NONCE_SIZE + GENERATION.size + DIRECTORY_ENTRY.size * buckets + TAG_SIZE
+
+
+def directoryAad(preamble: bytes, slot: int) -> bytes:
+    return preamble + b'directory' + bytes([slot])
+
+
+def chunkAad(preamble: bytes, bucket: int) -> bytes:
+    return preamble + BUCKET_INDEX.pack(bucket)
+
+
+def sealRecords(aead: AESGCM, preamble: bytes, bucket: int, records: List[Tuple[str, str, str]]) -> Tuple[bytes, int]:
+    if not records:
+        return b'', 0
+    nonce = os.urandom(NONCE_SIZE)
+    return nonce + aead.encrypt(nonce, encodeFrame(records), chunkAad(preamble, bucket)), len(records)
+
+
+def sealChunk(aead: AESGCM, preamble: bytes, bucket: int, passwords: Passwords) -> Tuple[bytes, int]:
+    records = [(website, email, password) for website, entries in passwords.items() for email, password in entries.items()]
+    return sealRecords(aead, preamble, bucket, records)
+
+
+def groupBuckets(passwords: Passwords, bucketHash: Callable[[str], int], buckets: int) -> List[Passwords]:
+    grouped: List[Passwords] = [{} for _ in range(buckets)]
+    for website, entries in passwords.items():
+        grouped[bucketHash(website) % buckets][website] = entries
+    return grouped
+
+
+def packDirectory(entries: Iterable[Tuple[int, int, int]]) -> bytearray:
+    return bytearray(b''.join(DIRECTORY_ENTRY.pack(*entry) for entry in entries))
+
+
+def directoryTotals(directory: bytes) -> Tuple[int, int]:
+    # Each entry is offset (two words), length and record count as little-endian uint32 words.
+    words = array('I')
+    words.frombytes(directory)
+    if sys.byteorder != 'little':
+        words.byteswap()
+    return sum(words[2::4]), sum(words[3::4])
+
+
+def sealDirectory(aead: AESGCM, preamble: bytes, slot: int, generation: int, directory: bytes) -> bytes:
+    plaintext = GENERATION.pack(generation) + directory
+    nonce = os.urandom(NONCE_SIZE)
+    return nonce + aead.encrypt(nonce, plaintext, directoryAad(preamble, slot))
+
+
+def writeChunks(f: BinaryIO, chunks: Iterable[Tuple[bytes, int]]) -> List[Tuple[int, int, int]]:
+    directory = []
+    offset = f.tell()
+    for chunk, records in chunks:
+        f.write(chunk)
+        directory.append((offset if chunk else 0, len(chunk), records))
+        offset += len(chunk)
+    return directory
+
+
+class ChunkedVault:
+    # Layout: preamble | directory slot A | directory slot B | chunks...
+    # The directory is double-buffered: a write goes to the slot holding the
+    # older generation, so a torn directory write leaves the previous one intact.
+    def __init__(self, path: str, encryptionManager: 'EncryptionManager'):
+        self.path = path
+        self.encryptionManager = encryptionManager
+        self.lock = threading.RLock()
+        self.file = open(path, 'r+b')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.readPreamble()
+            self.readDirectory()
+        except BaseException:
+            self.close()
+            raise
+
+    def readPreamble(self) -> None:
+        prefix = self.map[:len(CHUNK_MAGIC) + 1]
+        if prefix[:len(CHUNK_MAGIC)] != CHUNK_MAGIC:
+            raise VaultFormatError("Not a chunked vault.")
+        if prefix[-1] != CHUNK_VERSION:
+            raise VaultFormatError(f"Unsupported chunked vault version: {prefix[-1]}")
+        offset = len(prefix)
+        try:
+            headerLength = HEADER_LENGTH.unpack_from(self.map, offset)[0]
+            offset += HEADER_LENGTH.size
+            self.header: Dict[str, Any] = json.loads(self.map[offset:offset + headerLength])
+        except (struct.error, ValueError):
+            raise VaultFormatError("Chunked vault header is corrupted.") from None
+        if self.header.get('cipher') != VAULT_CIPHER:
+            raise VaultFormatError(f"Unsupported vault cipher: {self.header.get('cipher')}")
+        self.preamble = self.map[:offset + headerLength]
+        self.buckets: int = self.header['buckets']
+        fileSalt = base64.b64decode(self.header['fileSalt'])
+        self.aead = fileKey(self.encryptionManager.vaultKey, fileSalt)
+        self.bucketHash = bucketHasher(self.encryptionManager.vaultKey, fileSalt)
+        self.slotSize = directorySlotSize(self.buckets)
+        self.slotOffsets = (len(self.preamble), len(self.preamble) + self.slotSize)
+
+    def readDirectory(self) -> None:
+        best: Optional[Tuple[int, int, bytes]] = None
+        for slot, offset in enumerate(self.slotOffsets):
+            sealed = self.map[offset:offset + self.slotSize]
+            try:
+                plaintext = self.aead.decrypt(sealed[:NONCE_SIZE], sealed[NONCE_SIZE:], directoryAad(self.preamble, slot))
+            except InvalidTag:
+                continue
+            generation = GENERATION.unpack_from(plaintext)[0]
+            if best is None or generation > best[0]:
+                best = (generation, slot, plaintext)
+        if best is None:
+            raise VaultFormatError("Chunked vault directory failed authentication; wrong key or corrupted file.")
+        self.generation, self.slot, plaintext = best
+        # Kept packed, so opening and rewriting stay cheap even with many buckets.
+        self.directory = bytearray(plaintext[GENERATION.size:])
+        self.liveBytes, self.entryCount = directoryTotals(self.directory)
+
+    def entry(self, bucket: int) -> Tuple[int, int, int]:
+        return DIRECTORY_ENTRY.unpack_from(self.directory, bucket * DIRECTORY_ENTRY.size)
+
+    def bucketOf(self, website: str) -> int:
+        return self.bucketHash(website) % self.buckets
+
+    def readBucket(self, bucket: int) -> Passwords:
+        passwords: Passwords = {}
+        with self.lock:
+            offset, length, _ = self.entry(bucket)
+            sealed = self.map[offset:offset + length]
+        if not length:
+            return passwords
+        try:
+            plaintext = self.aead.decrypt(sealed[:NONCE_SIZE], sealed[NONCE_SIZE:], chunkAad(self.preamble, bucket))
+        except InvalidTag:
+            raise VaultFormatError(f"Vault chunk {bucket} failed authentication.") from None
+        for website, email, password in decodeFrame(plaintext):
+            entries = passwords.get(website)
+            if entries is None:
+                entries = passwords[website] = {}
+            entries[email] = password
+        return passwords
+
+    def writeBuckets(self, buckets: Dict[int, Passwords]) -> None:
+        directory = bytearray(self.directory)
+        self.file.seek(0, os.SEEK_END)
+        written = writeChunks(self.file, (sealChunk(self.aead, self.preamble, bucket, passwords) for bucket, passwords in buckets.items()))
+        liveBytes, entryCount = self.liveBytes, self.entryCount
+        for bucket, entry in zip(buckets, written):
+            _, oldLength, oldRecords = self.entry(bucket)
+            liveBytes += entry[1] - oldLength
+            entryCount += entry[2] - oldRecords
+            DIRECTORY_ENTRY.pack_into(directory, bucket * DIRECTORY_ENTRY.size, *entry)
+        # Chunks must be durable before the directory points at them.
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        slot = 1 - self.slot
+        self.file.seek(self.slotOffsets[slot])
+        self.file.write(sealDirectory(self.aead, self.preamble, slot, self.generation + 1, directory))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        with self.lock:
+            self.map.close()
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.directory = directory
+            self.liveBytes, self.entryCount = liveBytes, entryCount
+            self.generation += 1
+            self.slot = slot
+
+    def shouldCompact(self) -> bool:
+        dead = len(self.map) - self.slotOffsets[1] - self.slotSize - self.liveBytes
+        return dead > max(CHUNK_MIN_COMPACT_BYTES, self.liveBytes * CHUNK_COMPACT_RATIO)
+
+    def shouldResize(self) -> bool:
+        return self.entryCount > self.buckets * CHUNK_TARGET_ENTRIES * CHUNK_RESIZE_FACTOR
+
+    def compact(self) -> None:
+        # Live chunks are copied still sealed: the preamble is unchanged, so their AAD still holds.
+        with self.lock:
+            with atomicWriter(self.path) as f:
+                f.write(self.preamble)
+                f.write(bytes(2 * self.slotSize))
+                directory = writeChunks(f, ((self.map[offset:offset + length], records)
+                                            for offset, length, records in DIRECTORY_ENTRY.iter_unpack(self.directory)))
+                f.seek(self.slotOffsets[0])
+                f.write(sealDirectory(self.aead, self.preamble, 0, self.generation + 1, packDirectory(directory)))
+                # The old file must be unmapped before it can be replaced on Windows.
+                self.close()
+            self.reopen()
+
+    def reopen(self) -> None:
+        self.close()
+        self.file = open(self.path, 'r+b')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.readPreamble()
+        self.readDirectory()
+
+    def refresh(self) -> Set[int]:
+        # Maps in chunks another instance appended and returns the buckets whose chunk moved.
+        with self.lock:
+            previous = self.directory
+            self.reopen()
+            size = DIRECTORY_ENTRY.size
+            return {index for index in range(self.buckets)
+                    if self.directory[index * size:(index + 1) * size] != previous[index * size:(index + 1) * size]}
+
+    def close(self) -> None:
+        with self.lock:
+            if not self.map.closed:
+                self.map.close()
+        if not self.file.closed:
+            self.file.close()
+
+    @classmethod
+    def create(cls, path: str, encryptionManager: 'EncryptionManager', passwords: Passwords, buckets: Optional[int] = None) -> None:
+        if buckets is None:
+            buckets = bucketCountFor(sum(len(entries) for entries in passwords.values()))
+        fileSalt = os.urandom(FILE_SALT_SIZE)
+        preamble = buildPreamble(CHUNK_MAGIC, CHUNK_VERSION, vaultHeader(encryptionManager, fileSalt, buckets=buckets))
+        grouped = groupBuckets(passwords, bucketHasher(encryptionManager.vaultKey, fileSalt), buckets)
+        aead = fileKey(encryptionManager.vaultKey, fileSalt)
+        with atomicWriter(path) as f:
+            f.write(preamble)
+            f.write(bytes(2 * directorySlotSize(buckets)))
+            directory = writeChunks(f, (sealChunk(aead, preamble, bucket, bucketPasswords) for bucket, bucketPasswords in enumerate(grouped)))
+            f.seek(len(preamble))
+            f.write(sealDirectory(aead, preamble, 0, 0, packDirectory(directory)))
+
+
+class ChunkedPasswords(MutableMapping):
+    # Presents a chunked vault as the usual website -> {email: password} dict,
+    # decrypting a bucket the first time one of its websites is touched.
+    def __init__(self, vault: ChunkedVault, onLoad: Optional[Callable[[Passwords], None]] = None):
+        self.vault = vault
+        self.onLoad = onLoad
+        self.buckets: Dict[int, Passwords] = {}
+        self.lock = threading.RLock()
+
+    def bucket(self, index: int) -> Passwords:
+        with self.lock:
+            passwords = self.buckets.get(index)
+            if passwords is None:
+                passwords = self.vault.readBucket(index)
+                if self.onLoad:
+                    self.onLoad(passwords)
+                self.buckets[index] = passwords
+            return passwords
+
+    def bucketFor(self, website: str) -> Passwords:
+        # Under the lock, so a concurrent rewrite cannot pair a new bucket count with old buckets.
+        with self.lock:
+            return self.bucket(self.vault.bucketOf(website))
+
+    def loadAll(self) -> None:
+        with self.lock:
+            for index in range(self.vault.buckets):
+                self.bucket(index)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.buckets.clear()
+
+    def regroup(self, passwords: Optional[Passwords] = None) -> None:
+        # After a full rewrite every bucket is known, possibly under a new bucket count.
+        with self.lock:
+            if passwords is None:
+                passwords = {website: entries for bucket in self.buckets.values() for website, entries in bucket.items()}
+            buckets: Dict[int, Passwords] = {index: {} for index in range(self.vault.buckets)}
+            for website, entries in passwords.items():
+                buckets[self.vault.bucketOf(website)][website] = entries
+            self.buckets = buckets
+
+    def rewrite(self, plaintext: Passwords) -> None:
+        with self.lock:
+            self.loadAll()
+            self.vault.close()
+            ChunkedVault.create(self.vault.path, self.vault.encryptionManager, plaintext)
+            self.vault.reopen()
+            self.regroup()
+
+    def __getitem__(self, website: str) -> Dict[str, Any]:
+        return self.bucketFor(website)[website]
+
+    def __setitem__(self, website: str, entries: Dict[str, Any]) -> None:
+        self.bucketFor(website)[website] = entries
+
+    def __delitem__(self, website: str) -> None:
+        del self.bucketFor(website)[website]
+
+    def __contains__(self, website: object) -> bool:
+        return isinstance(website, str) and website in self.bucketFor(website)
+
+    def __iter__(self) -> Iterator[str]:
+        with self.lock:
+            self.loadAll()
+            websites = [website for bucket in self.buckets.values() for website in bucket]
+        return iter(websites)
+
+    def items(self) -> List[Tuple[str, Dict[str, Any]]]:
+        # Straight from the loaded buckets, so snapshots skip a keyed hash per website.
+        with self.lock:
+            self.loadAll()
+            return [item for bucket in self.buckets.values() for item in bucket.items()]
+
+    def __len__(self) -> int:
+        with self.lock:
+            self.loadAll()
+            return sum(len(bucket) for bucket in self.buckets.values())
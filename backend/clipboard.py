@@ -0,0 +1,181 @@
+import hmac
+import os
+import threading
+import time
+from typing import Any, Optional, Tuple
+from .instrumentation import instrumented
+
+# A copied password is wiped after this long, unless something else has been copied since.
+CLIPBOARD_CLEAR_SECONDS: float = 30.0
+
+
+class ClipboardError(Exception):
+    pass
+
+
+class ClipboardBase:
+    # Only a keyed hash of the copied secret is kept, to recognise it when the timer fires.
+    def __init__(self, clearAfter: Optional[float]):
+        self.clearAfter = clearAfter
+        self.key = os.urandom(32)
+        self.digest: Optional[bytes] = None
+
+    def fingerprint(self, text: str) -> bytes:
+        return hmac.digest(self.key, text.encode(), 'sha256')
+
+    def stillHolds(self, contents: Optional[str]) -> bool:
+        digest, self.digest = self.digest, None
+        return digest is not None and contents is not None and hmac.compare_digest(self.fingerprint(contents), digest)
+
+
+class TkClipboard(ClipboardBase):
+    # Tk serves the clipboard from this process, so a copy is an in-memory update
+    # on the UI thread with no helper process to start or wait for.
+    def __init__(self, root: Any, clearAfter: Optional[float] = CLIPBOARD_CLEAR_SECONDS):
+        super().__init__(clearAfter)
+        self.root = root
+        self.clearJob: Optional[str] = None
+
+    @instrumented('clipboard.copy')
+    def copy(self, text: str) -> None:
+        self.root.clipboard_clear()
+        self.root.clipboard_append(text)
+        self.digest = self.fingerprint(text)
+        if self.clearJob:
+            self.root.after_cancel(self.clearJob)
+            self.clearJob = None
+        if self.clearAfter:
+            self.clearJob = self.root.after(int(self.clearAfter * 1000), self.clear)
+
+    def contents(self) -> Optional[str]:
+        if self.root.tk.call('tk', 'windowingsystem') == 'x11' and not self.root.selection_own_get(selection='CLIPBOARD'):
+            # Another application owns it now, and asking a stalled owner could hang the UI.
+            return None
+        try:
+            return self.root.clipboard_get()
+        except Exception:
+            # Empty, or holding something that is not text.
+            return None
+
+    def clear(self) -> None:
+        self.clearJob = None
+        if self.digest is not None and self.stillHolds(self.contents()):
+            self.root.clipboard_clear()
+
+    def close(self) -> None:
+        if self.clearJob:
+            self.root.after_cancel(self.clearJob)
+        self.clear()
+
+
+class HelperClipboard(ClipboardBase):
+    # Without a window, one long-lived thread talks to the system clipboard, so a
+    # copy returns at once instead of waiting for the xclip/xsel run pyperclip starts.
+    def __init__(self, clearAfter: Optional[float] = CLIPBOARD_CLEAR_SECONDS):
+        super().__init__(clearAfter)
+        self.condition = threading.Condition()
+        self.pending: Optional[str] = None
+        self.clearAt: Optional[float] = None
+        self.requested = 0
+        self.completed = 0
+        self.error: Optional[BaseException] = None
+        self.stopping = False
+        self.thread = threading.Thread(target=self.run, name='clipboard', daemon=True)
+        self.thread.start()
+
+    @instrumented('clipboard.copy')
+    def copy(self, text: str) -> None:
+        with self.condition:
+            # A newer copy replaces one the helper has not made yet.
+            self.pending = text
+            self.requested += 1
+            self.condition.notify_all()
+
+    def clear(self) -> None:
+        with self.condition:
+            if self.clearAt is not None:
+                self.clearAt = time.monotonic()
+                self.condition.notify_all()
+
+    def nextTask(self) -> Tuple[str, Optional[str]]:
+        # Called with the condition held. A due clear runs before a stop, so closing still wipes the secret.
+        while self.pending is None:
+            if self.clearAt is not None and self.clearAt <= time.monotonic():
+                self.clearAt = None
+                return 'clear', None
+            if self.stopping:
+                return 'stop', None
+            self.condition.wait(None if self.clearAt is None else self.clearAt - time.monotonic())
+        text, self.pending = self.pending, None
+        return 'copy', text
+
+    def run(self) -> None:
+        # pyperclip probes for clipboard tools on import, so it loads here, off the caller's thread.
+        try:
+            import pyperclip
+            importError = None
+        except ImportError as e:
+            pyperclip = None
+            importError = e
+        while True:
+            with self.condition:
+                task, text = self.nextTask()
+                target = self.requested
+            if task == 'stop':
+                return
+            try:
+                if pyperclip is None:
+                    raise ClipboardError("No clipboard is available: pyperclip is not installed.") from importError
+                if task == 'copy':
+                    self.write(pyperclip, text)
+                elif self.stillHolds(pyperclip.paste()):
+                    pyperclip.copy('')
+                error = None
+            except Exception as e:
+                error = e
+            with self.condition:
+                if task == 'copy':
+                    self.completed = target
+                self.error = error
+                self.condition.notify_all()
+
+    @instrumented('clipboard.helperWrite')
+    def write(self, pyperclip: Any, text: str) -> None:
+        pyperclip.copy(text)
+        self.digest = self.fingerprint(text)
+        with self.condition:
+            self.clearAt = time.monotonic() + self.clearAfter if self.clearAfter else None
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        # Waits until the latest copy has reached the system clipboard.
+        with self.condition:
+            target = self.requested
+            if not self.condition.wait_for(lambda: self.completed >= target, timeout):
+                return False
+            if self.error:
+                raise ClipboardError("Copying to the clipboard failed.") from self.error
+            return True
+
+    def close(self, timeout: Optional[float] = 1.0) -> None:
+        self.clear()
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        self.thread.join(timeout)
+
+
+service: Optional[ClipboardBase] = None
+
+
+def attachClipboard(root: Any, clearAfter: Optional[float] = CLIPBOARD_CLEAR_SECONDS) -> TkClipboard:
+    # Once a window exists, copies go through Tk instead of the helper thread.
+    global service
+    service = TkClipboard(root, clearAfter)
+    return service
+
+
+def clipboard() -> ClipboardBase:
+    global service
+    if service is None:
+        service = HelperClipboard()
+    return service
@@ -0,0 +1,129 @@
+import os
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional
+
+PUBLIC_SUFFIX_PATH: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'resources', 'public_suffix_list.dat')
+DOMAIN_CACHE_SIZE: int = 65536
+
+# Used only if the bundled list is missing, so normalization degrades to the old behaviour.
+FALLBACK_SUFFIXES: List[str] = ['co.in', 'com.au', 'co.uk', 'org.uk', 'com.br', 'com.cn', 'co.jp', 'co.nz', 'co.za', 'com.sg', 'net.in', 'firm.in', 'gen.in', 'ind.in', 'net.au', 'org.au', 'org.cn', 'edu.in', 'res.in']
+
+TERMINAL: str = ''
+WILDCARD: str = '*'
+EXCEPTION: str = '!'
+
+Trie = Dict[str, Any]
+
+
+def addRule(trie: Trie, rule: str) -> None:
+    labels = rule.split('.')
+    node = trie
+    for label in reversed(labels[1:]):
+        node = node.setdefault(label, {})
+    if labels[0].startswith(EXCEPTION):
+        node[labels[0]] = {TERMINAL: True}
+    else:
+        node.setdefault(labels[0], {})[TERMINAL] = True
+
+
+def compileSuffixTrie(rules: Iterable[str]) -> Trie:
+    trie: Trie = {}
+    for rule in rules:
+        addRule(trie, rule)
+        if not rule.isascii():
+            # Hosts usually arrive punycoded, so index the ASCII form too.
+            try:
+                addRule(trie, rule.encode('idna').decode('ascii'))
+            except UnicodeError:
+                pass
+    return trie
+
+
+def readSuffixRules(path: str, includePrivate: bool = False) -> List[str]:
+    rules = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line == '// ===BEGIN PRIVATE DOMAINS===' and not includePrivate:
+                break
+            if line and not line.startswith('//'):
+                rules.append(line.split()[0].lower())
+    return rules
+
+
+@lru_cache(maxsize=None)
+def suffixTrie(path: str = PUBLIC_SUFFIX_PATH) -> Trie:
+    # ICANN rules only. The private section (github.io, blogspot.com, ...) would file
+    # "foo.github.io" apart from the "github.io" entries vaults already hold.
+    try:
+        return compileSuffixTrie(readSuffixRules(path))
+    except FileNotFoundError:
+        return compileSuffixTrie(FALLBACK_SUFFIXES)
+
+
+def publicSuffixLength(labels: List[str], trie: Trie) -> int:
+    # Unlisted TLDs fall under the implicit "*" rule: the last label is the suffix.
+    length = 1
+    node = trie
+    for depth, label in enumerate(reversed(labels)):
+        if EXCEPTION + label in node:
+            return depth
+        if WILDCARD in node:
+            length = depth + 1
+        # An empty label (from "" or "a..b") would otherwise match the terminal marker.
+        child = node.get(label) if label else None
+        if child is None:
+            break
+        if TERMINAL in child:
+            length = depth + 1
+        node = child
+    return length
+
+
+def extractHost(url: str) -> str:
+    schemeEnd = url.find('://')
+    if schemeEnd != -1:
+        url = url[schemeEnd + 3:]
+    for separator in '/?#':
+        end = url.find(separator)
+        if end != -1:
+            url = url[:end]
+    url = url[url.rfind('@') + 1:]
+    if url.startswith('['):
+        return url[1:url.find(']')] if ']' in url else url[1:]
+    return url.split(':')[0]
+
+
+def registrableDomain(host: str, trie: Optional[Trie] = None) -> str:
+    host = host.strip().lower().rstrip('.')
+    if not host or host.replace('.', '').isdigit() or ':' in host:
+        # Empty hosts and IP addresses have no public suffix.
+        return host
+    labels = host.split('.')
+    suffixLength = publicSuffixLength(labels, suffixTrie() if trie is None else trie)
+    return '.'.join(labels[-(suffixLength + 1):])
+
+
+def normalizeUrl(url: str, trie: Optional[Trie] = None) -> str:
+    host = extractHost(url.strip())
+    if '.' not in host and ':' not in host:
+        host += '.com'
+    return registrableDomain(host, trie)
+
+
+@lru_cache(maxsize=DOMAIN_CACHE_SIZE)
+def normalizeCached(url: str) -> str:
+    return normalizeUrl(url)
+
+
+def normalizeMany(urls: Iterable[str]) -> List[str]:
+    # Bulk callers get their own memo so they neither pay for nor evict the interactive LRU.
+    trie = suffixTrie()
+    memo: Dict[str, str] = {}
+    results = []
+    for url in urls:
+        domain = memo.get(url)
+        if domain is None:
+            domain = memo[url] = normalizeUrl(url, trie)
+        results.append(domain)
+    return results
@@ -1,15 +1,34 @@
 import base64
+import hmac
+import json
 import os
+import time
+from typing import Any, Dict, Optional, Tuple
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDFExpand
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
 from cryptography.fernet import Fernet
+from .instrumentation import instrumented
+from .persistence import writeAtomically
+
+HEADER_VERSION: int = 2
+DEFAULT_KDF_PARAMS: Dict[str, Any] = {'name': 'pbkdf2', 'iterations': 100000}
+REKEY_DIR_NAME: str = 'rekey'
+REKEY_STATE_NAME: str = 'state.json'
+
+# Calibration bounds, so a fast or slow machine never lands on unusable parameters.
+MIN_PBKDF2_ITERATIONS: int = 100000
+MIN_SCRYPT_N: int = 2 ** 14
+MAX_SCRYPT_N: int = 2 ** 20
 
 
 def generateSalt() -> bytes:
     return os.urandom(16)
 
 
+@instrumented('hashMasterPassword')
 def hashMasterPassword(password: str, salt: bytes) -> bytes:
     kdf = PBKDF2HMAC(
         algorithm=hashes.SHA256(),
@@ -21,6 +40,7 @@ def hashMasterPassword(password: str, salt: bytes) -> bytes:
     return base64.urlsafe_b64encode(kdf.derive(password.encode()))
 
 
+@instrumented('getFernetKey')
 def getFernetKey(password: str, salt: bytes) -> Fernet:
     kdf = PBKDF2HMAC(
         algorithm=hashes.SHA256(),
@@ -32,13 +52,95 @@ def getFernetKey(password: str, salt: bytes) -> Fernet:
     return Fernet(base64.urlsafe_b64encode(kdf.derive(password.encode())))
 
 
+@instrumented('deriveKeyMaterial')
+def deriveKeyMaterial(secret: str, salt: bytes, kdfParams: Dict[str, Any]) -> bytes:
+    name = kdfParams['name']
+    if name == 'pbkdf2':
+        kdf = PBKDF2HMAC(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=salt,
+            iterations=kdfParams['iterations'],
+            backend=default_backend()
+        )
+    elif name == 'scrypt':
+        kdf = Scrypt(
+            salt=salt,
+            length=32,
+            n=kdfParams['n'],
+            r=kdfParams['r'],
+            p=kdfParams['p'],
+            backend=default_backend()
+        )
+    else:
+        raise ValueError(f"Unsupported KDF: {name}")
+    return kdf.derive(secret.encode())
+
+
+def splitKeyMaterial(material: bytes) -> Tuple[bytes, bytes]:
+    verifier = HKDFExpand(algorithm=hashes.SHA256(), length=32, info=b'verifier',
+                          backend=default_backend()).derive(material)
+    encryptionKey = HKDFExpand(algorithm=hashes.SHA256(), length=32, info=b'encryption',
+                               backend=default_backend()).derive(material)
+    return verifier, base64.urlsafe_b64encode(encryptionKey)
+
+
+def deriveVaultKey(encryptionKey: bytes) -> bytes:
+    # The binary vault's AEAD key is bound to the same unlock as the Fernet key.
+    return HKDFExpand(algorithm=hashes.SHA256(), length=32, info=b'binary-vault',
+                      backend=default_backend()).derive(base64.urlsafe_b64decode(encryptionKey))
+
+
+def timeKdf(kdfParams: Dict[str, Any]) -> float:
+    start = time.perf_counter()
+    deriveKeyMaterial('calibration', generateSalt(), kdfParams)
+    return time.perf_counter() - start
+
+
+def calibrateKdf(targetSeconds: float, name: str = 'scrypt') -> Dict[str, Any]:
+    if name == 'pbkdf2':
+        probe = {'name': 'pbkdf2', 'iterations': MIN_PBKDF2_ITERATIONS}
+        elapsed = timeKdf(probe)
+        iterations = int(MIN_PBKDF2_ITERATIONS * targetSeconds / elapsed)
+        return {'name': 'pbkdf2', 'iterations': max(MIN_PBKDF2_ITERATIONS, iterations // 1000 * 1000)}
+    if name == 'scrypt':
+        # scrypt cost is linear in n, so keep doubling while the next step still fits the budget.
+        params = {'name': 'scrypt', 'n': MIN_SCRYPT_N, 'r': 8, 'p': 1}
+        elapsed = timeKdf(params)
+        while params['n'] < MAX_SCRYPT_N and elapsed * 2 <= targetSeconds:
+            params['n'] *= 2
+            elapsed = timeKdf(params)
+        return params
+    raise ValueError(f"Unsupported KDF: {name}")
+
+
+def rekeyDirectory(hashPasswordPath: str) -> str:
+    # Next to the master hash, so every copy of the vault keeps its own rekey state.
+    return os.path.join(os.path.dirname(hashPasswordPath), REKEY_DIR_NAME)
+
+
 class EncryptionManager:
-    def __init__(self, username: str, password: str, saltPath: str = 'resources/hashSalt', hashPasswordPath: str = 'data/masterHash'):
+    def __init__(self, username: str, password: str, saltPath: str = 'resources/hashSalt', hashPasswordPath: str = 'data/masterHash', kdfParams: Optional[Dict[str, Any]] = None):
         self.username = username
         self.password = password
+        rekeyDir = rekeyDirectory(hashPasswordPath)
+        if os.path.exists(os.path.join(rekeyDir, REKEY_STATE_NAME)):
+            # A rekey that died halfway through its swap is finished before the old salt is read.
+            from .rekey import finishPendingRekey
+            finishPendingRekey(rekeyDir, saltPath, hashPasswordPath)
+        self.saltPath = saltPath
         self.salt = self.loadOrCreateSalt(saltPath)
         self.hashPasswordPath = hashPasswordPath
-        self.fernet = getFernetKey(password, self.salt)
+        self.header = self.loadHeader()
+        if self.header is not None and self.header['version'] == 1:
+            # Vaults created before the header keep their key until they are re-keyed.
+            self.kdfParams = dict(DEFAULT_KDF_PARAMS)
+            self.verifier = None
+            # Same derivation as getFernetKey, kept as raw key bytes for the vault key.
+            self.setEncryptionKey(hashMasterPassword(password, self.salt))
+        else:
+            self.kdfParams = self.header['kdf'] if self.header else dict(kdfParams or DEFAULT_KDF_PARAMS)
+            self.deriveKeys(self.kdfParams)
 
     def returnUsername(self):
         return self.username
@@ -53,29 +155,67 @@ class EncryptionManager:
                 f.write(salt)
             return salt
 
-    def saveHashedPassword(self):
-        if not os.path.exists(self.hashPasswordPath) or os.path.getsize(self.hashPasswordPath) == 0:
-            hashedPassword = hashMasterPassword(self.username+self.password, self.salt)
-            with open(self.hashPasswordPath, 'wb') as f:
-                f.write(hashedPassword)
-
-    def loadHashedPassword(self) -> bytes:
+    def loadHeader(self) -> Optional[Dict[str, Any]]:
         try:
             with open(self.hashPasswordPath, 'rb') as f:
-                return f.read()
+                content = f.read()
         except FileNotFoundError:
+            return None
+        if not content:
+            return None
+        if not content.startswith(b'{'):
+            return {'version': 1, 'verifier': content}
+        header = json.loads(content)
+        header['verifier'] = base64.urlsafe_b64decode(header['verifier'])
+        return header
+
+    def deriveKeys(self, kdfParams: Dict[str, Any]) -> None:
+        material = deriveKeyMaterial(self.username+self.password, self.salt, kdfParams)
+        self.verifier, encryptionKey = splitKeyMaterial(material)
+        self.kdfParams = kdfParams
+        self.setEncryptionKey(encryptionKey)
+
+    def setEncryptionKey(self, encryptionKey: bytes) -> None:
+        self.fernet = Fernet(encryptionKey)
+        self.vaultKey = deriveVaultKey(encryptionKey)
+
+    def saveHeader(self) -> None:
+        header = {
+            'version': HEADER_VERSION,
+            'kdf': self.kdfParams,
+            'verifier': base64.urlsafe_b64encode(self.verifier).decode()
+        }
+        writeAtomically(self.hashPasswordPath, json.dumps(header).encode())
+        self.header = dict(header, verifier=self.verifier)
+
+    def saveHashedPassword(self):
+        if self.header is None:
+            self.saveHeader()
+
+    def loadHashedPassword(self) -> bytes:
+        if self.header is None:
             raise ValueError("Hashed password file not found.")
+        return self.header['verifier']
 
     def verifyUsername(self, enteredUsername: str) -> bool:
         return self.username == enteredUsername
 
     def verifyPassword(self, enteredUsername: str, enteredPassword: str) -> bool:
         storedHash = self.loadHashedPassword()
-        newHash = hashMasterPassword(enteredUsername+enteredPassword, self.salt)
-        return newHash == storedHash
-
+        if self.header['version'] == 1:
+            newHash = hashMasterPassword(enteredUsername+enteredPassword, self.salt)
+        elif enteredUsername == self.username and enteredPassword == self.password:
+            # The unlock already derived the verifier for these credentials.
+            newHash = self.verifier
+        else:
+            material = deriveKeyMaterial(enteredUsername+enteredPassword, self.salt, self.kdfParams)
+            newHash = splitKeyMaterial(material)[0]
+        return hmac.compare_digest(newHash, storedHash)
+
+    @instrumented('EncryptionManager.encrypt')
     def encrypt(self, data: str) -> bytes:
         return self.fernet.encrypt(data.encode())
 
+    @instrumented('EncryptionManager.decrypt')
     def decrypt(self, token: bytes) -> str:
         return self.fernet.decrypt(token).decode()
@@ -0,0 +1,355 @@
+import csv
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+from .domains import normalizeMany
+from .passwordHealth import meetsPolicy
+from .utilities import validateEmail
+
+if TYPE_CHECKING:
+    from .passwordManager import PasswordStore
+
+# Rows handed to a worker at a time, and rows committed to the vault at a time.
+# At most two chunks per worker are in flight, so memory does not grow with the file.
+IMPORT_CHUNK_ROWS: int = 2000
+IMPORT_BATCH_ROWS: int = 2000
+# A vault without a journal or chunks is rewritten whole on every commit, so there
+# batches also grow to this share of the vault, keeping the import linear overall.
+SNAPSHOT_BATCH_RATIO: float = 0.5
+JSON_READ_SIZE: int = 64 * 1024
+PROGRESS_INTERVAL: float = 0.5
+# Column names used by the Chrome, Firefox, Bitwarden and 1Password exports, and by
+# plain website,email,password files, in order of preference.
+URL_FIELDS: Tuple[str, ...] = ('url', 'login_uri', 'website', 'uri', 'origin', 'hostname', 'name', 'title')
+EMAIL_FIELDS: Tuple[str, ...] = ('username', 'login_username', 'email', 'login', 'user')
+PASSWORD_FIELDS: Tuple[str, ...] = ('password', 'login_password')
+# Array keys that hold the entries when a JSON export is an object (Bitwarden uses "items").
+JSON_ENTRY_KEYS: Tuple[str, ...] = ('items', 'entries', 'logins', 'passwords')
+CONFLICT_POLICIES: Tuple[str, ...] = ('skip', 'overwrite')
+
+# Source record number (CSV line or JSON entry), URL, username, password.
+RawRow = Tuple[int, str, str, str]
+# The same, plus the normalised website and the reason the row is rejected, if it is.
+PreparedRow = Tuple[int, str, str, str, str, Optional[str]]
+
+
+class ImportFormatError(Exception):
+    pass
+
+
+def detectFormat(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.json', '.jsonl', '.ndjson'):
+        return 'json'
+    if extension == '.csv':
+        return 'csv'
+    with open(path, encoding='utf-8-sig') as f:
+        return 'json' if f.read(JSON_READ_SIZE).lstrip()[:1] in ('[', '{') else 'csv'
+
+
+def pickField(record: Dict[str, Any], names: Iterable[str]) -> str:
+    for name in names:
+        value = record.get(name)
+        if value:
+            return str(value)
+    return ''
+
+
+def readCsv(path: str) -> Iterator[RawRow]:
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        header = [column.strip().lower() for column in next(reader, [])]
+
+        def column(names: Tuple[str, ...]) -> Optional[int]:
+            return next((header.index(name) for name in names if name in header), None)
+        urlColumn, emailColumn, passwordColumn = column(URL_FIELDS), column(EMAIL_FIELDS), column(PASSWORD_FIELDS)
+        if passwordColumn is None:
+            raise ImportFormatError(f"{path} has no password column.")
+        for row in reader:
+            def value(index: Optional[int]) -> str:
+                return row[index] if index is not None and index < len(row) else ''
+            yield reader.line_num, value(urlColumn), value(emailColumn), value(passwordColumn)
+
+
+def jsonFields(record: Any) -> Tuple[str, str, str]:
+    if not isinstance(record, dict):
+        return '', '', ''
+    record = {str(key).lower(): value for key, value in record.items()}
+    login = record.get('login')
+    if isinstance(login, dict):
+        # Bitwarden: {"name": ..., "login": {"uris": [{"uri": ...}], "username": ..., "password": ...}}
+        uris = login.get('uris') or []
+        url = (uris[0].get('uri') if uris and isinstance(uris[0], dict) else '') or record.get('name') or ''
+        return str(url), str(login.get('username') or ''), str(login.get('password') or '')
+    return pickField(record, URL_FIELDS), pickField(record, EMAIL_FIELDS), pickField(record, PASSWORD_FIELDS)
+
+
+class JsonStream:
+    # Decodes JSON values off a text stream one at a time, keeping only the
+    # undecoded tail of the file in memory.
+    def __init__(self, f: TextIO):
+        self.f = f
+        self.buffer = ''
+        self.position = 0
+        self.exhausted = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self) -> bool:
+        chunk = self.f.read(JSON_READ_SIZE)
+        if not chunk:
+            self.exhausted = True
+            return False
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in ' \t\r\n':
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.fill():
+                return ''
+
+    def expect(self, characters: str) -> str:
+        character = self.peek()
+        if not character or character not in characters:
+            raise ImportFormatError(f"Malformed JSON: expected one of {characters!r}, found {character!r}.")
+        self.position += 1
+        return character
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError as e:
+                if self.fill():
+                    continue
+                raise ImportFormatError(f"Malformed JSON: {e}") from None
+            # A number running into the end of the buffer may continue in the next read.
+            if end == len(self.buffer) and not self.exhausted and self.fill():
+                continue
+            self.position = end
+            return value
+
+    def array(self) -> Iterator[Any]:
+        self.expect('[')
+        if self.peek() == ']':
+            self.position += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(',]') == ']':
+                return
+
+
+def readJsonRecords(f: TextIO) -> Iterator[Any]:
+    # A top-level array of entries, JSON Lines, or an export object with its entries
+    # under one of JSON_ENTRY_KEYS. Only the entry array is streamed; other values are small.
+    stream = JsonStream(f)
+    if stream.peek() == '[':
+        yield from stream.array()
+    else:
+        while stream.peek() == '{':
+            stream.expect('{')
+            head: Dict[str, Any] = {}
+            streamed = False
+            if stream.peek() != '}':
+                while True:
+                    key = stream.value()
+                    stream.expect(':')
+                    if str(key).lower() in JSON_ENTRY_KEYS and stream.peek() == '[':
+                        yield from stream.array()
+                        streamed = True
+                    else:
+                        head[key] = stream.value()
+                    if stream.expect(',}') == '}':
+                        break
+            else:
+                stream.expect('}')
+            if not streamed:
+                # Not an export wrapper, so this object was itself an entry (JSON Lines).
+                yield head
+    if stream.peek():
+        raise ImportFormatError(f"Malformed JSON: unexpected {stream.peek()!r}.")
+
+
+def readJson(path: str) -> Iterator[RawRow]:
+    with open(path, encoding='utf-8-sig') as f:
+        for number, record in enumerate(readJsonRecords(f), 1):
+            yield (number, *jsonFields(record))
+
+
+def readRows(path: str, fileFormat: Optional[str] = None) -> Iterator[RawRow]:
+    fileFormat = fileFormat or detectFormat(path)
+    if fileFormat == 'csv':
+        return readCsv(path)
+    if fileFormat == 'json':
+        return readJson(path)
+    raise ImportFormatError(f"Unsupported import format: {fileFormat}")
+
+
+def chunked(rows: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def prepareChunk(rows: List[RawRow], allowWeak: bool = False) -> List[PreparedRow]:
+    # The CPU-bound stage: URL normalisation and validation. Top-level so a worker process can run it.
+    websites = normalizeMany(url for _, url, _, _ in rows)
+    prepared = []
+    for (record, url, email, password), website in zip(rows, websites):
+        email = email.strip()
+        if not password:
+            reason = "missing password"
+        elif not url.strip() or website.startswith('.') or any(character.isspace() for character in website):
+            reason = "missing or invalid URL"
+        elif not validateEmail(email):
+            reason = "email does not meet validation criteria"
+        elif not allowWeak and not meetsPolicy(password):
+            reason = "password does not meet criteria"
+        else:
+            reason = None
+        prepared.append((record, url, email, password, website, reason))
+    return prepared
+
+
+def prepareRows(rows: Iterable[RawRow], workers: int, allowWeak: bool) -> Iterator[PreparedRow]:
+    if workers <= 1:
+        for chunk in chunked(rows, IMPORT_CHUNK_ROWS):
+            yield from prepareChunk(chunk, allowWeak)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        # Results come back in file order; submitting stops once two chunks per worker are pending.
+        inFlight: Deque[Future] = deque()
+        for chunk in chunked(rows, IMPORT_CHUNK_ROWS):
+            inFlight.append(pool.submit(prepareChunk, chunk, allowWeak))
+            if len(inFlight) >= 2 * workers:
+                yield from inFlight.popleft().result()
+        while inFlight:
+            yield from inFlight.popleft().result()
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.added = 0
+        self.updated = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    def rowsPerSecond(self) -> float:
+        return self.rows / max(self.seconds, 1e-9)
+
+    def summary(self) -> str:
+        return (f"{self.rows:,} rows in {self.seconds:.1f} s ({self.rowsPerSecond():,.0f} rows/s): {self.added:,} added, "
+                f"{self.updated:,} updated, {self.duplicates:,} already saved, {self.rejected:,} rejected.")
+
+
+class BulkImport:
+    def __init__(
+        self,
+        passwordStore: 'PasswordStore',
+        onConflict: str = 'skip',
+        workers: int = 1,
+        allowWeak: bool = False,
+        batchSize: int = IMPORT_BATCH_ROWS,
+        rejects: Optional[TextIO] = None,
+        onProgress: Optional[Callable[[ImportReport], None]] = None
+    ):
+        if onConflict not in CONFLICT_POLICIES:
+            raise ValueError(f"Unknown conflict policy: {onConflict}")
+        self.passwordStore = passwordStore
+        self.onConflict = onConflict
+        self.workers = workers
+        self.allowWeak = allowWeak
+        self.batchSize = batchSize
+        # Rejected rows are listed without their passwords; the record number points back into the export.
+        self.rejectWriter = csv.writer(rejects) if rejects else None
+        if self.rejectWriter:
+            self.rejectWriter.writerow(['record', 'url', 'username', 'reason'])
+        self.onProgress = onProgress
+        self.report = ImportReport()
+        self.lastProgress = 0.0
+
+    def reject(self, record: int, url: str, email: str, reason: str) -> None:
+        self.report.rejected += 1
+        if self.rejectWriter:
+            self.rejectWriter.writerow([record, url, email, reason])
+
+    def resolve(self, prepared: Iterable[PreparedRow]) -> Iterator[Tuple[str, str, str, bool]]:
+        # Rows are checked against the vault as it stands, including rows applied
+        # earlier in this import, so repeats within the file are caught as well.
+        store = self.passwordStore
+        for record, url, email, password, website, reason in prepared:
+            self.report.rows += 1
+            self.progress()
+            if reason is None:
+                existing = store.unsealed(store.passwords.get(website, {}).get(email))
+                if existing == password:
+                    self.report.duplicates += 1
+                    continue
+                if existing is not None and self.onConflict == 'skip':
+                    reason = "a different password is already saved"
+            if reason:
+                self.reject(record, url, email, reason)
+                continue
+            yield website, email, password, existing is not None
+
+    def progress(self, force: bool = False) -> None:
+        now = time.perf_counter()
+        self.report.seconds = now - self.report.started
+        if self.onProgress and (force or now - self.lastProgress >= PROGRESS_INTERVAL):
+            self.lastProgress = now
+            self.onProgress(self.report)
+
+    def run(self, rows: Iterable[RawRow]) -> ImportReport:
+        store = self.passwordStore
+        resolved = self.resolve(prepareRows(rows, self.workers, self.allowWeak))
+        rewritesWhole = not (store.storage.paged or store.journal)
+        entries = sum(len(accounts) for accounts in store.passwords.values()) if rewritesWhole else 0
+        while True:
+            count = 0
+            batchSize = self.batchSize
+            if rewritesWhole:
+                batchSize = max(batchSize, int((entries + self.report.added) * SNAPSHOT_BATCH_RATIO))
+            with store.batch():
+                for website, email, password, replacing in islice(resolved, batchSize):
+                    store.addPassword(website, email, password)
+                    count += 1
+                    if replacing:
+                        self.report.updated += 1
+                    else:
+                        self.report.added += 1
+            if count < batchSize:
+                break
+        store.flush()
+        self.progress(force=True)
+        return self.report
+
+
+def importFile(
+    passwordStore: 'PasswordStore',
+    path: str,
+    fileFormat: Optional[str] = None,
+    rejectPath: Optional[str] = None,
+    **options
+) -> ImportReport:
+    rejects = open(rejectPath, 'w', newline='', encoding='utf-8') if rejectPath else None
+    try:
+        return BulkImport(passwordStore, rejects=rejects, **options).run(readRows(path, fileFormat))
+    finally:
+        if rejects:
+            rejects.close()
@@ -0,0 +1,157 @@
+import atexit
+import json
+import math
+import os
+import threading
+import time
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+# Set to an output prefix to record timings: PREFIX.metrics.json and PREFIX.trace.json
+# are written when the process exits. `python cli.py --trace PREFIX ...` does the same.
+TRACE_ENV: str = 'PASSWORD_MANAGER_TRACE'
+# Latency buckets are spaced 2^(1/8) apart, so percentiles are within about 9%.
+BUCKETS_PER_OCTAVE: int = 8
+# Past this many spans the trace keeps counting but stops storing events.
+MAX_TRACE_EVENTS: int = 200_000
+
+Function = TypeVar('Function', bound=Callable[..., Any])
+
+
+class Histogram:
+    __slots__ = ('count', 'total', 'minimum', 'maximum', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.minimum = 0
+        self.maximum = 0
+        self.buckets: Dict[int, int] = {}
+
+    def record(self, nanoseconds: int) -> None:
+        if not self.count or nanoseconds < self.minimum:
+            self.minimum = nanoseconds
+        self.maximum = max(self.maximum, nanoseconds)
+        self.count += 1
+        self.total += nanoseconds
+        bucket = int(math.log2(nanoseconds) * BUCKETS_PER_OCTAVE) if nanoseconds > 1 else 0
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, fraction: float) -> int:
+        # Upper edge of the bucket holding the requested rank, capped by the largest sample.
+        rank = max(1, math.ceil(fraction * self.count))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.maximum, math.ceil(2 ** ((bucket + 1) / BUCKETS_PER_OCTAVE)))
+        return self.maximum
+
+    def toDict(self) -> Dict[str, Any]:
+        milliseconds = 1e-6
+        return {
+            'count': self.count,
+            'totalMs': self.total * milliseconds,
+            'meanMs': self.total / self.count * milliseconds if self.count else 0.0,
+            'minMs': self.minimum * milliseconds,
+            'p50Ms': self.percentile(0.5) * milliseconds,
+            'p90Ms': self.percentile(0.9) * milliseconds,
+            'p99Ms': self.percentile(0.99) * milliseconds,
+            'maxMs': self.maximum * milliseconds,
+            'buckets': {f'{2 ** ((bucket + 1) / BUCKETS_PER_OCTAVE) * milliseconds:.6g}': count
+                        for bucket, count in sorted(self.buckets.items())}
+        }
+
+
+class Recorder:
+    # Only hook names, timings and thread ids are kept: never arguments or return
+    # values, which for most hooks are passwords, keys or vault contents.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self.events: List[Dict[str, Any]] = []
+        self.droppedEvents = 0
+        self.origin = time.perf_counter_ns()
+        self.pid = os.getpid()
+
+    def record(self, name: str, start: int, end: int, failed: bool = False) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+            if failed:
+                self.counters[name + '.errors'] = self.counters.get(name + '.errors', 0) + 1
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.record(end - start)
+            if len(self.events) < MAX_TRACE_EVENTS:
+                self.events.append({'name': name, 'ph': 'X', 'ts': (start - self.origin) / 1000,
+                                    'dur': (end - start) / 1000, 'pid': self.pid, 'tid': threading.get_ident()})
+            else:
+                self.droppedEvents += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'pid': self.pid,
+                'counters': dict(sorted(self.counters.items())),
+                'histograms': {name: histogram.toDict() for name, histogram in sorted(self.histograms.items())},
+                'droppedEvents': self.droppedEvents
+            }
+
+    def traceEvents(self) -> Dict[str, Any]:
+        # Chrome trace-event format, for chrome://tracing or Perfetto.
+        with self.lock:
+            return {'traceEvents': list(self.events), 'displayTimeUnit': 'ms'}
+
+    def export(self, prefix: str) -> None:
+        with open(prefix + '.metrics.json', 'w') as f:
+            json.dump(self.metrics(), f, indent=2)
+        with open(prefix + '.trace.json', 'w') as f:
+            json.dump(self.traceEvents(), f)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.events.clear()
+            self.droppedEvents = 0
+
+
+recorder: Optional[Recorder] = None
+
+
+def enableTracing(prefix: Optional[str] = None) -> Recorder:
+    # Hooks are bound when their module is imported, so this must run before the
+    # instrumented modules load; the env var and the CLI flag both see to that.
+    global recorder
+    if recorder is None:
+        recorder = Recorder()
+    if prefix:
+        atexit.register(recorder.export, prefix)
+    return recorder
+
+
+def instrumented(name: str) -> Callable[[Function], Function]:
+    def decorate(function: Function) -> Function:
+        active = recorder
+        if active is None:
+            # Tracing off: the function is left exactly as it was.
+            return function
+
+        @wraps(function)
+        def timed(*args, **kwargs):
+            start = time.perf_counter_ns()
+            failed = True
+            try:
+                result = function(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                active.record(name, start, time.perf_counter_ns(), failed)
+        return timed
+    return decorate
+
+
+if os.environ.get(TRACE_ENV):
+    enableTracing(os.environ[TRACE_ENV])
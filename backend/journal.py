@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+from typing import Any, BinaryIO, Dict, List, Optional
+from cryptography.fernet import InvalidToken
+from .encryption import EncryptionManager
+from .persistence import writeAtomically
+from .vaultFormat import activeDataPath
+
+JOURNAL_PATH: str = 'data/passwords.journal'
+JOURNAL_MAGIC: bytes = b'PMJOURNAL1'
+
+# Compaction kicks in once the journal outgrows both limits, so that
+# folding it into a new snapshot stays amortised O(1) per mutation.
+JOURNAL_MIN_COMPACT_BYTES: int = 256 * 1024
+JOURNAL_COMPACT_RATIO: float = 0.5
+
+Operation = Dict[str, Any]
+
+
+def snapshotFingerprint(snapshotPath: str) -> str:
+    try:
+        with open(snapshotPath, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return 'empty'
+
+
+def applyOperation(passwords: Dict[str, Dict[str, Any]], operation: Operation) -> bool:
+    op = operation['op']
+    website = operation['website']
+    if op == 'add':
+        passwords.setdefault(website, {})[operation['email']] = operation['password']
+        return True
+    entries = passwords.get(website)
+    if op == 'update':
+        if entries is not None and operation['email'] in entries:
+            entries[operation['email']] = operation['password']
+            return True
+    elif op == 'updateEmail':
+        if entries is not None and operation['oldEmail'] in entries:
+            entries[operation['newEmail']] = entries.pop(operation['oldEmail'])
+            return True
+    elif op == 'delete':
+        if entries is not None and operation['email'] in entries:
+            del entries[operation['email']]
+            if not entries:
+                del passwords[website]
+            return True
+    else:
+        raise ValueError(f"Unknown journal operation: {op}")
+    return False
+
+
+def writeJournalHeader(journalPath: str, fingerprint: str) -> None:
+    writeAtomically(journalPath, JOURNAL_MAGIC + b' ' + fingerprint.encode() + b'\n')
+
+
+def migrateToJournal(snapshotPath: Optional[str] = None, journalPath: str = JOURNAL_PATH) -> bool:
+    if os.path.exists(journalPath):
+        return False
+    writeJournalHeader(journalPath, snapshotFingerprint(snapshotPath or activeDataPath()))
+    return True
+
+
+class VaultJournal:
+    def __init__(self, encryptionManager: EncryptionManager, snapshotPath: str, journalPath: str = JOURNAL_PATH):
+        self.encryptionManager = encryptionManager
+        self.snapshotPath = snapshotPath
+        self.journalPath = journalPath
+        self.recordCount = 0
+        self.journalSize = 0
+        self.snapshotSize = 0
+        self.valid = False
+        # What contentId() is made of, kept current by every read and write of the journal.
+        self.header = b''
+        self.lastRecord = b''
+
+    def replay(self, passwords: Dict[str, Dict[str, Any]]) -> int:
+        self.recordCount = 0
+        self.snapshotSize = os.path.getsize(self.snapshotPath) if os.path.exists(self.snapshotPath) else 0
+        try:
+            f = open(self.journalPath, 'rb')
+        except FileNotFoundError:
+            self.valid = False
+            return 0
+
+        with f:
+            header = f.readline()
+            expected = JOURNAL_MAGIC + b' ' + snapshotFingerprint(self.snapshotPath).encode() + b'\n'
+            if header != expected:
+                # The journal was written against an older snapshot (e.g. a crash
+                # between writing a new snapshot and resetting the journal), so its
+                # records are already part of the snapshot.
+                self.valid = False
+                return 0
+
+            self.valid = True
+            self.header = header
+            self.lastRecord = b''
+            self.journalSize = len(header)
+            for operation in self.readRecords(f):
+                applyOperation(passwords, operation)
+        return self.recordCount
+
+    def readRecords(self, f: BinaryIO) -> List[Operation]:
+        operations = []
+        for line in f:
+            try:
+                operation = json.loads(self.encryptionManager.decrypt(line.rstrip(b'\n')))
+            except InvalidToken:
+                # A torn final record from an interrupted append.
+                break
+            operations.append(operation)
+            self.recordCount += 1
+            self.journalSize += len(line)
+            self.lastRecord = line
+        return operations
+
+    def readNew(self) -> List[Operation]:
+        # Records another instance appended after the last one this journal read or wrote.
+        with open(self.journalPath, 'rb') as f:
+            f.seek(self.journalSize)
+            return self.readRecords(f)
+
+    def append(self, operations: List[Operation]) -> None:
+        if not self.valid:
+            self.reset()
+        sealed = [self.encryptionManager.encrypt(json.dumps(operation)) + b'\n' for operation in operations]
+        records = b''.join(sealed)
+        with open(self.journalPath, 'r+b') as f:
+            # Truncating to the last known good offset drops any torn record.
+            f.truncate(self.journalSize)
+            f.seek(self.journalSize)
+            f.write(records)
+            f.flush()
+            os.fsync(f.fileno())
+        self.recordCount += len(operations)
+        self.journalSize += len(records)
+        if sealed:
+            self.lastRecord = sealed[-1]
+
+    def reset(self) -> None:
+        writeJournalHeader(self.journalPath, snapshotFingerprint(self.snapshotPath))
+        self.snapshotSize = os.path.getsize(self.snapshotPath) if os.path.exists(self.snapshotPath) else 0
+        with open(self.journalPath, 'rb') as f:
+            self.header = f.readline()
+        self.lastRecord = b''
+        self.journalSize = len(self.header)
+        self.recordCount = 0
+        self.valid = True
+
+    def contentId(self) -> str:
+        # The header names the snapshot by its hash, and every record is sealed with a
+        # fresh IV, so the last one tells apart journals appended to separately. Only
+        # that record is hashed, however large the vault and journal are.
+        fingerprint = self.header[len(JOURNAL_MAGIC) + 1:].strip().decode()
+        return f"{fingerprint}:{self.journalSize}:{hashlib.sha256(self.lastRecord).hexdigest()}"
+
+    def shouldCompact(self) -> bool:
+        return self.journalSize > max(JOURNAL_MIN_COMPACT_BYTES, self.snapshotSize * JOURNAL_COMPACT_RATIO)
@@ -0,0 +1,101 @@
+import os
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+SECRET_CACHE_SIZE: int = 16
+SECRET_CACHE_TTL: float = 30.0
+SEAL_BATCH_SIZE: int = 1024
+
+# Every secret is encrypted with its own stretch of one AES-CTR keystream and
+# carries only the index of the block it starts at. A sealed secret is a plain
+# bytes object a few bytes longer than the secret, which makes it smaller than
+# the str it replaces. The keystream is only for this session and no block is
+# ever handed out twice.
+BLOCK_SIZE: int = 16
+BLOCK_INDEX_SIZE: int = 4
+MAX_BLOCKS: int = 2 ** (8 * BLOCK_INDEX_SIZE)
+
+
+def blocksFor(size: int) -> int:
+    return -(-size // BLOCK_SIZE)
+
+
+class SecretSealer:
+    def __init__(self):
+        self.algorithm = algorithms.AES(os.urandom(16))
+        self.nextBlock = 0
+
+    def apply(self, firstBlock: int, data: bytes) -> bytes:
+        # CTR mode is its own inverse, so this both seals and unseals.
+        return Cipher(self.algorithm, modes.CTR(firstBlock.to_bytes(BLOCK_SIZE, 'big'))).encryptor().update(data)
+
+    def seal(self, secret: str) -> bytes:
+        return self.sealMany([secret])[0]
+
+    def sealMany(self, secrets: List[str]) -> List[bytes]:
+        # One pass of the cipher over all of them, each padded to whole blocks.
+        encoded = [secret.encode() for secret in secrets]
+        firstBlock = self.nextBlock
+        blocks = sum(blocksFor(len(data)) for data in encoded)
+        if firstBlock + blocks > MAX_BLOCKS:
+            raise OverflowError("The session has sealed too many secrets; unlock the vault again.")
+        self.nextBlock += blocks
+        stream = self.apply(firstBlock, b''.join(data.ljust(blocksFor(len(data)) * BLOCK_SIZE, b'\0') for data in encoded))
+        sealed = []
+        offset = 0
+        for data in encoded:
+            block = firstBlock + offset // BLOCK_SIZE
+            sealed.append(block.to_bytes(BLOCK_INDEX_SIZE, 'little') + stream[offset:offset + len(data)])
+            offset += blocksFor(len(data)) * BLOCK_SIZE
+        return sealed
+
+    def unseal(self, sealed: bytes) -> str:
+        return self.apply(int.from_bytes(sealed[:BLOCK_INDEX_SIZE], 'little'), sealed[BLOCK_INDEX_SIZE:]).decode()
+
+    def unsealMany(self, sealed: List[bytes]) -> List[str]:
+        # One pass of the cipher over the keystream the secrets span, then a XOR each.
+        if not sealed:
+            return []
+        starts = [int.from_bytes(secret[:BLOCK_INDEX_SIZE], 'little') for secret in sealed]
+        firstBlock = min(starts)
+        lastBlock = max(start + blocksFor(len(secret) - BLOCK_INDEX_SIZE) for start, secret in zip(starts, sealed))
+        stream = self.apply(firstBlock, bytes((lastBlock - firstBlock) * BLOCK_SIZE))
+        secrets = []
+        for start, secret in zip(starts, sealed):
+            size = len(secret) - BLOCK_INDEX_SIZE
+            offset = (start - firstBlock) * BLOCK_SIZE
+            key = int.from_bytes(stream[offset:offset + size], 'little')
+            secrets.append((int.from_bytes(secret[BLOCK_INDEX_SIZE:], 'little') ^ key).to_bytes(size, 'little').decode())
+        return secrets
+
+
+class SecretCache:
+    def __init__(self, maxSize: int = SECRET_CACHE_SIZE, ttl: float = SECRET_CACHE_TTL):
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.entries: OrderedDict[Tuple[str, str], Tuple[str, float]] = OrderedDict()
+
+    def get(self, key: Tuple[str, str]) -> Optional[str]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, expiresAt = entry
+        if time.monotonic() >= expiresAt:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key: Tuple[str, str], value: str) -> None:
+        self.entries[key] = (value, time.monotonic() + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+
+    def discard(self, key: Tuple[str, str]) -> None:
+        self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        self.entries.clear()
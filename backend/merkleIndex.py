@@ -0,0 +1,242 @@
+import hashlib
+import os
+import time
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set, Tuple
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDFExpand
+from .backup import ENTRY_ID_SIZE, entryId, keyId, valueHash
+from .sqliteDatabase import SET_META, SqliteDatabase
+from .vaultFormat import VaultFormatError, decodeFrame, encodeFrame
+from .vaultSync import Account
+
+if TYPE_CHECKING:
+    from .encryption import EncryptionManager
+
+MERKLE_VERSION: int = 1
+# Leaves are grouped into 16**4 buckets by the first two bytes of their entry id, under
+# a fixed 16-way tree, so copies of any size have the same shape and compare node by node.
+MERKLE_FANOUT: int = 16
+MERKLE_DEPTH: int = 4
+BUCKET_BITS: int = 16
+# Merge bases kept per copy; older ones only matter to copies not merged for a long time.
+MERGE_BASE_LIMIT: int = 4
+NONCE_SIZE: int = 12
+
+SCHEMA: Tuple[str, ...] = (
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS leaves (id BLOB PRIMARY KEY, bucket INTEGER NOT NULL, value BLOB NOT NULL, "
+    "name BLOB NOT NULL) WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS leavesByBucket ON leaves (bucket)",
+    "CREATE TABLE IF NOT EXISTS nodes (level INTEGER NOT NULL, position INTEGER NOT NULL, hash BLOB NOT NULL, "
+    "PRIMARY KEY (level, position)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS bases (base BLOB PRIMARY KEY, created REAL NOT NULL)",
+    # A base's value for an entry is its row here (NULL if it had none), else the current leaf.
+    "CREATE TABLE IF NOT EXISTS baseValues (base BLOB NOT NULL, id BLOB NOT NULL, value BLOB, "
+    "PRIMARY KEY (base, id)) WITHOUT ROWID"
+)
+SELECT_LEAF = "SELECT value FROM leaves WHERE id = ?"
+SELECT_NAME = "SELECT name FROM leaves WHERE id = ?"
+SELECT_BUCKET = "SELECT id, value FROM leaves WHERE bucket = ?"
+UPSERT_LEAF = "INSERT OR REPLACE INTO leaves (id, bucket, value, name) VALUES (?, ?, ?, ?)"
+DELETE_LEAF = "DELETE FROM leaves WHERE id = ?"
+SELECT_NODE = "SELECT hash FROM nodes WHERE level = ? AND position = ?"
+SELECT_CHILDREN = "SELECT position, hash FROM nodes WHERE level = ? AND position >= ? AND position < ?"
+UPSERT_NODE = "INSERT OR REPLACE INTO nodes (level, position, hash) VALUES (?, ?, ?)"
+DELETE_NODE = "DELETE FROM nodes WHERE level = ? AND position = ?"
+SELECT_BASES = "SELECT base, created FROM bases"
+SELECT_BASE_VALUE = "SELECT value FROM baseValues WHERE base = ? AND id = ?"
+# Remembers what every recorded base had for an entry before its first change since.
+KEEP_BASE_VALUE = "INSERT OR IGNORE INTO baseValues (base, id, value) SELECT base, ?, ? FROM bases"
+
+
+def mergeKeys(encryptionManager: 'EncryptionManager') -> Tuple[bytes, bytes]:
+    # Separate from the backup key, so neither index can be matched against the other.
+    hashKey, nameKey = (HKDFExpand(algorithm=hashes.SHA256(), length=32, info=info, backend=default_backend())
+                        .derive(encryptionManager.vaultKey) for info in (b'merge-index', b'merge-names'))
+    return hashKey, nameKey
+
+
+def bucketOf(identifier: bytes) -> int:
+    return int.from_bytes(identifier[:BUCKET_BITS // 8], 'big')
+
+
+def nodeHash(children: Iterable[Tuple[bytes, bytes]]) -> bytes:
+    # Children are (key, hash) pairs in order; the keys keep sparse positions apart.
+    digest = hashlib.blake2b(digest_size=ENTRY_ID_SIZE, person=b'merkle-node')
+    for key, value in children:
+        digest.update(key)
+        digest.update(value)
+    return digest.digest()
+
+
+class MerkleIndex(SqliteDatabase):
+    # An SQLite file of keyed hashes, one leaf per entry, under a Merkle tree. Two copies
+    # of the vault made under the same key compare by descending only into the nodes that
+    # differ, without decrypting either vault. Entry names are sealed, for the leaves a
+    # merge has to act on. `contentId` ties the index to the vault content it describes.
+    def __init__(self, path: str, encryptionManager: 'EncryptionManager'):
+        self.hashKey, nameKey = mergeKeys(encryptionManager)
+        self.aead = AESGCM(nameKey)
+        self.keyId = keyId(self.hashKey)
+        super().__init__(path, SCHEMA)
+
+    def contentId(self) -> Optional[str]:
+        # None when the index was built under another key or is not in step with any vault.
+        meta = self.meta()
+        if meta.get('keyId') != self.keyId or meta.get('version') != str(MERKLE_VERSION):
+            return None
+        return meta.get('contentId') or None
+
+    def entryId(self, website: str, email: str) -> bytes:
+        return entryId(self.hashKey, website, email)
+
+    def valueHash(self, identifier: bytes, password: str) -> bytes:
+        return valueHash(self.hashKey, identifier, password)
+
+    def sealName(self, identifier: bytes, website: str, email: str) -> bytes:
+        nonce = os.urandom(NONCE_SIZE)
+        return nonce + self.aead.encrypt(nonce, encodeFrame([(website, email, '')]), identifier)
+
+    def name(self, identifier: bytes) -> Account:
+        with self.lock:
+            row = self.connection.execute(SELECT_NAME, (identifier,)).fetchone()
+        if row is None:
+            raise KeyError(identifier)
+        try:
+            website, email, _ = next(iter(decodeFrame(self.aead.decrypt(row[0][:NONCE_SIZE], row[0][NONCE_SIZE:], identifier))))
+        except InvalidTag:
+            raise VaultFormatError("Merge index entry failed authentication; wrong key or corrupted file.") from None
+        return website, email
+
+    def leaf(self, identifier: bytes) -> Optional[bytes]:
+        with self.lock:
+            row = self.connection.execute(SELECT_LEAF, (identifier,)).fetchone()
+        return row[0] if row else None
+
+    def bucket(self, position: int) -> Dict[bytes, bytes]:
+        with self.lock:
+            return dict(self.connection.execute(SELECT_BUCKET, (position,)).fetchall())
+
+    def root(self) -> Optional[bytes]:
+        with self.lock:
+            row = self.connection.execute(SELECT_NODE, (0, 0)).fetchone()
+        return row[0] if row else None
+
+    def children(self, level: int, position: int) -> Dict[int, bytes]:
+        # The nodes one level below (level, position) that have any leaves under them.
+        first = position * MERKLE_FANOUT
+        with self.lock:
+            return dict(self.connection.execute(SELECT_CHILDREN, (level + 1, first, first + MERKLE_FANOUT)).fetchall())
+
+    def update(self, values: Dict[Account, Optional[str]], contentId: str) -> None:
+        # Records the entries a write just saved (None for a deletion) and the content it left.
+        if self.meta().get('keyId') != self.keyId:
+            return
+        with self.transaction() as connection:
+            touched: Set[int] = set()
+            for (website, email), password in values.items():
+                identifier = self.entryId(website, email)
+                old = self.leaf(identifier)
+                new = None if password is None else self.valueHash(identifier, password)
+                if old == new:
+                    continue
+                connection.execute(KEEP_BASE_VALUE, (identifier, old))
+                if new is None:
+                    connection.execute(DELETE_LEAF, (identifier,))
+                else:
+                    connection.execute(UPSERT_LEAF, (identifier, bucketOf(identifier), new,
+                                                     self.sealName(identifier, website, email)))
+                touched.add(bucketOf(identifier))
+            self.rehash(touched)
+            connection.execute(SET_META, ('contentId', contentId))
+
+    def rehash(self, buckets: Set[int]) -> None:
+        # Called inside a transaction: recomputes the touched buckets and the paths above them.
+        connection = self.connection
+        positions = buckets
+        for level in range(MERKLE_DEPTH, -1, -1):
+            for position in positions:
+                if level == MERKLE_DEPTH:
+                    children = sorted(connection.execute(SELECT_BUCKET, (position,)).fetchall())
+                else:
+                    children = [(child.to_bytes(2, 'big'), value) for child, value in sorted(self.children(level, position).items())]
+                if children:
+                    connection.execute(UPSERT_NODE, (level, position, nodeHash(children)))
+                else:
+                    connection.execute(DELETE_NODE, (level, position))
+            positions = {position // MERKLE_FANOUT for position in positions}
+
+    def rebuild(self, entries: Iterable[Tuple[str, str, str]], contentId: str) -> None:
+        # Starts over from every entry of the vault. Bases are dropped with the old leaves:
+        # changes made while the index was out of step were never set against them.
+        leaves = []
+        levels: List[Dict[int, List[Tuple[bytes, bytes]]]] = [{} for _ in range(MERKLE_DEPTH + 1)]
+        for website, email, password in entries:
+            identifier = self.entryId(website, email)
+            value = self.valueHash(identifier, password)
+            leaves.append((identifier, bucketOf(identifier), value, self.sealName(identifier, website, email)))
+            levels[MERKLE_DEPTH].setdefault(bucketOf(identifier), []).append((identifier, value))
+        nodes = []
+        for level in range(MERKLE_DEPTH, -1, -1):
+            for position, children in levels[level].items():
+                value = nodeHash(sorted(children))
+                nodes.append((level, position, value))
+                if level:
+                    levels[level - 1].setdefault(position // MERKLE_FANOUT, []).append((position.to_bytes(2, 'big'), value))
+        with self.transaction() as connection:
+            for table in ('leaves', 'nodes', 'bases', 'baseValues'):
+                connection.execute(f"DELETE FROM {table}")
+            connection.executemany(UPSERT_LEAF, leaves)
+            connection.executemany(UPSERT_NODE, nodes)
+            connection.executemany(SET_META, [('version', str(MERKLE_VERSION)), ('keyId', self.keyId),
+                                              ('contentId', contentId)])
+
+    def bases(self) -> Dict[bytes, float]:
+        with self.lock:
+            return dict(self.connection.execute(SELECT_BASES).fetchall())
+
+    def baseValue(self, base: bytes, identifier: bytes) -> Optional[bytes]:
+        with self.lock:
+            row = self.connection.execute(SELECT_BASE_VALUE, (base, identifier)).fetchone()
+        return row[0] if row else self.leaf(identifier)
+
+    def recordBase(self, base: bytes, overrides: Dict[bytes, Optional[bytes]]) -> None:
+        # The current leaves become a merge base, except the entries in `overrides`,
+        # which keep the given value there (None: absent).
+        with self.transaction() as connection:
+            connection.execute("INSERT OR REPLACE INTO bases (base, created) VALUES (?, ?)", (base, time.time()))
+            connection.executemany("INSERT OR REPLACE INTO baseValues (base, id, value) VALUES (?, ?, ?)",
+                                   [(base, identifier, value) for identifier, value in overrides.items()])
+            stale = [(old,) for old, _ in sorted(self.bases().items(), key=lambda item: item[1])[:-MERGE_BASE_LIMIT]]
+            connection.executemany("DELETE FROM bases WHERE base = ?", stale)
+            connection.executemany("DELETE FROM baseValues WHERE base = ?", stale)
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.connection.execute("DELETE FROM meta WHERE key = 'contentId'")
+
+
+
+def diffIndexes(ours: MerkleIndex, theirs: MerkleIndex) -> Tuple[List[bytes], int]:
+    # The ids of entries whose leaves differ, and how many nodes were compared to find them.
+    if ours.root() == theirs.root():
+        return [], 1
+    differing: List[bytes] = []
+    compared = 1
+    pending = [(0, 0)]
+    while pending:
+        level, position = pending.pop()
+        if level == MERKLE_DEPTH:
+            ourLeaves, theirLeaves = ours.bucket(position), theirs.bucket(position)
+            compared += len(ourLeaves.keys() | theirLeaves.keys())
+            differing.extend(identifier for identifier in ourLeaves.keys() | theirLeaves.keys()
+                             if ourLeaves.get(identifier) != theirLeaves.get(identifier))
+            continue
+        ourChildren, theirChildren = ours.children(level, position), theirs.children(level, position)
+        compared += len(ourChildren.keys() | theirChildren.keys())
+        pending.extend((level + 1, child) for child in ourChildren.keys() | theirChildren.keys()
+                       if ourChildren.get(child) != theirChildren.get(child))
+    return sorted(differing), compared
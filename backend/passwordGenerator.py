@@ -0,0 +1,90 @@
+import os
+import string
+from typing import List, Optional, Tuple
+
+LOWERCASE: str = string.ascii_lowercase
+UPPERCASE: str = string.ascii_uppercase
+DIGITS: str = string.digits
+SPECIAL_CHARACTERS: str = "!@#$%^&*()-__+."
+AMBIGUOUS_CHARACTERS: str = "Il1O0o"
+
+# Expected fraction of random candidates that satisfy the class minimums before
+# the generator has seen any; it is re-estimated from every batch.
+INITIAL_ACCEPTANCE: float = 0.5
+
+
+class PasswordPolicy:
+    # A class minimum of None leaves that class out of the alphabet entirely;
+    # 0 allows it without requiring it.
+    def __init__(
+        self,
+        length: int = 16,
+        lowercase: Optional[int] = 3,
+        uppercase: Optional[int] = 2,
+        digits: Optional[int] = 2,
+        special: Optional[int] = 1,
+        excludeAmbiguous: bool = False,
+        specialCharacters: str = SPECIAL_CHARACTERS
+    ):
+        self.length = length
+        self.classes: List[Tuple[str, int]] = []
+        for characters, minimum in ((LOWERCASE, lowercase), (UPPERCASE, uppercase), (DIGITS, digits), (specialCharacters, special)):
+            if minimum is None:
+                continue
+            # Duplicates would skew the distribution towards the repeated characters.
+            characters = ''.join(dict.fromkeys(characters))
+            if excludeAmbiguous:
+                characters = ''.join(c for c in characters if c not in AMBIGUOUS_CHARACTERS)
+            if not characters:
+                raise ValueError("A character class has no characters left.")
+            self.classes.append((characters, minimum))
+        if not self.classes:
+            raise ValueError("At least one character class must be enabled.")
+        if length < 1 or sum(minimum for _, minimum in self.classes) > length:
+            raise ValueError("Password length is shorter than the required characters.")
+        self.alphabet = ''.join(characters for characters, _ in self.classes)
+
+
+DEFAULT_POLICY: PasswordPolicy = PasswordPolicy()
+
+
+class PasswordGenerator:
+    def __init__(self, policy: PasswordPolicy = DEFAULT_POLICY):
+        self.policy = policy
+        alphabet = policy.alphabet.encode('ascii')
+        size = len(alphabet)
+        # Bytes at or above the largest multiple of the alphabet size are rejected,
+        # so every character is equally likely.
+        self.limit = 256 - 256 % size
+        self.table = bytes(alphabet[byte % size] if byte < self.limit else 0 for byte in range(256))
+        self.rejected = bytes(range(self.limit, 256))
+        # translate(None, delete) keeps only one class, so its length is the class count.
+        self.classFilters = [
+            (bytes(c for c in range(256) if chr(c) not in characters), minimum)
+            for characters, minimum in policy.classes if minimum > 0
+        ]
+        self.accepted = 0
+        self.tried = 0
+
+    def acceptance(self) -> float:
+        if self.tried < 100:
+            return INITIAL_ACCEPTANCE
+        return max(self.accepted / self.tried, 0.01)
+
+    def generate(self, count: int) -> List[str]:
+        length = self.policy.length
+        passwords: List[str] = []
+        while len(passwords) < count:
+            needed = count - len(passwords)
+            # One urandom call per round, sized for the expected rejection rate.
+            bufferSize = int(needed * length * 256 / self.limit / self.acceptance() * 1.1) + length
+            characters = os.urandom(bufferSize).translate(self.table, self.rejected)
+            for start in range(0, len(characters) - length + 1, length):
+                candidate = characters[start:start + length]
+                self.tried += 1
+                if all(len(candidate.translate(None, delete)) >= minimum for delete, minimum in self.classFilters):
+                    self.accepted += 1
+                    passwords.append(candidate.decode('ascii'))
+                    if len(passwords) == count:
+                        break
+        return passwords
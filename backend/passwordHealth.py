@@ -0,0 +1,216 @@
+import hmac
+from bisect import bisect_right
+import math
+import os
+import string
+from typing import Dict, List, Optional, Set, Tuple
+from .passwordGenerator import SPECIAL_CHARACTERS
+
+Account = Tuple[str, str]
+
+MIN_LENGTH: int = 8
+MIN_LOWERCASE: int = 3
+MIN_UPPERCASE: int = 2
+MIN_DIGITS: int = 2
+MIN_SPECIAL: int = 1
+# Passwords below this estimate are reported as weak; a generated 16-character password is about 100 bits.
+WEAK_ENTROPY_BITS: float = 60
+STRENGTH_LIMITS: List[float] = [40, WEAK_ENTROPY_BITS, 80]
+STRENGTH_LABELS: List[str] = ['very weak', 'weak', 'good', 'strong']
+# Alphabet sizes an attacker would have to cover once a character from each class appears.
+OTHER_ASCII_CHARACTERS: str = ''.join(sorted(set(string.punctuation + ' ') - set(SPECIAL_CHARACTERS)))
+NON_ASCII_POOL: int = 100
+
+# One translate call maps every character to its class letter, so counting
+# classes is a handful of C-level passes instead of one regex lookahead per class.
+CLASS_TABLE: Dict[int, str] = {
+    **{ord(c): 'l' for c in string.ascii_lowercase},
+    **{ord(c): 'u' for c in string.ascii_uppercase},
+    **{ord(c): 'd' for c in string.digits},
+    **{ord(c): 's' for c in SPECIAL_CHARACTERS},
+    **{ord(c): 'p' for c in OTHER_ASCII_CHARACTERS}
+}
+BYTE_CLASS_TABLE: bytes = bytes(ord(CLASS_TABLE.get(byte, '.')) for byte in range(256))
+
+
+def classify(password: str) -> bytes:
+    # ASCII passwords, nearly all of them, take the flat byte table.
+    if password.isascii():
+        return password.encode('ascii').translate(BYTE_CLASS_TABLE)
+    return password.translate(CLASS_TABLE).encode()
+
+
+# Alphabet sizes for lowercase, uppercase, digits, policy specials, other ASCII punctuation and non-ASCII.
+CLASS_POOL_SIZES: List[int] = [26, 26, 10, len(set(SPECIAL_CHARACTERS)), len(OTHER_ASCII_CHARACTERS), NON_ASCII_POOL]
+# log2 of the combined alphabet for every subset of classes, indexed by a bitmask of the classes present.
+POOL_BITS: List[float] = [math.log2(sum(size for bit, size in enumerate(CLASS_POOL_SIZES) if mask >> bit & 1) or 1)
+                          for mask in range(1 << len(CLASS_POOL_SIZES))]
+
+
+class CharacterClasses:
+    __slots__ = ('lowercase', 'uppercase', 'digits', 'special', 'punctuation', 'other', 'length', 'distinct')
+
+    def __init__(self, password: str):
+        classes = classify(password)
+        self.lowercase = classes.count(b'l')
+        self.uppercase = classes.count(b'u')
+        self.digits = classes.count(b'd')
+        self.special = classes.count(b's')
+        self.punctuation = classes.count(b'p')
+        self.length = len(password)
+        self.other = self.length - self.lowercase - self.uppercase - self.digits - self.special - self.punctuation
+        self.distinct = len(set(password))
+
+    def poolMask(self) -> int:
+        return (bool(self.lowercase) | bool(self.uppercase) << 1 | bool(self.digits) << 2
+                | bool(self.special) << 3 | bool(self.punctuation) << 4 | bool(self.other) << 5)
+
+
+def meetsPolicy(password: str) -> bool:
+    # Newlines are rejected outright; the old pattern's `.` never matched them either.
+    if len(password) < MIN_LENGTH or '\n' in password:
+        return False
+    classes = classify(password)
+    return classes.count(b'l') >= MIN_LOWERCASE and classes.count(b'u') >= MIN_UPPERCASE \
+        and classes.count(b'd') >= MIN_DIGITS and classes.count(b's') >= MIN_SPECIAL
+
+
+def policyFailures(password: str, classes: CharacterClasses) -> Tuple[str, ...]:
+    if classes.length >= MIN_LENGTH and classes.lowercase >= MIN_LOWERCASE and classes.uppercase >= MIN_UPPERCASE \
+            and classes.digits >= MIN_DIGITS and classes.special >= MIN_SPECIAL and '\n' not in password:
+        return ()
+    failures = []
+    if classes.length < MIN_LENGTH:
+        failures.append(f"shorter than {MIN_LENGTH} characters")
+    for count, minimum, name in ((classes.lowercase, MIN_LOWERCASE, 'lowercase letters'),
+                                 (classes.uppercase, MIN_UPPERCASE, 'uppercase letters'),
+                                 (classes.digits, MIN_DIGITS, 'digits'),
+                                 (classes.special, MIN_SPECIAL, 'of ' + ''.join(dict.fromkeys(SPECIAL_CHARACTERS)))):
+        if count < minimum:
+            failures.append(f"fewer than {minimum} {name}")
+    if '\n' in password:
+        failures.append("contains a line break")
+    return tuple(failures)
+
+
+def estimateEntropy(classes: CharacterClasses) -> float:
+    # Pool-size estimate, with repeated characters counted at most twice
+    # so that "aaaaaaaa" does not score like eight random letters.
+    return min(classes.length, 2 * classes.distinct) * POOL_BITS[classes.poolMask()]
+
+
+def strengthLabel(bits: float) -> str:
+    return STRENGTH_LABELS[bisect_right(STRENGTH_LIMITS, bits)]
+
+
+class EntryHealth:
+    __slots__ = ('fingerprint', 'bits', 'strength', 'failures')
+
+    def __init__(self, fingerprint: bytes, password: str):
+        classes = CharacterClasses(password)
+        self.fingerprint = fingerprint
+        self.bits = estimateEntropy(classes)
+        self.strength = strengthLabel(self.bits)
+        self.failures = policyFailures(password, classes)
+
+
+class HealthReport:
+    def __init__(self, entries: int, reused: List[List[Account]], weak: List[Tuple[str, str, float, str]],
+                 failing: List[Tuple[str, str, Tuple[str, ...]]]):
+        self.entries = entries
+        self.reused = reused
+        self.weak = weak
+        self.failing = failing
+
+    def issueCount(self) -> int:
+        return sum(len(group) for group in self.reused) + len(self.weak) + len(self.failing)
+
+    def summary(self) -> str:
+        reusedAccounts = sum(len(group) for group in self.reused)
+        return (f"{self.entries:,} passwords checked: {reusedAccounts:,} share a password "
+                f"({len(self.reused):,} groups), {len(self.weak):,} weak, {len(self.failing):,} below policy.")
+
+
+class PasswordAudit:
+    # Reuse is found by comparing HMACs under a key that lives only in this
+    # object, so no table of plaintexts or unkeyed hashes is ever built.
+    # Results are kept per entry and updated from the store's operations,
+    # so a report after an edit only re-analyses the edited entry, and the
+    # flagged accounts are tracked as they change instead of rescanned.
+    def __init__(self):
+        self.key = os.urandom(32)
+        self.entries: Dict[Account, EntryHealth] = {}
+        self.groups: Dict[bytes, Set[Account]] = {}
+        self.reused: Set[bytes] = set()
+        self.weak: Set[Account] = set()
+        self.failing: Set[Account] = set()
+
+    @classmethod
+    def build(cls, passwords: Dict[str, Dict[str, str]]) -> 'PasswordAudit':
+        audit = cls()
+        for website, entries in passwords.items():
+            for email, password in entries.items():
+                audit.setEntry(website, email, password)
+        return audit
+
+    def fingerprint(self, password: str) -> bytes:
+        return hmac.digest(self.key, password.encode(), 'sha256')
+
+    def setEntry(self, website: str, email: str, password: str) -> None:
+        account = (website, email)
+        fingerprint = self.fingerprint(password)
+        previous = self.entries.get(account)
+        if previous is not None:
+            if previous.fingerprint == fingerprint:
+                return
+            self.removeEntry(website, email)
+        self.insert(account, EntryHealth(fingerprint, password))
+
+    def insert(self, account: Account, health: EntryHealth) -> None:
+        self.entries[account] = health
+        group = self.groups.setdefault(health.fingerprint, set())
+        group.add(account)
+        if len(group) == 2:
+            self.reused.add(health.fingerprint)
+        if health.bits < WEAK_ENTROPY_BITS:
+            self.weak.add(account)
+        if health.failures:
+            self.failing.add(account)
+
+    def removeEntry(self, website: str, email: str) -> Optional[EntryHealth]:
+        account = (website, email)
+        health = self.entries.pop(account, None)
+        if health is not None:
+            group = self.groups[health.fingerprint]
+            group.discard(account)
+            if len(group) == 1:
+                self.reused.discard(health.fingerprint)
+            elif not group:
+                del self.groups[health.fingerprint]
+            self.weak.discard(account)
+            self.failing.discard(account)
+        return health
+
+    def renameEntry(self, website: str, oldEmail: str, newEmail: str) -> None:
+        health = self.removeEntry(website, oldEmail)
+        if health is None:
+            return
+        self.removeEntry(website, newEmail)
+        self.insert((website, newEmail), health)
+
+    def applyChange(self, operation: Dict[str, str]) -> None:
+        op = operation['op']
+        website = operation['website']
+        if op in ('add', 'update'):
+            self.setEntry(website, operation['email'], operation['password'])
+        elif op == 'delete':
+            self.removeEntry(website, operation['email'])
+        elif op == 'updateEmail':
+            self.renameEntry(website, operation['oldEmail'], operation['newEmail'])
+
+    def report(self) -> HealthReport:
+        reused = sorted(sorted(self.groups[fingerprint]) for fingerprint in self.reused)
+        weak = [(website, email, self.entries[(website, email)].bits, self.entries[(website, email)].strength)
+                for website, email in sorted(self.weak)]
+        failing = [(website, email, self.entries[(website, email)].failures) for website, email in sorted(self.failing)]
+        return HealthReport(len(self.entries), reused, weak, failing)
@@ -1,57 +1,582 @@
-import json
-from typing import Dict, Optional
+import hmac
+import os
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
 from .encryption import EncryptionManager
+from .instrumentation import instrumented
+from .journal import JOURNAL_PATH, Operation, VaultJournal, applyOperation, snapshotFingerprint, writeJournalHeader
+from .lazySecrets import SEAL_BATCH_SIZE, SECRET_CACHE_SIZE, SECRET_CACHE_TTL, SecretCache, SecretSealer
+from .passwordHealth import HealthReport, PasswordAudit
+from .persistence import PersistenceWorker
+from .searchIndex import SearchIndex
+from .storage import openStorage, touchedAccounts
+from .vaultFormat import MERKLE_PATH, activeDataPath
+from .vaultSync import LOCK_PATH, Account, FileSignature, VaultConflict, VaultKeyChangedError, VaultLock, diffPasswords, fileSignature
+
+if TYPE_CHECKING:
+    from .merkleIndex import MerkleIndex
+
+# Stands in for the saved value of an entry edited here, which only exists as a keyed hash.
+UNKNOWN_VALUE = object()
+
+class StoreBatch:
+    def __init__(self):
+        self.operations: List[Operation] = []
+        self.committed = False
+
+    @property
+    def operationCount(self) -> int:
+        return len(self.operations)
+
 
 class PasswordStore:
-    def __init__(self, encryptionManager: EncryptionManager):
+    def __init__(
+        self,
+        encryptionManager: EncryptionManager,
+        useJournal: Optional[bool] = None,
+        lazySecrets: bool = False,
+        cacheSize: int = SECRET_CACHE_SIZE,
+        cacheTtl: float = SECRET_CACHE_TTL,
+        backgroundWrites: bool = False,
+        onSaveStatus: Optional[Callable[[Optional[BaseException]], None]] = None,
+        onConflict: Optional[Callable[[List[VaultConflict]], None]] = None,
+        root: str = '',
+        backgroundSearch: bool = False
+    ):
+        # `root` opens another copy of the vault, laid out like the working directory.
         self.encryptionManager = encryptionManager
-        self.dataPath = 'data/passwords.json.enc'
-        self.passwords = self.loadPasswords()
+        self.root = root
+        self.dataPath = activeDataPath(root)
+        self.storage = openStorage(self.dataPath, encryptionManager)
+        # Journal mode is picked up automatically once a vault has been migrated.
+        # Paged storages write only the touched entries, so they never journal.
+        if self.storage.paged:
+            useJournal = False
+        elif useJournal is None:
+            useJournal = os.path.exists(os.path.join(root, JOURNAL_PATH))
+        self.journal: Optional[VaultJournal] = \
+            VaultJournal(encryptionManager, self.dataPath, os.path.join(root, JOURNAL_PATH)) if useJournal else None
+        self.activeBatch: Optional[StoreBatch] = None
+        # In lazy mode every secret stays sealed in memory until getPassword asks for it.
+        self.sealer: Optional[SecretSealer] = SecretSealer() if lazySecrets else None
+        self.secretCache: Optional[SecretCache] = SecretCache(cacheSize, cacheTtl) if lazySecrets and cacheSize else None
+        # Other instances may share the vault: writes and reloads take the vault lock,
+        # and the files' stat signature tells when someone else has written.
+        self.vaultLock = VaultLock(os.path.join(root, LOCK_PATH))
+        self.onConflict = onConflict
+        self.conflicts: List[VaultConflict] = []
+        # Entries edited here and not yet written, each with a keyed hash of the value
+        # it replaced (None if it was new), to tell external edits of them apart.
+        self.dirty: Dict[Account, Optional[bytes]] = {}
+        self.fingerprintKey = os.urandom(32)
+        with self.vaultLock:
+            self.passwords = self.loadPasswords()
+            self.signature = self.vaultSignature()
+            self.generation = self.storage.generation()
+        # A paged vault builds its index on the first search, so opening it stays cheap.
+        # With background search, substring tables are built off the caller's thread.
+        self.backgroundSearch = backgroundSearch
+        self.searchIndex: Optional[SearchIndex] = None if self.storage.paged else self.buildSearchIndex()
+        # Built on the first health report and kept current from then on.
+        self.healthAudit: Optional[PasswordAudit] = None
+        # Created by the first merge with another copy; from then on every write updates it.
+        self.merkle: Optional['MerkleIndex'] = None
+        if os.path.exists(os.path.join(root, MERKLE_PATH)):
+            from .merkleIndex import MerkleIndex
+            self.merkle = MerkleIndex(os.path.join(root, MERKLE_PATH), encryptionManager)
+        # With background writes, mutations only queue work for the writer thread;
+        # the lock guards the in-memory state it snapshots.
+        self.lock = threading.RLock()
+        self.pendingOperations: List[Operation] = []
+        self.writer: Optional[PersistenceWorker] = \
+            PersistenceWorker(self.writePending, onSaveStatus) if backgroundWrites else None
 
+    @instrumented('PasswordStore.loadPasswords')
     def loadPasswords(self) -> Dict[str, Dict[str, str]]:
-        try:
-            with open(self.dataPath, 'rb') as f:
-                encryptedData = f.read()
-            data = self.encryptionManager.decrypt(encryptedData)
-            return json.loads(data)
-        except FileNotFoundError:
-            return {}
+        if self.storage.paged:
+            return self.storage.load(self.sealPasswords if self.sealer else None)
+        passwords = self.readPasswords()
+        if self.sealer:
+            self.sealPasswords(passwords)
+        return passwords
+
+    def readPasswords(self) -> Dict[str, Dict[str, str]]:
+        passwords = self.storage.read()
+        if self.journal:
+            self.journal.replay(passwords)
+        return passwords
+
+    def sealPasswords(self, passwords: Dict[str, Dict[str, Any]]) -> None:
+        # In batches, so the cipher is set up once per batch and little is held on the side.
+        batch: List[Tuple[Dict[str, Any], str]] = []
+        for entries in passwords.values():
+            for email in entries:
+                batch.append((entries, email))
+            if len(batch) >= SEAL_BATCH_SIZE:
+                self.sealBatch(batch)
+        self.sealBatch(batch)
+
+    def sealBatch(self, batch: List[Tuple[Dict[str, Any], str]]) -> None:
+        for (entries, email), secret in zip(batch, self.sealer.sealMany([entries[email] for entries, email in batch])):
+            entries[email] = secret
+        batch.clear()
+
+    def plaintextPasswords(self, passwords: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Dict[str, str]]:
+        if passwords is None:
+            passwords = self.passwords
+        if not self.sealer:
+            return passwords
+        secrets = iter(self.sealer.unsealMany([secret for entries in passwords.values() for secret in entries.values()]))
+        return {website: {email: next(secrets) for email in entries} for website, entries in passwords.items()}
+
+    def writeSnapshot(self, passwords: Dict[str, Dict[str, Any]]) -> None:
+        self.storage.write(self.plaintextPasswords(passwords))
+        if self.journal:
+            self.journal.reset()
 
+    @instrumented('PasswordStore.savePasswords')
     def savePasswords(self):
-        data = json.dumps(self.passwords, indent=4)
-        encryptedData = self.encryptionManager.encrypt(data)
-        with open(self.dataPath, 'wb') as f:
-            f.write(encryptedData)
+        self.writeSnapshot(self.passwords)
+
+    def persist(self, operation: Operation) -> None:
+        if self.activeBatch:
+            self.activeBatch.operations.append(operation)
+            return
+        self.commit([operation])
+
+    @instrumented('PasswordStore.commit')
+    def commit(self, operations: List[Operation]) -> None:
+        if self.writer:
+            with self.lock:
+                self.pendingOperations.extend(operations)
+            self.writer.schedule()
+            return
+        with self.exclusiveAccess():
+            dirty, self.dirty = self.dirty, {}
+            values = self.merkleValues(operations)
+            try:
+                if self.storage.paged:
+                    self.writeChanges(operations)
+                elif not self.journal:
+                    self.savePasswords()
+                else:
+                    self.journal.append(operations)
+                    if self.journal.shouldCompact():
+                        self.savePasswords()
+            except BaseException:
+                self.dirty = dirty
+                raise
+            self.recordWrite(values)
+
+    def writeChanges(self, operations: List[Operation]) -> None:
+        self.storage.writeChanges(self.passwords, operations, self.lock, self.plaintextPasswords)
+
+    @instrumented('PasswordStore.writePending')
+    def writePending(self) -> None:
+        # Runs on the writer thread. Operations and the snapshot are taken together
+        # so that a compacted snapshot always matches the journal that follows it.
+        with self.exclusiveAccess():
+            with self.lock:
+                operations, self.pendingOperations = self.pendingOperations, []
+                dirty, self.dirty = self.dirty, {}
+                snapshot = None
+                if not self.storage.paged and (not self.journal or self.journal.shouldCompact()):
+                    snapshot = {website: dict(entries) for website, entries in self.passwords.items()}
+                values = self.merkleValues(operations)
+            try:
+                if self.storage.paged:
+                    self.writeChanges(operations)
+                elif snapshot is not None:
+                    self.writeSnapshot(snapshot)
+                elif operations:
+                    self.journal.append(operations)
+            except BaseException:
+                with self.lock:
+                    self.pendingOperations[:0] = operations
+                    # Entries edited again since the snapshot still replaced these older values.
+                    self.dirty = {**self.dirty, **dirty}
+                raise
+            self.recordWrite(values)
+
+    def merkleValues(self, operations: List[Operation]) -> Optional[Dict[Account, Optional[str]]]:
+        # What the operations left in the entries they touched, for the merge index.
+        if not self.merkle:
+            return None
+        with self.lock:
+            return {account: self.unsealed(self.passwords.get(account[0], {}).get(account[1]))
+                    for account in touchedAccounts(operations)}
+
+    def recordWrite(self, values: Optional[Dict[Account, Optional[str]]]) -> None:
+        # Called with the vault lock held, so the index moves in step with the vault.
+        if values is not None:
+            self.merkle.update(values, self.contentId())
+
+    def contentId(self) -> str:
+        if not self.journal or not self.journal.valid:
+            return self.storage.contentId()
+        return self.journal.contentId()
+
+    def merkleIndex(self) -> 'MerkleIndex':
+        # The caller holds the vault lock. Rebuilt from every entry only when the index
+        # is missing or was not kept up with the vault, e.g. after a change of master key.
+        from .merkleIndex import MerkleIndex
+        if self.merkle is None:
+            self.merkle = MerkleIndex(os.path.join(self.root, MERKLE_PATH), self.encryptionManager)
+        contentId = self.contentId()
+        if self.merkle.contentId() != contentId:
+            with self.lock:
+                entries = [(website, email, self.unsealed(secret))
+                           for website, websiteEntries in self.passwords.items() for email, secret in websiteEntries.items()]
+            self.merkle.rebuild(entries, contentId)
+        return self.merkle
+
+    def vaultSignature(self) -> Tuple[Any, FileSignature, FileSignature]:
+        return (self.storage.signature(), fileSignature(self.journal.journalPath if self.journal else None),
+                fileSignature(self.encryptionManager.hashPasswordPath))
+
+    @contextmanager
+    def exclusiveAccess(self) -> Iterator[None]:
+        # Whatever another instance wrote since we last looked is merged in before
+        # our write, and the file state after it is remembered as our own.
+        with self.vaultLock:
+            self.syncExternalChanges()
+            yield
+            self.signature = self.vaultSignature()
+            self.generation = self.storage.generation()
+
+    def checkForChanges(self) -> int:
+        # A stat per vault file when nothing changed, so it is cheap enough to poll.
+        if self.vaultSignature() == self.signature:
+            return 0
+        with self.vaultLock:
+            return self.syncExternalChanges()
+
+    def syncExternalChanges(self) -> int:
+        # The caller holds the vault lock. Only the entries another instance changed
+        # are touched; the in-memory vault is never swapped for a fresh load.
+        signature = self.vaultSignature()
+        if signature == self.signature:
+            return 0
+        if signature[2] != self.signature[2] and self.encryptionManager.loadHeader() != self.encryptionManager.header:
+            # Rekeyed elsewhere: neither reading the new vault nor writing the old one can work.
+            raise VaultKeyChangedError("The master password was changed in another window; unlock the vault again.")
+        generation = self.storage.generation()
+        with self.lock:
+            if signature[0] is None and self.signature[0] is not None:
+                # The vault file is gone (converted by another instance); keep what we have.
+                changes = {}
+            elif self.storage.paged:
+                changes = self.storage.externalChanges(self.passwords, self.signature[0], signature[0], self.unsealed)
+            elif not self.journal and generation is not None and generation == self.generation:
+                # Touched but not rewritten, e.g. put back in place by a file sync.
+                changes = {}
+            else:
+                changes = self.externalJournalChanges(signature) if self.journal else None
+                if changes is None:
+                    changes = diffPasswords(self.passwords, self.readPasswords(), self.unsealed)
+            applied = self.mergeExternal(changes)
+            self.signature = signature
+            self.generation = generation
+        return applied
+
+    def externalJournalChanges(self, signature: Tuple[Any, FileSignature, FileSignature]) -> Optional[Dict[Account, Optional[str]]]:
+        # When the snapshot is untouched and the journal only grew, the new records
+        # say exactly what changed. Returns None when the whole vault must be compared.
+        previousJournal, journal = self.signature[1], signature[1]
+        if not self.journal.valid or signature[0] != self.signature[0] or previousJournal is None or journal is None \
+                or journal[2] != previousJournal[2] or journal[1] < self.journal.journalSize:
+            return None
+        # The touched entries are replayed on their saved values: the in-memory ones,
+        # except for entries edited here, whose saved value is unknown.
+        scratch: Dict[str, Dict[str, Any]] = {}
+        touched: Set[Account] = set()
+        for operation in self.journal.readNew():
+            for field in ('email', 'oldEmail', 'newEmail'):
+                account = (operation['website'], operation.get(field))
+                if field not in operation or account in touched:
+                    continue
+                touched.add(account)
+                if account in self.dirty:
+                    saved = UNKNOWN_VALUE if self.dirty[account] is not None else None
+                else:
+                    saved = self.unsealed(self.passwords.get(account[0], {}).get(account[1]))
+                if saved is not None:
+                    scratch.setdefault(account[0], {})[account[1]] = saved
+            applyOperation(scratch, operation)
+        changes = {account: scratch.get(account[0], {}).get(account[1]) for account in touched}
+        if any(value is UNKNOWN_VALUE for value in changes.values()):
+            return None
+        return changes
+
+    def mergeExternal(self, changes: Dict[Account, Optional[str]]) -> int:
+        applied = 0
+        conflicts: List[VaultConflict] = []
+        for account, external in changes.items():
+            website, email = account
+            if external == self.unsealed(self.passwords.get(website, {}).get(email)):
+                continue
+            if account in self.dirty:
+                # Edited here too. Unless the saved value is still the one our edit
+                # replaced, both sides changed it: ours is kept and theirs reported.
+                fingerprint = self.fingerprint(external)
+                if fingerprint != self.dirty[account]:
+                    conflicts.append(VaultConflict(website, email, external))
+                    self.dirty[account] = fingerprint
+                continue
+            if external is None:
+                self.applyChange({'op': 'delete', 'website': website, 'email': email}, local=False)
+            else:
+                self.applyChange({'op': 'add', 'website': website, 'email': email, 'password': external}, local=False)
+            applied += 1
+        if conflicts:
+            if self.onConflict:
+                self.onConflict(conflicts)
+            else:
+                self.conflicts.extend(conflicts)
+        return applied
+
+    def fingerprint(self, password: Optional[str]) -> Optional[bytes]:
+        return None if password is None else hmac.digest(self.fingerprintKey, password.encode(), 'sha256')
+
+    def unsealed(self, secret: Any) -> Optional[str]:
+        # Unlike getPassword, never fills the secret cache.
+        if secret is None or not self.sealer:
+            return secret
+        return self.sealer.unseal(secret)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        if not self.writer:
+            return True
+        return self.writer.flush(timeout)
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        stopped = True
+        try:
+            if self.writer:
+                # A failed save is still raised, but only once the writer is stopped.
+                try:
+                    self.flush(timeout)
+                finally:
+                    stopped = self.writer.close(timeout)
+        finally:
+            # While the writer is still running it needs the files; the caller can close again.
+            if stopped:
+                self.storage.close()
+                if self.merkle:
+                    self.merkle.close()
+                self.vaultLock.close()
+        return stopped
+
+    @contextmanager
+    def batch(self) -> Iterator[StoreBatch]:
+        if self.activeBatch:
+            # Nested batches fold into the outer one and commit with it.
+            yield self.activeBatch
+            return
+        batch = StoreBatch()
+        if self.storage.paged:
+            # Paged vaults roll back by dropping what they decrypted instead of copying
+            # the vault, so nothing written before the batch may still be in flight.
+            self.flush()
+            previous = None
+        else:
+            previous = {website: dict(entries) for website, entries in self.passwords.items()}
+        dirty = dict(self.dirty)
+        self.activeBatch = batch
+        try:
+            yield batch
+            self.activeBatch = None
+            if batch.operations:
+                self.commit(batch.operations)
+            batch.committed = True
+        except BaseException:
+            self.activeBatch = None
+            self.healthAudit = None
+            self.dirty = dirty
+            if self.storage.paged:
+                self.passwords.reset()
+                self.searchIndex = None
+            else:
+                with self.lock:
+                    self.passwords.clear()
+                    self.passwords.update(previous)
+                self.searchIndex = self.buildSearchIndex()
+            if self.secretCache:
+                self.secretCache.clear()
+            raise
+
+    def applyChange(self, operation: Operation, local: bool = True) -> bool:
+        if self.secretCache:
+            for field in ('email', 'oldEmail', 'newEmail'):
+                if field in operation:
+                    self.secretCache.discard((operation['website'], operation[field]))
+        self.indexChange(operation)
+        plaintextOperation = operation
+        if self.sealer and 'password' in operation:
+            operation = dict(operation, password=self.sealer.seal(operation['password']))
+        with self.lock:
+            replaced: Dict[Account, Optional[bytes]] = {}
+            if local:
+                for field in ('email', 'oldEmail', 'newEmail'):
+                    account = (operation['website'], operation.get(field))
+                    if field in operation and account not in self.dirty:
+                        replaced[account] = self.fingerprint(self.unsealed(self.passwords.get(account[0], {}).get(account[1])))
+            changed = applyOperation(self.passwords, operation)
+            if changed:
+                self.dirty.update(replaced)
+                if self.healthAudit:
+                    self.healthAudit.applyChange(plaintextOperation)
+            return changed
+
+    def indexChange(self, operation: Operation) -> None:
+        if self.searchIndex is None:
+            return
+        op = operation['op']
+        website = operation['website']
+        entries = self.passwords.get(website)
+        if op == 'add' and (entries is None or operation['email'] not in entries):
+            if entries is None:
+                self.searchIndex.addWebsite(website)
+            self.searchIndex.addEmail(website, operation['email'])
+        elif op == 'delete' and entries is not None and operation['email'] in entries:
+            self.searchIndex.removeEmail(website, operation['email'])
+            if len(entries) == 1:
+                self.searchIndex.removeWebsite(website)
+        elif op == 'updateEmail' and entries is not None and operation['oldEmail'] in entries \
+                and operation['oldEmail'] != operation['newEmail']:
+            self.searchIndex.removeEmail(website, operation['oldEmail'])
+            if operation['newEmail'] not in entries:
+                self.searchIndex.addEmail(website, operation['newEmail'])
+
+    def buildSearchIndex(self) -> SearchIndex:
+        index = SearchIndex.build(self.passwords)
+        if self.backgroundSearch:
+            index.buildTrigramsInBackground()
+        return index
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[str]:
+        if self.searchIndex is None:
+            self.searchIndex = self.buildSearchIndex()
+        return self.searchIndex.search(query, limit)
+
+    def auditHealth(self) -> HealthReport:
+        with self.lock:
+            if self.healthAudit is None:
+                self.healthAudit = PasswordAudit.build(self.plaintextPasswords())
+            return self.healthAudit.report()
+
+    def convertFormat(self, path: str) -> bool:
+        if path == self.dataPath:
+            return False
+        self.flush()
+        previousPath = self.dataPath
+        journal = None
+        with self.exclusiveAccess(), self.lock:
+            passwords = {website: dict(entries) for website, entries in self.passwords.items()}
+            self.storage.close()
+            self.storage = openStorage(path, self.encryptionManager)
+            self.passwords = passwords
+            self.dataPath = path
+            if self.storage.paged:
+                journal, self.journal = self.journal, None
+            elif self.journal:
+                self.journal.snapshotPath = path
+            self.savePasswords()
+            self.dirty.clear()
+            if self.storage.paged:
+                self.passwords = self.loadPasswords()
+                self.passwords.regroup(passwords)
+            self.recordWrite(self.merkleValues([]))
+        # The new file already holds everything, so a crash here just leaves stale files.
+        if journal:
+            os.remove(journal.journalPath)
+        if os.path.exists(previousPath):
+            os.remove(previousPath)
+        return True
+
+    def changeKdf(self, kdfParams: Dict[str, Any]) -> None:
+        # Staged and swapped like a rekey, so a crash at any point leaves either the
+        # old vault and header or the new ones, never a vault the header cannot open.
+        from .encryption import rekeyDirectory
+        from .rekey import discardRekey, finishPendingRekey, saveState
+        self.flush()
+        manager = self.encryptionManager
+        rekeyDir = rekeyDirectory(manager.hashPasswordPath)
+        with self.exclusiveAccess():
+            with self.lock:
+                snapshot = {website: dict(entries) for website, entries in self.passwords.items()}
+                self.dirty.clear()
+            plaintext = self.plaintextPasswords(snapshot)
+            # Whatever an interrupted rekey left here is for the old KDF and can only be restarted.
+            discardRekey(rekeyDir)
+            os.makedirs(rekeyDir)
+            staged = EncryptionManager(manager.username, manager.password, manager.saltPath,
+                                       os.path.join(rekeyDir, os.path.basename(manager.hashPasswordPath)), kdfParams)
+            staged.saveHashedPassword()
+            stagedPath = os.path.join(rekeyDir, os.path.basename(self.dataPath))
+            stagedStorage = openStorage(stagedPath, staged)
+            try:
+                stagedStorage.write(plaintext)
+            finally:
+                stagedStorage.close()
+            swaps = [(stagedPath, self.dataPath)]
+            if self.journal:
+                # The journal's records are already in the new snapshot.
+                stagedJournal = os.path.join(rekeyDir, os.path.basename(self.journal.journalPath))
+                writeJournalHeader(stagedJournal, snapshotFingerprint(stagedPath))
+                swaps.append((stagedJournal, self.journal.journalPath))
+            swaps.append((staged.hashPasswordPath, manager.hashPasswordPath))
+            # The open database has to let go of the file before it is replaced.
+            self.storage.close()
+            saveState(rekeyDir, {'phase': 'swapping', 'removes': [],
+                                 'swaps': [(os.path.abspath(source), os.path.abspath(target)) for source, target in swaps]})
+            finishPendingRekey(rekeyDir, manager.saltPath, manager.hashPasswordPath)
+            manager.deriveKeys(kdfParams)
+            manager.header = manager.loadHeader()
+            self.storage = openStorage(self.dataPath, manager)
+            with self.lock:
+                self.passwords = self.loadPasswords()
+            if self.merkle:
+                # Keyed by the old master key; the next merge rebuilds it under the new one.
+                self.merkle.close()
+                self.merkle = None
 
     def addPassword(self, website: str, email: str, password: str):
-        if website not in self.passwords:
-            self.passwords[website] = {}
-        self.passwords[website][email] = password
-        self.savePasswords()
+        operation = {'op': 'add', 'website': website, 'email': email, 'password': password}
+        self.applyChange(operation)
+        self.persist(operation)
 
     def getEmails(self, website: str) -> list[str]:
         return list(self.passwords.get(website, {}).keys())
 
     def getPassword(self, website: str, email: str) -> Optional[str]:
-        return self.passwords.get(website, {}).get(email)
+        secret = self.passwords.get(website, {}).get(email)
+        if secret is None or not self.sealer:
+            return secret
+        if self.secretCache:
+            password = self.secretCache.get((website, email))
+            if password is not None:
+                return password
+        password = self.sealer.unseal(secret)
+        if self.secretCache:
+            self.secretCache.put((website, email), password)
+        return password
 
     def deletePassword(self, website: str, email: str) -> None:
-        if website in self.passwords and email in self.passwords[website]:
-            del self.passwords[website][email]
-            if not self.passwords[website]:
-                del self.passwords[website]
-            self.savePasswords()
+        operation = {'op': 'delete', 'website': website, 'email': email}
+        if self.applyChange(operation):
+            self.persist(operation)
 
     def updatePassword(self, website: str, email: str, newPassword: str) -> None:
-        if website in self.passwords and email in self.passwords[website]:
-            self.passwords[website][email] = newPassword
-            self.savePasswords()
-    
+        operation = {'op': 'update', 'website': website, 'email': email, 'password': newPassword}
+        if self.applyChange(operation):
+            self.persist(operation)
+
     def updateEmail(self, website: str, oldEmail: str, newEmail: str) -> None:
-        if website in self.passwords and oldEmail in self.passwords[website]:
-            self.passwords[website][newEmail] = self.passwords[website][oldEmail]
-            del self.passwords[website][oldEmail]
-            self.savePasswords()
+        operation = {'op': 'updateEmail', 'website': website, 'oldEmail': oldEmail, 'newEmail': newEmail}
+        if self.applyChange(operation):
+            self.persist(operation)
 
     def getPreFilledEmail(self) -> str:
         return self.encryptionManager.returnUsername()+'@gmail.com'
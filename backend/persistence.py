@@ -0,0 +1,108 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, Iterator, Optional
+
+# How long the writer waits after the first change, so a burst of edits lands in one write.
+WRITE_COALESCE_DELAY: float = 0.05
+
+
+class PersistenceError(Exception):
+    pass
+
+
+@contextmanager
+def atomicWriter(path: str) -> Iterator[BinaryIO]:
+    # Streams into a temporary file and only replaces the target once it is complete.
+    tempPath = path + '.tmp'
+    try:
+        with open(tempPath, 'wb') as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        if os.path.exists(tempPath):
+            os.remove(tempPath)
+        raise
+    os.replace(tempPath, path)
+    if hasattr(os, 'O_DIRECTORY'):
+        # Make the rename itself durable.
+        directory = os.open(os.path.dirname(path) or '.', os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+
+def writeAtomically(path: str, data: bytes) -> None:
+    with atomicWriter(path) as f:
+        f.write(data)
+
+
+class PersistenceWorker:
+    def __init__(
+        self,
+        write: Callable[[], None],
+        onStatus: Optional[Callable[[Optional[BaseException]], None]] = None,
+        coalesceDelay: float = WRITE_COALESCE_DELAY
+    ):
+        self.write = write
+        self.onStatus = onStatus
+        self.coalesceDelay = coalesceDelay
+        self.condition = threading.Condition()
+        self.requested = 0
+        self.completed = 0
+        self.error: Optional[BaseException] = None
+        self.stopping = False
+        self.thread = threading.Thread(target=self.run, name='vault-writer', daemon=True)
+        self.thread.start()
+
+    def schedule(self) -> None:
+        with self.condition:
+            self.requested += 1
+            self.condition.notify_all()
+
+    def run(self) -> None:
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.requested > self.completed or self.stopping)
+                if self.requested == self.completed:
+                    return
+                stopping = self.stopping
+            if not stopping:
+                time.sleep(self.coalesceDelay)
+            with self.condition:
+                target = self.requested
+            try:
+                self.write()
+                error = None
+            except Exception as e:
+                error = e
+            with self.condition:
+                self.completed = target
+                self.error = error
+                self.condition.notify_all()
+            if self.onStatus:
+                try:
+                    self.onStatus(error)
+                except Exception:
+                    # The writer has to outlive a broken callback, or flush() and close() wait forever.
+                    logging.getLogger(__name__).exception("Save status callback failed.")
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        with self.condition:
+            target = self.requested
+            if not self.condition.wait_for(lambda: self.completed >= target, timeout):
+                return False
+            if self.error:
+                raise PersistenceError("Saving the vault failed.") from self.error
+            return True
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        self.thread.join(timeout)
+        return not self.thread.is_alive()
@@ -0,0 +1,326 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from .chunkedVault import (CHUNK_MAGIC, CHUNK_VERSION, ChunkedVault, bucketCountFor, bucketHasher,
+                           directorySlotSize, isChunkedVault, packDirectory, sealDirectory, sealRecords)
+from .encryption import REKEY_STATE_NAME, EncryptionManager, rekeyDirectory
+from .journal import JOURNAL_PATH, snapshotFingerprint, writeJournalHeader
+from .passwordManager import PasswordStore
+from .persistence import writeAtomically
+from .storage import openStorage
+from .vaultFormat import (FILE_SALT_SIZE, FRAME_SIZE, VAULT_MAGIC, VAULT_PATH, VAULT_VERSION, buildPreamble,
+                          deriveFileKey, isSqliteVault, readVault, recordSize, sealFrame, vaultHeader)
+
+# The working-directory vault's; other copies keep theirs next to their own master hash.
+REKEY_DIR: str = rekeyDirectory('data/masterHash')
+# Work is handed to the pool in units of about this much plaintext, and progress
+# is made durable every REKEY_CHECKPOINT_BYTES so an interrupted rekey can resume.
+REKEY_UNIT_BYTES: int = 1024 * 1024
+REKEY_CHECKPOINT_BYTES: int = 8 * 1024 * 1024
+
+Record = Tuple[str, str, str]
+
+
+class RekeyError(Exception):
+    pass
+
+
+def sealFrameUnit(task: Tuple[bytes, bytes, int, List[List[Record]], bool]) -> bytes:
+    # Runs in a worker process; AESGCM objects do not pickle, so the raw key travels instead.
+    key, preamble, counter, frames, lastUnit = task
+    aead = AESGCM(key)
+    return b''.join(sealFrame(aead, preamble, counter + index, lastUnit and index == len(frames) - 1, records)
+                    for index, records in enumerate(frames))
+
+
+def sealChunkUnit(task: Tuple[bytes, bytes, List[Tuple[int, List[Record]]]]) -> List[Tuple[bytes, int]]:
+    key, preamble, buckets = task
+    aead = AESGCM(key)
+    return [sealRecords(aead, preamble, bucket, records) for bucket, records in buckets]
+
+
+def splitUnits(items: List[Any], sizeOf: Callable[[Any], int], unitBytes: int) -> List[List[Any]]:
+    units: List[List[Any]] = [[]]
+    size = 0
+    for item in items:
+        if size >= unitBytes:
+            units.append([])
+            size = 0
+        units[-1].append(item)
+        size += sizeOf(item)
+    return units
+
+
+def recordsSize(records: List[Record]) -> int:
+    return sum(recordSize(*record) for record in records)
+
+
+def loadState(directory: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(directory, REKEY_STATE_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def saveState(directory: str, state: Dict[str, Any]) -> None:
+    writeAtomically(os.path.join(directory, REKEY_STATE_NAME), json.dumps(state).encode())
+
+
+def discardRekey(directory: str = REKEY_DIR) -> None:
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def finishPendingRekey(directory: str, saltPath: str, hashPasswordPath: str) -> bool:
+    # Every step is idempotent, so a swap interrupted at any point is completed on the next start.
+    state = loadState(directory)
+    if state is None or state['phase'] != 'swapping':
+        return False
+    targets = {os.path.abspath(targetPath) for _, targetPath in state['swaps']}
+    directories = {os.path.dirname(os.path.abspath(path)) for path in (saltPath, hashPasswordPath)}
+    if os.path.abspath(hashPasswordPath) not in targets or \
+            any(os.path.dirname(target) not in directories for target in targets):
+        # Left for another copy of the vault; replaying it here would overwrite the wrong files.
+        return False
+    for stagedPath, targetPath in state['swaps']:
+        if os.path.exists(stagedPath):
+            os.replace(stagedPath, targetPath)
+    for path in state['removes']:
+        if os.path.exists(path):
+            os.remove(path)
+    discardRekey(directory)
+    return True
+
+
+class VaultRekey:
+    def __init__(
+        self,
+        passwordStore: PasswordStore,
+        newUsername: str,
+        newPassword: str,
+        kdfParams: Optional[Dict[str, Any]] = None,
+        workers: Optional[int] = None,
+        onProgress: Optional[Callable[[int, int], None]] = None
+    ):
+        self.passwordStore = passwordStore
+        self.newUsername = newUsername
+        self.newPassword = newPassword
+        self.kdfParams = kdfParams or passwordStore.encryptionManager.kdfParams
+        self.workers = workers or os.cpu_count() or 1
+        self.onProgress = onProgress
+        self.chunked = isChunkedVault(passwordStore.dataPath)
+        self.sqlite = isSqliteVault(passwordStore.dataPath)
+        # Legacy JSON vaults come out of a rekey in the binary format.
+        self.targetPath = passwordStore.dataPath if self.chunked or self.sqlite else os.path.join(passwordStore.root, VAULT_PATH)
+        self.rekeyDir = rekeyDirectory(passwordStore.encryptionManager.hashPasswordPath)
+        self.stagedPath = os.path.join(self.rekeyDir, os.path.basename(self.targetPath))
+        self.report: Dict[str, Any] = {'workers': self.workers}
+
+    def run(self) -> Dict[str, Any]:
+        store = self.passwordStore
+        store.flush()
+        # Other instances cannot write from the snapshot until the swap, so no edit
+        # made elsewhere is lost with the old vault.
+        with store.vaultLock:
+            store.syncExternalChanges()
+            return self.rekey()
+
+    def rekey(self) -> Dict[str, Any]:
+        store = self.passwordStore
+        with store.lock:
+            snapshot = {website: dict(entries) for website, entries in store.passwords.items()}
+        plaintext = store.plaintextPasswords(snapshot)
+        records = sorted((website, email, password) for website, entries in plaintext.items() for email, password in entries.items())
+        self.report['records'] = len(records)
+
+        os.makedirs(self.rekeyDir, exist_ok=True)
+        start = time.perf_counter()
+        self.newManager = EncryptionManager(self.newUsername, self.newPassword, os.path.join(self.rekeyDir, 'hashSalt'),
+                                            os.path.join(self.rekeyDir, 'masterHash'), self.kdfParams)
+        self.newManager.saveHashedPassword()
+        if not self.newManager.verifyPassword(self.newUsername, self.newPassword):
+            raise RekeyError("The new credentials do not match the interrupted rekey; restart it to start over.")
+        self.report['kdfSeconds'] = time.perf_counter() - start
+
+        # Keyed with the new key, so the state file says nothing about the vault contents.
+        digest = hashlib.sha256(json.dumps(records).encode()).digest()
+        fingerprint = hmac.new(self.newManager.vaultKey, digest, hashlib.sha256).hexdigest()
+        state = loadState(self.rekeyDir)
+        if state is None or state['fingerprint'] != fingerprint or state['targetPath'] != self.targetPath:
+            state = {
+                'phase': 'staging',
+                'targetPath': self.targetPath,
+                'fingerprint': fingerprint,
+                'fileSalt': base64.b64encode(os.urandom(FILE_SALT_SIZE)).decode(),
+                'unitsDone': 0,
+                'offset': 0,
+                'directory': []
+            }
+        self.report['resumedUnits'] = state['unitsDone']
+
+        start = time.perf_counter()
+        if self.chunked:
+            self.stageChunks(records, state)
+        elif self.sqlite:
+            self.stageDatabase(plaintext)
+        else:
+            self.stageFrames(records, state)
+        self.report['encryptSeconds'] = time.perf_counter() - start
+        self.report['bytes'] = os.path.getsize(self.stagedPath)
+
+        start = time.perf_counter()
+        self.verify(plaintext)
+        self.report['verifySeconds'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.swap(state)
+        self.report['swapSeconds'] = time.perf_counter() - start
+        return self.report
+
+    def execute(self, worker: Callable[[Any], Any], tasks: List[Any]) -> Any:
+        if self.workers <= 1 or len(tasks) <= 1:
+            return map(worker, tasks)
+        self.pool = ProcessPoolExecutor(self.workers)
+        return self.pool.map(worker, tasks)
+
+    def stageUnits(self, state: Dict[str, Any], headerSize: int, worker: Callable[[Any], Any], tasks: List[Any],
+                   unitSizes: List[int], written: Callable[[Any, Any], None]) -> None:
+        self.pool: Optional[ProcessPoolExecutor] = None
+        mode = 'r+b' if state['unitsDone'] and os.path.exists(self.stagedPath) else 'w+b'
+        if mode == 'w+b':
+            state.update(unitsDone=0, offset=headerSize, directory=[])
+        with open(self.stagedPath, mode) as f:
+            if mode == 'w+b':
+                self.writeHeader(f)
+            else:
+                # Anything past the last checkpoint may be torn, so it is redone.
+                f.truncate(state['offset'])
+                f.seek(state['offset'])
+            sinceCheckpoint = 0
+            try:
+                for index, result in enumerate(self.execute(worker, tasks[state['unitsDone']:]), state['unitsDone']):
+                    written(f, result)
+                    sinceCheckpoint += unitSizes[index]
+                    if sinceCheckpoint >= REKEY_CHECKPOINT_BYTES:
+                        f.flush()
+                        os.fsync(f.fileno())
+                        saveState(self.rekeyDir, dict(state, unitsDone=index + 1, offset=f.tell()))
+                        sinceCheckpoint = 0
+                    if self.onProgress:
+                        self.onProgress(index + 1, len(tasks))
+                    state.update(unitsDone=index + 1, offset=f.tell())
+            finally:
+                if self.pool:
+                    self.pool.shutdown(cancel_futures=True)
+            self.finishStaged(f, state)
+            f.flush()
+            os.fsync(f.fileno())
+        self.report['units'] = len(tasks)
+
+    def stageFrames(self, records: List[Record], state: Dict[str, Any]) -> None:
+        fileSalt = base64.b64decode(state['fileSalt'])
+        self.preamble = buildPreamble(VAULT_MAGIC, VAULT_VERSION, vaultHeader(self.newManager, fileSalt))
+        key = deriveFileKey(self.newManager.vaultKey, fileSalt)
+        frames = splitUnits(records, lambda record: recordSize(*record), FRAME_SIZE)
+        units = splitUnits(frames, recordsSize, REKEY_UNIT_BYTES)
+        tasks = []
+        counter = 0
+        for index, unit in enumerate(units):
+            tasks.append((key, self.preamble, counter, unit, index == len(units) - 1))
+            counter += len(unit)
+        self.stageUnits(state, len(self.preamble), sealFrameUnit, tasks,
+                        [sum(map(recordsSize, unit)) for unit in units], lambda f, sealed: f.write(sealed))
+
+    def stageChunks(self, records: List[Record], state: Dict[str, Any]) -> None:
+        fileSalt = base64.b64decode(state['fileSalt'])
+        buckets = bucketCountFor(len(records))
+        self.preamble = buildPreamble(CHUNK_MAGIC, CHUNK_VERSION, vaultHeader(self.newManager, fileSalt, buckets=buckets))
+        key = deriveFileKey(self.newManager.vaultKey, fileSalt)
+        bucketHash = bucketHasher(self.newManager.vaultKey, fileSalt)
+        grouped: List[List[Record]] = [[] for _ in range(buckets)]
+        for record in records:
+            grouped[bucketHash(record[0]) % buckets].append(record)
+        units = splitUnits(list(enumerate(grouped)), lambda item: recordsSize(item[1]), REKEY_UNIT_BYTES)
+        self.slotSize = directorySlotSize(buckets)
+
+        def written(f, sealed: List[Tuple[bytes, int]]) -> None:
+            for chunk, count in sealed:
+                state['directory'].append((f.tell() if chunk else 0, len(chunk), count))
+                f.write(chunk)
+        self.stageUnits(state, len(self.preamble) + 2 * self.slotSize, sealChunkUnit,
+                        [(key, self.preamble, unit) for unit in units],
+                        [sum(recordsSize(bucketRecords) for _, bucketRecords in unit) for unit in units], written)
+
+    def stageDatabase(self, plaintext: Dict[str, Dict[str, str]]) -> None:
+        # Written in one transaction, so an interrupted attempt leaves nothing to resume.
+        for path in (self.stagedPath, self.stagedPath + '-wal', self.stagedPath + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+        openStorage(self.stagedPath, self.newManager).write(plaintext)
+        self.report['units'] = 1
+
+    def writeHeader(self, f) -> None:
+        f.write(self.preamble)
+        if self.chunked:
+            f.write(bytes(2 * self.slotSize))
+
+    def finishStaged(self, f, state: Dict[str, Any]) -> None:
+        if self.chunked:
+            f.seek(len(self.preamble))
+            f.write(sealDirectory(AESGCM(deriveFileKey(self.newManager.vaultKey, base64.b64decode(state['fileSalt']))),
+                                  self.preamble, 0, 0, packDirectory(state['directory'])))
+
+    def verify(self, plaintext: Dict[str, Dict[str, str]]) -> None:
+        # Read back through the normal readers with the new key before anything is swapped.
+        if self.chunked:
+            vault = ChunkedVault(self.stagedPath, self.newManager)
+            try:
+                staged: Dict[str, Dict[str, str]] = {}
+                for bucket in range(vault.buckets):
+                    staged.update(vault.readBucket(bucket))
+            finally:
+                vault.close()
+        elif self.sqlite:
+            staged = openStorage(self.stagedPath, self.newManager).read()
+        else:
+            with open(self.stagedPath, 'rb') as f:
+                staged = readVault(f, self.newManager)
+        if staged != plaintext:
+            raise RekeyError("The re-encrypted vault does not match the original; nothing was changed.")
+
+    def swap(self, state: Dict[str, Any]) -> None:
+        store = self.passwordStore
+        oldManager = store.encryptionManager
+        swaps = [(self.stagedPath, self.targetPath)]
+        if store.journal:
+            # The old journal's records are already in the new snapshot.
+            stagedJournal = os.path.join(self.rekeyDir, os.path.basename(JOURNAL_PATH))
+            writeJournalHeader(stagedJournal, snapshotFingerprint(self.stagedPath))
+            swaps.append((stagedJournal, store.journal.journalPath))
+        swaps.append((self.newManager.saltPath, oldManager.saltPath))
+        swaps.append((self.newManager.hashPasswordPath, oldManager.hashPasswordPath))
+        removes = [store.dataPath] if store.dataPath != self.targetPath else []
+        # Absolute, so whichever working directory the swap is finished from, it lands on these files.
+        swaps = [(os.path.abspath(staged), os.path.abspath(target)) for staged, target in swaps]
+        removes = [os.path.abspath(path) for path in removes]
+        store.close()
+        saveState(self.rekeyDir, dict(state, phase='swapping', swaps=swaps, removes=removes))
+        finishPendingRekey(self.rekeyDir, oldManager.saltPath, oldManager.hashPasswordPath)
+
+
+def rekeyVault(
+    passwordStore: PasswordStore,
+    newUsername: str,
+    newPassword: str,
+    kdfParams: Optional[Dict[str, Any]] = None,
+    workers: Optional[int] = None,
+    onProgress: Optional[Callable[[int, int], None]] = None
+) -> Dict[str, Any]:
+    return VaultRekey(passwordStore, newUsername, newPassword, kdfParams, workers, onProgress).run()
@@ -0,0 +1,239 @@
+import heapq
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+from itertools import chain
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+TRIGRAM_SIZE: int = 3
+# Sorts after every string that starts with a given prefix.
+PREFIX_SENTINEL: str = '\U0010ffff'
+FUZZY_THRESHOLD: float = 0.3
+# Trigrams shared by most terms (".co", "com", "gma", ...) say nothing about
+# similarity, so fuzzy matching skips posting lists longer than this.
+FUZZY_POSTING_LIMIT: int = 5000
+
+
+def trigrams(term: str) -> Set[str]:
+    return {term[i:i + TRIGRAM_SIZE] for i in range(len(term) - TRIGRAM_SIZE + 1)}
+
+
+class TrigramTable:
+    def __init__(self, terms: Iterable[str] = ()):
+        self.postings: Dict[str, Set[str]] = {}
+        for term in terms:
+            self.add(term)
+
+    def add(self, term: str) -> None:
+        for trigram in trigrams(term):
+            self.postings.setdefault(trigram, set()).add(term)
+
+    def remove(self, term: str) -> None:
+        for trigram in trigrams(term):
+            posting = self.postings.get(trigram)
+            if posting is not None:
+                posting.discard(term)
+                if not posting:
+                    del self.postings[trigram]
+
+    def containing(self, query: str) -> List[str]:
+        postings = [self.postings.get(trigram) for trigram in trigrams(query)]
+        if not postings or None in postings:
+            return []
+        candidates = set.intersection(*postings) if len(postings) > 1 else postings[0]
+        if len(query) == TRIGRAM_SIZE:
+            return list(candidates)
+        return [term for term in candidates if query in term]
+
+    def similar(self, query: str) -> List[Tuple[float, str]]:
+        queryTrigrams = trigrams(query)
+        shared: Counter = Counter()
+        for trigram in queryTrigrams:
+            posting = self.postings.get(trigram)
+            if posting is not None and len(posting) <= FUZZY_POSTING_LIMIT:
+                shared.update(posting)
+        matches = []
+        for term, count in shared.items():
+            score = count / len(queryTrigrams | trigrams(term))
+            if score >= FUZZY_THRESHOLD:
+                matches.append((score, term))
+        return matches
+
+
+class SearchIndex:
+    def __init__(self):
+        # Both lists stay sorted by their lowercase form, so prefix lookups are a bisect.
+        self.sortedWebsites: List[str] = []
+        self.sortedEmails: List[str] = []
+        self.websiteNames: Dict[str, List[str]] = {}
+        self.emailOwners: Dict[str, Dict[str, int]] = {}
+        # Trigram tables are the expensive part, so they are only built once a query
+        # needs substring or fuzzy matching, or ahead of that on a background thread.
+        self.websiteTrigrams: Optional[TrigramTable] = None
+        self.emailTrigrams: Optional[TrigramTable] = None
+        # Guards the term maps and tables against the background build. Terms added or
+        # removed while it runs are queued and replayed onto the finished tables.
+        self.lock = threading.RLock()
+        self.builder: Optional[threading.Thread] = None
+        self.pendingTerms: Optional[List[Tuple[str, bool, str]]] = None
+
+    @classmethod
+    def build(cls, passwords: Dict[str, Dict[str, object]]) -> 'SearchIndex':
+        index = cls()
+        for website, entries in passwords.items():
+            index.websiteNames.setdefault(website.lower(), []).append(website)
+            for email in entries:
+                owners = index.emailOwners.setdefault(email.lower(), {})
+                owners[website] = owners.get(website, 0) + 1
+        index.sortedWebsites = sorted(passwords, key=str.lower)
+        index.sortedEmails = sorted(index.emailOwners)
+        return index
+
+    def buildTrigrams(self) -> None:
+        with self.lock:
+            self.websiteTrigrams = TrigramTable(self.websiteNames)
+            self.emailTrigrams = TrigramTable(self.emailOwners)
+
+    def buildTrigramsInBackground(self) -> None:
+        with self.lock:
+            if self.websiteTrigrams is not None or self.builder is not None:
+                return
+            self.pendingTerms = []
+            websites, emails = list(self.websiteNames), list(self.emailOwners)
+        self.builder = threading.Thread(target=self.finishTrigrams, args=(websites, emails),
+                                        name='search-index', daemon=True)
+        self.builder.start()
+
+    def finishTrigrams(self, websites: List[str], emails: List[str]) -> None:
+        tables = {'website': TrigramTable(websites), 'email': TrigramTable(emails)}
+        with self.lock:
+            for kind, added, term in self.pendingTerms:
+                if added:
+                    tables[kind].add(term)
+                else:
+                    tables[kind].remove(term)
+            self.pendingTerms = None
+            self.websiteTrigrams, self.emailTrigrams = tables['website'], tables['email']
+
+    def changeTerm(self, kind: str, added: bool, term: str) -> None:
+        table = self.websiteTrigrams if kind == 'website' else self.emailTrigrams
+        if table is not None:
+            if added:
+                table.add(term)
+            else:
+                table.remove(term)
+        elif self.pendingTerms is not None:
+            self.pendingTerms.append((kind, added, term))
+
+    def addWebsite(self, website: str) -> None:
+        key = website.lower()
+        with self.lock:
+            insort(self.sortedWebsites, website, key=str.lower)
+            if key not in self.websiteNames:
+                self.websiteNames[key] = []
+                self.changeTerm('website', True, key)
+            self.websiteNames[key].append(website)
+
+    def removeWebsite(self, website: str) -> None:
+        key = website.lower()
+        with self.lock:
+            position = bisect_left(self.sortedWebsites, key, key=str.lower)
+            while self.sortedWebsites[position] != website:
+                position += 1
+            del self.sortedWebsites[position]
+            names = self.websiteNames[key]
+            names.remove(website)
+            if not names:
+                del self.websiteNames[key]
+                self.changeTerm('website', False, key)
+
+    def addEmail(self, website: str, email: str) -> None:
+        key = email.lower()
+        with self.lock:
+            owners = self.emailOwners.get(key)
+            if owners is None:
+                owners = self.emailOwners[key] = {}
+                insort(self.sortedEmails, key)
+                self.changeTerm('email', True, key)
+            owners[website] = owners.get(website, 0) + 1
+
+    def removeEmail(self, website: str, email: str) -> None:
+        key = email.lower()
+        with self.lock:
+            owners = self.emailOwners[key]
+            owners[website] -= 1
+            if not owners[website]:
+                del owners[website]
+            if not owners:
+                del self.emailOwners[key]
+                del self.sortedEmails[bisect_left(self.sortedEmails, key)]
+                self.changeTerm('email', False, key)
+
+    def websitePrefix(self, prefix: str) -> List[str]:
+        start = bisect_left(self.sortedWebsites, prefix, key=str.lower)
+        end = bisect_left(self.sortedWebsites, prefix + PREFIX_SENTINEL, lo=start, key=str.lower)
+        return self.sortedWebsites[start:end]
+
+    def emailPrefix(self, prefix: str) -> List[str]:
+        start = bisect_left(self.sortedEmails, prefix)
+        end = bisect_left(self.sortedEmails, prefix + PREFIX_SENTINEL, lo=start)
+        return self.sortedEmails[start:end]
+
+    def ownersOf(self, emails: Iterable[str]) -> Iterator[str]:
+        return (website for email in emails for website in self.emailOwners[email])
+
+    def containing(self, kind: str, query: str) -> List[str]:
+        table = self.websiteTrigrams if kind == 'website' else self.emailTrigrams
+        if table is None:
+            # Still being built in the background; a scan is slower, but never waits for it.
+            return [term for term in (self.websiteNames if kind == 'website' else self.emailOwners) if query in term]
+        return table.containing(query)
+
+    def tiers(self, query: str) -> Iterator[Tuple[Iterable[str], bool, Optional[Callable[[str], Any]]]]:
+        # Ranked tiers: website prefix, website substring, email prefix, email substring.
+        # Each says whether it still needs sorting, and by which key; later tiers are
+        # only computed if the earlier ones did not fill the limit.
+        yield self.websitePrefix(query), False, None
+        if len(query) >= TRIGRAM_SIZE:
+            yield chain.from_iterable(map(self.websiteNames.__getitem__, self.containing('website', query))), True, None
+        emailPrefixes = self.emailPrefix(query)
+        yield self.ownersOf(emailPrefixes), True, str.lower
+        if len(query) >= TRIGRAM_SIZE:
+            prefixSet = set(emailPrefixes)
+            yield self.ownersOf(term for term in self.containing('email', query) if term not in prefixSet), True, str.lower
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[str]:
+        query = query.lower()
+        if not query:
+            return self.sortedWebsites[:limit]
+        with self.lock:
+            if len(query) >= TRIGRAM_SIZE and self.websiteTrigrams is None and self.builder is None:
+                self.buildTrigrams()
+            results: List[str] = []
+            seen: Set[str] = set()
+            for tier, unsorted, sortKey in self.tiers(query):
+                if unsorted:
+                    # Past the limit only the first few of a large tier are ever shown.
+                    tier = sorted(set(tier), key=sortKey) if limit is None else heapq.nsmallest(limit, set(tier), key=sortKey)
+                for website in tier:
+                    if website not in seen:
+                        seen.add(website)
+                        results.append(website)
+                        if limit is not None and len(results) >= limit:
+                            return results
+            if results or len(query) < TRIGRAM_SIZE or self.websiteTrigrams is None:
+                # Fuzzy matches need the tables; while they build, there are none to offer yet.
+                return results
+            return self.fuzzy(query, limit)
+
+    def fuzzy(self, query: str, limit: Optional[int] = None) -> List[str]:
+        scores: Dict[str, float] = {}
+        for score, term in self.websiteTrigrams.similar(query):
+            for website in self.websiteNames[term]:
+                scores[website] = max(scores.get(website, 0.0), score)
+        for score, term in self.emailTrigrams.similar(query):
+            for website in self.emailOwners[term]:
+                # Website matches outrank equally similar email matches.
+                scores[website] = max(scores.get(website, 0.0), score * 0.9)
+        ranked = sorted(scores, key=lambda website: (-scores[website], website.lower()))
+        return ranked[:limit]
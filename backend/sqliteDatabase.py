@@ -0,0 +1,53 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator
+
+SELECT_META = "SELECT key, value FROM meta"
+SET_META = "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)"
+
+
+class SqliteDatabase:
+    # An SQLite file in WAL mode, so readers in other instances never wait on a writer.
+    # The connection is shared by the UI thread and the background writer; every use
+    # holds the lock. Subclasses keep a `meta` key/value table and fill in `prepare`.
+    def __init__(self, path: str, schema: Iterable[str]):
+        self.path = path
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        try:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=FULL")
+            with self.transaction():
+                for statement in schema:
+                    self.connection.execute(statement)
+                self.prepare()
+        except BaseException:
+            self.connection.close()
+            raise
+
+    def prepare(self) -> None:
+        # Runs in the transaction that creates the schema, for rows a new file needs.
+        pass
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        # BEGIN IMMEDIATE takes the write lock up front instead of failing on upgrade.
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+                self.connection.execute("COMMIT")
+            except BaseException:
+                # A COMMIT that failed, e.g. on a busy database, leaves the transaction open.
+                if self.connection.in_transaction:
+                    self.connection.execute("ROLLBACK")
+                raise
+
+    def meta(self) -> Dict[str, str]:
+        with self.lock:
+            return dict(self.connection.execute(SELECT_META).fetchall())
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
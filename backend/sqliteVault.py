@@ -0,0 +1,348 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+from collections.abc import MutableMapping
+from typing import TYPE_CHECKING, Any, Callable, ContextManager, Dict, Iterator, List, Optional, Tuple
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDFExpand
+from .journal import Operation
+from .sqliteDatabase import SET_META, SqliteDatabase
+from .storage import Passwords, Plaintext, VaultStorage, touchedAccounts
+from .vaultFormat import FILE_SALT_SIZE, VAULT_CIPHER, VaultFormatError, decodeFrame, encodeFrame, fileKey, vaultHeader
+from .vaultSync import Account, diffPasswords
+
+if TYPE_CHECKING:
+    from .encryption import EncryptionManager
+
+SQLITE_FORMAT: str = 'sqlite'
+SQLITE_VERSION: int = 1
+NONCE_SIZE: int = 12
+KEYED_HASH_SIZE: int = 16
+
+# One row per account. `site` and `account` are keyed hashes of the website and of
+# website+email, so a lookup finds its rows through the primary key without
+# decrypting anything. A deleted account keeps its row with a NULL `sealed`, so
+# other instances see the deletion in the rows written since their last version.
+SCHEMA: Tuple[str, ...] = (
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS entries (site BLOB NOT NULL, account BLOB NOT NULL, version INTEGER NOT NULL, "
+    "sealed BLOB, PRIMARY KEY (site, account)) WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS entriesByVersion ON entries (version)"
+)
+# Fixed statement strings, so the connection's statement cache prepares each one once.
+SELECT_WEBSITE = "SELECT account, sealed FROM entries WHERE site = ? AND sealed IS NOT NULL"
+SELECT_ALL = "SELECT site, account, sealed FROM entries WHERE sealed IS NOT NULL"
+SELECT_SINCE = "SELECT site, account, sealed FROM entries WHERE version > ?"
+UPSERT_ENTRY = "INSERT OR REPLACE INTO entries (site, account, version, sealed) VALUES (?, ?, ?, ?)"
+DELETE_ALL = "DELETE FROM entries"
+
+Row = Tuple[bytes, bytes, Optional[bytes]]
+
+
+def siteKey(vaultKey: bytes, fileSalt: bytes) -> bytes:
+    return HKDFExpand(algorithm=hashes.SHA256(), length=32, info=b'vault-site' + fileSalt,
+                      backend=default_backend()).derive(vaultKey)
+
+
+def siteHash(hashKey: bytes, website: str) -> bytes:
+    return hashlib.blake2b(website.encode(), key=hashKey, digest_size=KEYED_HASH_SIZE, person=b'site').digest()
+
+
+def accountHash(hashKey: bytes, website: str, email: str) -> bytes:
+    return hashlib.blake2b(website.encode() + b'\x00' + email.encode(), key=hashKey,
+                           digest_size=KEYED_HASH_SIZE, person=b'account').digest()
+
+
+def sealRow(aead: AESGCM, site: bytes, account: bytes, website: str, email: str, password: str) -> bytes:
+    # The row's keys are the AAD, so a sealed value cannot be moved to another row.
+    nonce = os.urandom(NONCE_SIZE)
+    return nonce + aead.encrypt(nonce, encodeFrame([(website, email, password)]), site + account)
+
+
+class SqliteVault(SqliteDatabase):
+    # The `version` meta value counts commits and `epoch` changes on every full rewrite;
+    # together they are the vault's signature.
+    def __init__(self, path: str, encryptionManager: 'EncryptionManager'):
+        self.encryptionManager = encryptionManager
+        super().__init__(path, SCHEMA)
+        try:
+            self.readHeader()
+        except BaseException:
+            self.connection.close()
+            raise
+
+    def prepare(self) -> None:
+        if 'header' not in self.meta():
+            self.writeHeader(os.urandom(FILE_SALT_SIZE), 0)
+
+    def writeHeader(self, fileSalt: bytes, version: int) -> None:
+        header = vaultHeader(self.encryptionManager, fileSalt, format=SQLITE_FORMAT, version=SQLITE_VERSION)
+        self.connection.executemany(SET_META, [('header', header.decode()), ('version', str(version)),
+                                               ('epoch', os.urandom(8).hex()), ('commit', os.urandom(8).hex())])
+
+    def readHeader(self) -> None:
+        header = json.loads(self.meta()['header'])
+        if header.get('format') != SQLITE_FORMAT or header.get('cipher') != VAULT_CIPHER:
+            raise VaultFormatError("Not an SQLite vault.")
+        if header.get('version') != SQLITE_VERSION:
+            raise VaultFormatError(f"Unsupported SQLite vault version: {header.get('version')}")
+        self.fileSalt = base64.b64decode(header['fileSalt'])
+        self.aead = fileKey(self.encryptionManager.vaultKey, self.fileSalt)
+        self.hashKey = siteKey(self.encryptionManager.vaultKey, self.fileSalt)
+
+    def signature(self) -> Tuple[str, int]:
+        meta = self.meta()
+        return meta['epoch'], int(meta['version'])
+
+    def contentId(self) -> str:
+        # `version` alone repeats in two copies edited apart; `commit` is new on every write.
+        meta = self.meta()
+        return f"{meta['epoch']}:{meta['version']}:{meta.get('commit', '')}"
+
+    def siteHash(self, website: str) -> bytes:
+        return siteHash(self.hashKey, website)
+
+    def accountHash(self, website: str, email: str) -> bytes:
+        return accountHash(self.hashKey, website, email)
+
+    def seal(self, site: bytes, account: bytes, website: str, email: str, password: str) -> bytes:
+        return sealRow(self.aead, site, account, website, email, password)
+
+    def unseal(self, site: bytes, account: bytes, sealed: bytes) -> Tuple[str, str, str]:
+        try:
+            plaintext = self.aead.decrypt(sealed[:NONCE_SIZE], sealed[NONCE_SIZE:], site + account)
+        except InvalidTag:
+            raise VaultFormatError("Vault entry failed authentication; wrong key or corrupted file.") from None
+        return next(iter(decodeFrame(plaintext)))
+
+    def readWebsite(self, website: str) -> Dict[str, str]:
+        site = self.siteHash(website)
+        with self.lock:
+            rows = self.connection.execute(SELECT_WEBSITE, (site,)).fetchall()
+        entries = {}
+        for account, sealed in rows:
+            _, email, password = self.unseal(site, account, sealed)
+            entries[email] = password
+        return entries
+
+    def readAll(self) -> Plaintext:
+        with self.lock:
+            rows = self.connection.execute(SELECT_ALL).fetchall()
+        passwords: Plaintext = {}
+        for site, account, sealed in rows:
+            website, email, password = self.unseal(site, account, sealed)
+            entries = passwords.get(website)
+            if entries is None:
+                entries = passwords[website] = {}
+            entries[email] = password
+        return passwords
+
+    def changesSince(self, version: int) -> List[Row]:
+        with self.lock:
+            return self.connection.execute(SELECT_SINCE, (version,)).fetchall()
+
+    def write(self, entries: List[Tuple[str, str, Optional[str]]]) -> None:
+        # A None password deletes the account.
+        rows = []
+        for website, email, password in entries:
+            site, account = self.siteHash(website), self.accountHash(website, email)
+            rows.append((site, account, None if password is None else self.seal(site, account, website, email, password)))
+        with self.transaction() as connection:
+            version = int(self.meta()['version']) + 1
+            connection.executemany(UPSERT_ENTRY, [(site, account, version, sealed) for site, account, sealed in rows])
+            connection.executemany(SET_META, [('version', str(version)), ('commit', os.urandom(8).hex())])
+
+    def rewrite(self, passwords: Plaintext) -> None:
+        # Also how a changed master key reaches the vault: the header and every keyed
+        # hash are redone under the current key, in one transaction. The records are
+        # copied first, since `passwords` may be this vault's own lazy mapping.
+        records = [(website, email, password) for website, entries in passwords.items()
+                   for email, password in entries.items()]
+        vaultKey = self.encryptionManager.vaultKey
+        aead, hashKey = fileKey(vaultKey, self.fileSalt), siteKey(vaultKey, self.fileSalt)
+        with self.transaction() as connection:
+            version = int(self.meta()['version']) + 1
+            self.writeHeader(self.fileSalt, version)
+            connection.execute(DELETE_ALL)
+            connection.executemany(UPSERT_ENTRY, sealAll(aead, hashKey, records, version))
+        # Only now that the rows under the new key are committed does this instance use it.
+        self.readHeader()
+
+
+def sealAll(aead: AESGCM, hashKey: bytes, records: List[Tuple[str, str, str]],
+            version: int) -> Iterator[Tuple[bytes, bytes, int, bytes]]:
+    for website, email, password in records:
+        site, account = siteHash(hashKey, website), accountHash(hashKey, website, email)
+        yield site, account, version, sealRow(aead, site, account, website, email, password)
+
+
+class SqlitePasswords(MutableMapping):
+    # Presents an SQLite vault as the usual website -> {email: password} dict,
+    # querying and decrypting a website's rows the first time it is touched.
+    def __init__(self, vault: SqliteVault, onLoad: Optional[Callable[[Passwords], None]] = None):
+        self.vault = vault
+        self.onLoad = onLoad
+        # None marks a website known to have no entries.
+        self.websites: Dict[str, Optional[Dict[str, Any]]] = {}
+        self.complete = False
+        self.lock = threading.RLock()
+
+    def entriesOf(self, website: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            if website in self.websites or self.complete:
+                return self.websites.get(website)
+            entries = self.vault.readWebsite(website) or None
+            if entries and self.onLoad:
+                self.onLoad({website: entries})
+            self.websites[website] = entries
+            return entries
+
+    def loadAll(self) -> None:
+        with self.lock:
+            if self.complete:
+                return
+            for website, entries in self.vault.readAll().items():
+                # Websites already loaded may hold edits that are not written yet.
+                if website not in self.websites:
+                    if self.onLoad:
+                        self.onLoad({website: entries})
+                    self.websites[website] = entries
+            self.complete = True
+
+    def reset(self) -> None:
+        with self.lock:
+            self.websites.clear()
+            self.complete = False
+
+    def regroup(self, passwords: Optional[Passwords] = None) -> None:
+        # After a full rewrite from `passwords`, every website is known.
+        if passwords is not None:
+            with self.lock:
+                self.websites = dict(passwords)
+                self.complete = True
+
+    def get(self, website: str, default: Any = None) -> Any:
+        entries = self.entriesOf(website)
+        return default if entries is None else entries
+
+    def __getitem__(self, website: str) -> Dict[str, Any]:
+        entries = self.entriesOf(website)
+        if entries is None:
+            raise KeyError(website)
+        return entries
+
+    def __setitem__(self, website: str, entries: Dict[str, Any]) -> None:
+        with self.lock:
+            self.websites[website] = entries
+
+    def __delitem__(self, website: str) -> None:
+        with self.lock:
+            if self.entriesOf(website) is None:
+                raise KeyError(website)
+            self.websites[website] = None
+
+    def __contains__(self, website: object) -> bool:
+        return isinstance(website, str) and self.entriesOf(website) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return iter([website for website, _ in self.items()])
+
+    def items(self) -> List[Tuple[str, Dict[str, Any]]]:
+        with self.lock:
+            self.loadAll()
+            return [(website, entries) for website, entries in self.websites.items() if entries is not None]
+
+    def __len__(self) -> int:
+        return len(self.items())
+
+
+class SqliteStorage(VaultStorage):
+    paged = True
+
+    def __init__(self, path: str, encryptionManager: 'EncryptionManager'):
+        super().__init__(path, encryptionManager)
+        self.vault: Optional[SqliteVault] = None
+        self.passwords: Optional[SqlitePasswords] = None
+
+    def load(self, onLoad: Optional[Callable[[Passwords], None]] = None) -> SqlitePasswords:
+        self.vault = SqliteVault(self.path, self.encryptionManager)
+        self.passwords = SqlitePasswords(self.vault, onLoad)
+        return self.passwords
+
+    def read(self) -> Plaintext:
+        vault = self.vault or SqliteVault(self.path, self.encryptionManager)
+        try:
+            return vault.readAll()
+        finally:
+            if vault is not self.vault:
+                vault.close()
+
+    def write(self, passwords: Plaintext) -> None:
+        vault = self.vault or SqliteVault(self.path, self.encryptionManager)
+        try:
+            vault.rewrite(passwords)
+        finally:
+            if vault is not self.vault:
+                vault.close()
+
+    def writeChanges(self, passwords: SqlitePasswords, operations: List[Operation], lock: ContextManager,
+                     plaintext: Callable[[Passwords], Plaintext]) -> None:
+        accounts = touchedAccounts(operations)
+        with lock:
+            current: Passwords = {}
+            for website, email in accounts:
+                secret = passwords.get(website, {}).get(email)
+                if secret is not None:
+                    current.setdefault(website, {})[email] = secret
+        current = plaintext(current)
+        self.vault.write([(website, email, current.get(website, {}).get(email)) for website, email in accounts])
+
+    def externalChanges(self, passwords: SqlitePasswords, previous: Any, current: Any,
+                        unseal: Callable[[Any], Optional[str]]) -> Dict[Account, Optional[str]]:
+        vault = self.vault
+        changes: Dict[Account, Optional[str]] = {}
+        with passwords.lock:
+            if previous is None or current[0] != previous[0]:
+                # Rewritten by another instance: compare every website loaded here.
+                vault.readHeader()
+                passwords.complete = False
+                for website, entries in list(passwords.websites.items()):
+                    changes.update(diffPasswords({website: entries or {}}, {website: vault.readWebsite(website)}, unseal))
+                return changes
+            sites: Optional[Dict[bytes, str]] = None
+            for site, account, sealed in vault.changesSince(previous[1]):
+                if sealed is not None:
+                    website, email, password = vault.unseal(site, account, sealed)
+                    # Websites not loaded yet are read fresh when first used.
+                    if website in passwords.websites or passwords.complete:
+                        changes[(website, email)] = password
+                    continue
+                if sites is None:
+                    sites = {vault.siteHash(website): website for website in passwords.websites}
+                website = sites.get(site)
+                for email in passwords.websites.get(website) or ():
+                    if vault.accountHash(website, email) == account:
+                        changes[(website, email)] = None
+        return changes
+
+    def signature(self) -> Any:
+        if not os.path.exists(self.path):
+            return None
+        return self.vault.signature() if self.vault else None
+
+    def contentId(self) -> str:
+        vault = self.vault or SqliteVault(self.path, self.encryptionManager)
+        try:
+            return vault.contentId()
+        finally:
+            if vault is not self.vault:
+                vault.close()
+
+    def close(self) -> None:
+        if self.vault:
+            self.vault.close()
@@ -0,0 +1,199 @@
+import hashlib
+import json
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Any, Callable, ContextManager, Dict, List, Optional, Set, Tuple
+from .chunkedVault import ChunkedPasswords, ChunkedVault, isChunkedVault
+from .journal import Operation, snapshotFingerprint
+from .persistence import atomicWriter, writeAtomically
+from .vaultFormat import isBinaryVault, isSqliteVault, readVault, vaultGeneration, writeVault
+from .vaultSync import Account, diffPasswords, fileSignature
+
+if TYPE_CHECKING:
+    from .encryption import EncryptionManager
+
+Passwords = Dict[str, Dict[str, Any]]
+Plaintext = Dict[str, Dict[str, str]]
+
+
+def touchedAccounts(operations: List[Operation]) -> Set[Account]:
+    return {(operation['website'], operation[field]) for operation in operations
+            for field in ('email', 'oldEmail', 'newEmail') if field in operation}
+
+
+class VaultStorage(ABC):
+    # One on-disk vault format. PasswordStore keeps the entries in the mapping load()
+    # returns, and commits go through write() or, for paged storages, writeChanges().
+    # Paged storages decrypt entries the first time they are touched and write only
+    # the entries that changed; the others are read and written whole.
+    paged: bool = False
+
+    def __init__(self, path: str, encryptionManager: 'EncryptionManager'):
+        self.path = path
+        self.encryptionManager = encryptionManager
+
+    def load(self, onLoad: Optional[Callable[[Passwords], None]] = None) -> Passwords:
+        # `onLoad` sees every group of entries as it is decrypted, so they can be sealed in memory.
+        passwords = self.read()
+        if onLoad:
+            onLoad(passwords)
+        return passwords
+
+    @abstractmethod
+    def read(self) -> Plaintext:
+        # Every entry as it is on disk now.
+        raise NotImplementedError
+
+    @abstractmethod
+    def write(self, passwords: Plaintext) -> None:
+        # Replaces the whole vault.
+        raise NotImplementedError
+
+    @abstractmethod
+    def writeChanges(self, passwords: Passwords, operations: List[Operation], lock: ContextManager,
+                     plaintext: Callable[[Passwords], Plaintext]) -> None:
+        # Writes the entries the operations touched. `lock` guards `passwords` against
+        # edits while they are copied; the encryption and I/O happen outside it.
+        raise NotImplementedError
+
+    def externalChanges(self, passwords: Passwords, previous: Any, current: Any,
+                        unseal: Callable[[Any], Optional[str]]) -> Dict[Account, Optional[str]]:
+        # Entries another instance changed between the two signatures, mapped to their new value.
+        return diffPasswords(passwords, self.read(), unseal)
+
+    def signature(self) -> Any:
+        # Changes whenever the stored vault does; None once it no longer exists.
+        return fileSignature(self.path)
+
+    def generation(self) -> Any:
+        # Identifies the stored version from what can be read without decrypting;
+        # None where the format keeps nothing of the kind.
+        return None
+
+    def contentId(self) -> str:
+        # Like the signature, but it survives copying the vault to another place,
+        # and two copies edited apart never share one.
+        return snapshotFingerprint(self.path)
+
+    def close(self) -> None:
+        pass
+
+
+class FileStorage(VaultStorage):
+    # The binary vault and the legacy encrypted JSON file, read and written in one piece.
+    def read(self) -> Plaintext:
+        try:
+            with open(self.path, 'rb') as f:
+                if isBinaryVault(self.path):
+                    return readVault(f, self.encryptionManager)
+                data = self.encryptionManager.decrypt(f.read())
+                passwords = json.loads(data)
+                del data
+                return passwords
+        except FileNotFoundError:
+            return {}
+
+    def write(self, passwords: Plaintext) -> None:
+        if isBinaryVault(self.path):
+            previous = self.generation()
+            with atomicWriter(self.path) as f:
+                writeVault(f, self.encryptionManager, passwords, generation=previous[0] + 1 if previous else 1)
+        else:
+            writeAtomically(self.path, self.encryptionManager.encrypt(json.dumps(passwords, indent=4)))
+
+    def generation(self) -> Optional[Tuple[int, str]]:
+        # Only the binary vault has a plaintext header to keep it in.
+        return vaultGeneration(self.path) if isBinaryVault(self.path) else None
+
+    def writeChanges(self, passwords: Passwords, operations: List[Operation], lock: ContextManager,
+                     plaintext: Callable[[Passwords], Plaintext]) -> None:
+        # There is no smaller unit to write than the whole file.
+        with lock:
+            snapshot = {website: dict(entries) for website, entries in passwords.items()}
+        self.write(plaintext(snapshot))
+
+
+class ChunkedStorage(VaultStorage):
+    paged = True
+
+    def __init__(self, path: str, encryptionManager: 'EncryptionManager'):
+        super().__init__(path, encryptionManager)
+        self.vault: Optional[ChunkedVault] = None
+        self.passwords: Optional[ChunkedPasswords] = None
+
+    def load(self, onLoad: Optional[Callable[[Passwords], None]] = None) -> ChunkedPasswords:
+        self.vault = ChunkedVault(self.path, self.encryptionManager)
+        self.passwords = ChunkedPasswords(self.vault, onLoad)
+        return self.passwords
+
+    def read(self) -> Plaintext:
+        vault = self.vault or ChunkedVault(self.path, self.encryptionManager)
+        try:
+            passwords: Plaintext = {}
+            for index in range(vault.buckets):
+                passwords.update(vault.readBucket(index))
+            return passwords
+        finally:
+            if vault is not self.vault:
+                vault.close()
+
+    def write(self, passwords: Plaintext) -> None:
+        if self.passwords:
+            self.passwords.rewrite(passwords)
+        else:
+            ChunkedVault.create(self.path, self.encryptionManager, passwords)
+
+    def writeChanges(self, passwords: ChunkedPasswords, operations: List[Operation], lock: ContextManager,
+                     plaintext: Callable[[Passwords], Plaintext]) -> None:
+        with lock:
+            touched = {self.vault.bucketOf(operation['website']) for operation in operations}
+            buckets = {index: {website: dict(entries) for website, entries in passwords.bucket(index).items()}
+                       for index in touched}
+        self.vault.writeBuckets({index: plaintext(bucket) for index, bucket in buckets.items()})
+        if self.vault.shouldResize():
+            with lock:
+                snapshot = {website: dict(entries) for website, entries in passwords.items()}
+            self.write(plaintext(snapshot))
+        elif self.vault.shouldCompact():
+            self.vault.compact()
+
+    def externalChanges(self, passwords: ChunkedPasswords, previous: Any, current: Any,
+                        unseal: Callable[[Any], Optional[str]]) -> Dict[Account, Optional[str]]:
+        with passwords.lock:
+            if previous is None or current[2] != previous[2]:
+                # Rewritten by another instance, perhaps with a new bucket count or salt.
+                passwords.loadAll()
+                self.vault.reopen()
+                passwords.regroup()
+                return diffPasswords(passwords, self.read(), unseal)
+            moved = self.vault.refresh()
+            changes: Dict[Account, Optional[str]] = {}
+            # Buckets not decrypted yet are read from the new directory when first used.
+            for index in moved & passwords.buckets.keys():
+                changes.update(diffPasswords(passwords.buckets[index], self.vault.readBucket(index), unseal))
+            return changes
+
+    def contentId(self) -> str:
+        # Every write seals a new directory under a fresh nonce, so the current
+        # slot identifies the content without hashing the whole file.
+        vault = self.vault or ChunkedVault(self.path, self.encryptionManager)
+        try:
+            with vault.lock:
+                offset = vault.slotOffsets[vault.slot]
+                return hashlib.sha256(vault.preamble + vault.map[offset:offset + vault.slotSize]).hexdigest()
+        finally:
+            if vault is not self.vault:
+                vault.close()
+
+    def close(self) -> None:
+        if self.vault:
+            self.vault.close()
+
+
+def openStorage(path: str, encryptionManager: 'EncryptionManager') -> VaultStorage:
+    if isChunkedVault(path):
+        return ChunkedStorage(path, encryptionManager)
+    if isSqliteVault(path):
+        # sqlite3 is only imported by the vaults that use it.
+        from .sqliteVault import SqliteStorage
+        return SqliteStorage(path, encryptionManager)
+    return FileStorage(path, encryptionManager)
@@ -0,0 +1,250 @@
+import base64
+import json
+import os
+import struct
+import sys
+from array import array
+from itertools import accumulate
+from typing import TYPE_CHECKING, Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDFExpand
+
+if TYPE_CHECKING:
+    from .encryption import EncryptionManager
+
+VAULT_PATH: str = 'data/passwords.vault'
+CHUNKED_VAULT_PATH: str = 'data/passwords.chunks'
+SQLITE_VAULT_PATH: str = 'data/passwords.db'
+LEGACY_VAULT_PATH: str = 'data/passwords.json.enc'
+# Keyed hashes of every entry, kept beside the vault once it has been merged with another copy.
+MERKLE_PATH: str = 'data/passwords.merkle'
+
+VAULT_MAGIC: bytes = b'PMVAULT'
+VAULT_VERSION: int = 1
+VAULT_CIPHER: str = 'AES-256-GCM'
+FRAME_SIZE: int = 64 * 1024
+FILE_SALT_SIZE: int = 16
+
+# The top bit of a frame's length marks the final frame, so truncation at a
+# frame boundary fails authentication instead of silently dropping entries.
+FINAL_FRAME: int = 0x80000000
+FRAME_LENGTH = struct.Struct('>I')
+HEADER_LENGTH = struct.Struct('>I')
+RECORD_COUNT = struct.Struct('<I')
+MAX_FIELD_BYTES: int = 0xFFFF
+
+
+class VaultFormatError(Exception):
+    pass
+
+
+def activeDataPath(root: str = '') -> str:
+    # `root` holds another copy of the vault, laid out like the working directory.
+    chunked, sqlite, vault, legacy = (os.path.join(root, path) for path in
+                                      (CHUNKED_VAULT_PATH, SQLITE_VAULT_PATH, VAULT_PATH, LEGACY_VAULT_PATH))
+    if os.path.exists(chunked):
+        return chunked
+    if os.path.exists(sqlite):
+        return sqlite
+    # Vaults written before the binary format keep loading from JSON until converted.
+    if not os.path.exists(vault) and os.path.exists(legacy) and os.path.getsize(legacy) > 0:
+        return legacy
+    return vault
+
+
+def isBinaryVault(path: str) -> bool:
+    return path.endswith('.vault')
+
+
+def isSqliteVault(path: str) -> bool:
+    return path.endswith('.db')
+
+
+def deriveFileKey(vaultKey: bytes, fileSalt: bytes) -> bytes:
+    # A fresh key per file lets frame nonces be plain counters.
+    return HKDFExpand(algorithm=hashes.SHA256(), length=32, info=b'vault-file' + fileSalt,
+                      backend=default_backend()).derive(vaultKey)
+
+
+def fileKey(vaultKey: bytes, fileSalt: bytes) -> AESGCM:
+    return AESGCM(deriveFileKey(vaultKey, fileSalt))
+
+
+def vaultHeader(encryptionManager: 'EncryptionManager', fileSalt: bytes, **fields: Any) -> bytes:
+    return json.dumps(dict({
+        'cipher': VAULT_CIPHER,
+        'kdf': encryptionManager.kdfParams,
+        'salt': base64.b64encode(encryptionManager.salt).decode(),
+        'fileSalt': base64.b64encode(fileSalt).decode()
+    }, **fields), separators=(',', ':')).encode()
+
+
+def buildPreamble(magic: bytes, version: int, header: bytes) -> bytes:
+    return magic + bytes([version]) + HEADER_LENGTH.pack(len(header)) + header
+
+
+def recordSize(website: str, email: str, password: str) -> int:
+    # Character counts are a close enough estimate of the encoded size.
+    return len(website) + len(email) + len(password) + 6
+
+
+def sealFrame(aead: AESGCM, preamble: bytes, counter: int, final: bool, records: List[Tuple[str, str, str]]) -> bytes:
+    ciphertext = aead.encrypt(frameNonce(counter, final), encodeFrame(records), preamble)
+    return FRAME_LENGTH.pack(len(ciphertext) | (FINAL_FRAME if final else 0)) + ciphertext
+
+
+def frameNonce(counter: int, final: bool) -> bytes:
+    return counter.to_bytes(11, 'big') + (b'\x01' if final else b'\x00')
+
+
+def encodeFrame(records: List[Tuple[str, str, str]]) -> bytes:
+    # A frame is a record count, a table of field lengths and the concatenated
+    # fields, so decoding is bulk slicing rather than a parse per record.
+    fields = [field.encode() for record in records for field in record]
+    if any(len(field) > MAX_FIELD_BYTES for field in fields):
+        raise VaultFormatError("Vault fields are limited to 65535 bytes.")
+    lengths = array('H', map(len, fields))
+    if sys.byteorder != 'little':
+        lengths.byteswap()
+    return RECORD_COUNT.pack(len(records)) + lengths.tobytes() + b''.join(fields)
+
+
+def decodeFrame(plaintext: bytes) -> Iterator[Tuple[str, str, str]]:
+    count = RECORD_COUNT.unpack_from(plaintext)[0]
+    tableEnd = RECORD_COUNT.size + 3 * count * 2
+    lengths = array('H')
+    lengths.frombytes(plaintext[RECORD_COUNT.size:tableEnd])
+    if sys.byteorder != 'little':
+        lengths.byteswap()
+    offsets = list(accumulate(lengths, initial=0))
+    if offsets[-1] != len(plaintext) - tableEnd:
+        raise VaultFormatError("Vault frame does not match its length table.")
+    blob = plaintext[tableEnd:]
+    if blob.isascii():
+        # Byte and character offsets agree, so one decode covers the frame.
+        blob = blob.decode('ascii')
+        fields = [blob[start:end] for start, end in zip(offsets, offsets[1:])]
+    else:
+        fields = [blob[start:end].decode() for start, end in zip(offsets, offsets[1:])]
+    return zip(fields[0::3], fields[1::3], fields[2::3])
+
+
+class VaultWriter:
+    def __init__(self, stream: BinaryIO, encryptionManager: 'EncryptionManager', frameSize: int = FRAME_SIZE, **headerFields: Any):
+        self.stream = stream
+        self.frameSize = frameSize
+        fileSalt = os.urandom(FILE_SALT_SIZE)
+        # Every frame authenticates the whole preamble, so the header cannot be swapped.
+        self.preamble = buildPreamble(VAULT_MAGIC, VAULT_VERSION, vaultHeader(encryptionManager, fileSalt, **headerFields))
+        self.aead = fileKey(encryptionManager.vaultKey, fileSalt)
+        self.counter = 0
+        self.buffer: List[Tuple[str, str, str]] = []
+        self.bufferSize = 0
+        self.closed = False
+        stream.write(self.preamble)
+
+    def write(self, website: str, email: str, password: str) -> None:
+        self.buffer.append((website, email, password))
+        self.bufferSize += recordSize(website, email, password)
+        if self.bufferSize >= self.frameSize:
+            self.writeFrame(final=False)
+
+    def writeFrame(self, final: bool) -> None:
+        self.stream.write(sealFrame(self.aead, self.preamble, self.counter, final, self.buffer))
+        self.counter += 1
+        self.buffer = []
+        self.bufferSize = 0
+
+    def close(self) -> None:
+        if not self.closed:
+            self.writeFrame(final=True)
+            self.closed = True
+
+    def __enter__(self) -> 'VaultWriter':
+        return self
+
+    def __exit__(self, excType, excValue, traceback) -> None:
+        if excType is None:
+            self.close()
+
+
+def readPreamble(stream: BinaryIO) -> Tuple[bytes, Dict[str, Any], bytes]:
+    # The preamble, the header it carries and the header's file salt. Nothing here is
+    # authenticated until the first frame decrypts.
+    magic = stream.read(len(VAULT_MAGIC) + 1)
+    if magic[:len(VAULT_MAGIC)] != VAULT_MAGIC:
+        raise VaultFormatError("Not a binary vault.")
+    if magic[-1] != VAULT_VERSION:
+        raise VaultFormatError(f"Unsupported vault version: {magic[-1]}")
+    lengthBytes = stream.read(HEADER_LENGTH.size)
+    try:
+        headerBytes = stream.read(HEADER_LENGTH.unpack(lengthBytes)[0])
+        header = json.loads(headerBytes)
+        fileSalt = base64.b64decode(header['fileSalt'])
+    except (struct.error, ValueError, KeyError, TypeError):
+        raise VaultFormatError("Vault header is corrupted.") from None
+    return magic + lengthBytes + headerBytes, header, fileSalt
+
+
+def vaultGeneration(path: str) -> Optional[Tuple[int, str]]:
+    # Every write bumps the counter and draws a new file salt, so a file that only had
+    # its timestamp changed is told apart without decrypting it. None if unreadable.
+    try:
+        with open(path, 'rb') as f:
+            header = readPreamble(f)[1]
+    except (FileNotFoundError, VaultFormatError):
+        return None
+    return header.get('generation', 0), header['fileSalt']
+
+
+class VaultReader:
+    def __init__(self, stream: BinaryIO, encryptionManager: 'EncryptionManager'):
+        self.stream = stream
+        self.preamble, self.header, fileSalt = readPreamble(stream)
+        if self.header.get('cipher') != VAULT_CIPHER:
+            raise VaultFormatError(f"Unsupported vault cipher: {self.header.get('cipher')}")
+        self.aead = fileKey(encryptionManager.vaultKey, fileSalt)
+
+    def frames(self) -> Iterator[bytes]:
+        counter = 0
+        while True:
+            lengthBytes = self.stream.read(FRAME_LENGTH.size)
+            if len(lengthBytes) < FRAME_LENGTH.size:
+                raise VaultFormatError("Vault is truncated.")
+            length = FRAME_LENGTH.unpack(lengthBytes)[0]
+            final = bool(length & FINAL_FRAME)
+            ciphertext = self.stream.read(length & ~FINAL_FRAME)
+            try:
+                plaintext = self.aead.decrypt(frameNonce(counter, final), ciphertext, self.preamble)
+            except InvalidTag:
+                raise VaultFormatError("Vault failed authentication; wrong key or corrupted file.") from None
+            yield plaintext
+            counter += 1
+            if final:
+                if self.stream.read(1):
+                    raise VaultFormatError("Unexpected data after the final vault frame.")
+                return
+
+    def __iter__(self) -> Iterator[Tuple[str, str, str]]:
+        for plaintext in self.frames():
+            yield from decodeFrame(plaintext)
+
+
+def writeVault(stream: BinaryIO, encryptionManager: 'EncryptionManager', passwords: Dict[str, Dict[str, str]], **headerFields: Any) -> None:
+    with VaultWriter(stream, encryptionManager, **headerFields) as writer:
+        for website, entries in passwords.items():
+            for email, password in entries.items():
+                writer.write(website, email, password)
+
+
+def readVault(stream: BinaryIO, encryptionManager: 'EncryptionManager') -> Dict[str, Dict[str, str]]:
+    passwords: Dict[str, Dict[str, str]] = {}
+    for website, email, password in VaultReader(stream, encryptionManager):
+        entries = passwords.get(website)
+        if entries is None:
+            entries = passwords[website] = {}
+        entries[email] = password
+    return passwords
@@ -0,0 +1,144 @@
+import os
+import time
+from typing import List, Optional, Tuple
+from .backup import MASTER_HASH_PATH, SALT_PATH
+from .encryption import EncryptionManager
+from .merkleIndex import MerkleIndex, diffIndexes
+from .passwordManager import PasswordStore
+from .vaultFormat import MERKLE_PATH
+
+MERGE_PREFERENCES: Tuple[str, ...] = ('ours', 'theirs')
+
+
+class MergeError(Exception):
+    pass
+
+
+class MergeConflict:
+    # An entry both copies changed in different ways since their last merge.
+    __slots__ = ('website', 'email')
+
+    def __init__(self, website: str, email: str):
+        self.website = website
+        self.email = email
+
+    def __repr__(self) -> str:
+        return f"MergeConflict({self.website!r}, {self.email!r})"
+
+
+class MergeReport:
+    def __init__(self):
+        self.differences = 0
+        self.compared = 0
+        self.pulled = 0
+        self.pushed = 0
+        self.conflicts: List[MergeConflict] = []
+        self.resolved = 0
+        self.hadBase = False
+        self.seconds = 0.0
+
+    def summary(self) -> str:
+        text = (f"{self.differences:,} differing entries found in {self.seconds:.2f} s ({self.compared:,} nodes compared): "
+                f"{self.pulled:,} taken from the other copy, {self.pushed:,} sent to it, {len(self.conflicts):,} conflicts")
+        if self.resolved:
+            text += f" ({self.resolved:,} resolved by preference)"
+        if not self.hadBase and self.differences:
+            text += "; no common ancestor, so entries only one copy had were kept"
+        return text + "."
+
+
+def openCopy(root: str, username: str, password: str, **storeOptions) -> PasswordStore:
+    # Another copy of the vault, e.g. one brought over from another machine, unlocked
+    # with its own salt and master hash.
+    saltPath, hashPath = os.path.join(root, SALT_PATH), os.path.join(root, MASTER_HASH_PATH)
+    if not os.path.exists(saltPath) or not os.path.exists(hashPath):
+        raise MergeError(f"No vault under {os.path.abspath(root)}.")
+    encryptionManager = EncryptionManager(username, password, saltPath, hashPath)
+    if not encryptionManager.verifyPassword(username, password):
+        raise MergeError("Incorrect Details.")
+    return PasswordStore(encryptionManager, root=root, **storeOptions)
+
+
+def readEntry(store: PasswordStore, index: MerkleIndex, identifier: bytes, expected: bytes) -> Tuple[str, str, str]:
+    website, email = index.name(identifier)
+    password = store.unsealed(store.passwords.get(website, {}).get(email))
+    if password is None or index.valueHash(identifier, password) != expected:
+        raise MergeError(f"The merge index of {os.path.abspath(store.root or '.')} does not match its vault.")
+    return website, email, password
+
+
+def mergeVaults(ours: PasswordStore, theirs: PasswordStore, prefer: Optional[str] = None,
+                dryRun: bool = False) -> MergeReport:
+    # Three-way merge of two copies of one vault against the state they were left in by
+    # their last merge with each other. An entry changed on one side only takes that
+    # side's value in both; one changed differently on both is a conflict, and each copy
+    # keeps its own value unless `prefer` picks a side. Afterwards both copies record the
+    # result as their newest common ancestor.
+    if prefer is not None and prefer not in MERGE_PREFERENCES:
+        raise ValueError(f"Unknown merge preference: {prefer}")
+    if os.path.realpath(os.path.join(ours.root, MERKLE_PATH)) == os.path.realpath(os.path.join(theirs.root, MERKLE_PATH)):
+        raise MergeError("Both copies are the same vault.")
+    report = MergeReport()
+    start = time.perf_counter()
+    ours.flush()
+    theirs.flush()
+    with ours.vaultLock, theirs.vaultLock:
+        ours.syncExternalChanges()
+        theirs.syncExternalChanges()
+        ourIndex, theirIndex = ours.merkleIndex(), theirs.merkleIndex()
+        if ourIndex.keyId != theirIndex.keyId:
+            raise MergeError("The copies are not under the same master key; re-key one to match the other.")
+        differing, report.compared = diffIndexes(ourIndex, theirIndex)
+        report.differences = len(differing)
+        shared = ourIndex.bases().keys() & theirIndex.bases().keys()
+        base = max(shared, key=ourIndex.bases().get) if shared else None
+        report.hadBase = base is not None
+
+        pull: List[Tuple[str, str, Optional[str]]] = []
+        push: List[Tuple[str, str, Optional[str]]] = []
+        # Unresolved conflicts stay as they were in the new base, so they come up again next time.
+        overrides = {}
+        for identifier in differing:
+            ourValue, theirValue = ourIndex.leaf(identifier), theirIndex.leaf(identifier)
+            # Without a base, an entry only one copy has is taken to be new there.
+            baseValue = ourIndex.baseValue(base, identifier) if base is not None else None
+            if ourValue == baseValue:
+                side = 'theirs'
+            elif theirValue == baseValue:
+                side = 'ours'
+            else:
+                report.conflicts.append(MergeConflict(*(ourIndex if ourValue is not None else theirIndex).name(identifier)))
+                if prefer is None:
+                    overrides[identifier] = baseValue
+                    continue
+                report.resolved += 1
+                side = prefer
+            if side == 'theirs':
+                if theirValue is None:
+                    pull.append((*ourIndex.name(identifier), None))
+                else:
+                    pull.append(readEntry(theirs, theirIndex, identifier, theirValue))
+            elif ourValue is None:
+                push.append((*theirIndex.name(identifier), None))
+            else:
+                push.append(readEntry(ours, ourIndex, identifier, ourValue))
+        report.pulled, report.pushed = len(pull), len(push)
+        if dryRun:
+            report.seconds = time.perf_counter() - start
+            return report
+
+        for store, changes in ((ours, pull), (theirs, push)):
+            with store.batch():
+                for website, email, password in changes:
+                    if password is None:
+                        store.deletePassword(website, email)
+                    else:
+                        store.addPassword(website, email, password)
+            # The batch's write has already brought the index up to date; this only
+            # rebuilds it if that write could not, so the base below matches the vault.
+            store.merkleIndex()
+        base = os.urandom(16)
+        ourIndex.recordBase(base, overrides)
+        theirIndex.recordBase(base, overrides)
+    report.seconds = time.perf_counter() - start
+    return report
@@ -0,0 +1,140 @@
+import os
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+LOCK_PATH: str = 'data/passwords.lock'
+
+Account = Tuple[str, str]
+FileSignature = Optional[Tuple[int, int, int]]
+
+
+class VaultLock:
+    # An advisory lock on a side file, taken by every instance around vault
+    # writes and reloads. It is reentrant within a process, so the writer
+    # thread and the UI thread queue on the thread lock, not on the file.
+    def __init__(self, path: str = LOCK_PATH):
+        self.path = path
+        self.threadLock = threading.RLock()
+        self.depth = 0
+        self.fd: Optional[int] = None
+        self.closing = False
+
+    def acquire(self) -> None:
+        self.threadLock.acquire()
+        if self.depth == 0:
+            try:
+                if self.fd is None:
+                    # Kept open, so taking the lock is a single system call.
+                    os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                    self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                lockFile(self.fd)
+            except BaseException:
+                self.threadLock.release()
+                raise
+        self.depth += 1
+
+    def release(self) -> None:
+        self.depth -= 1
+        try:
+            if self.depth == 0:
+                unlockFile(self.fd)
+                if self.closing:
+                    self.closing = False
+                    os.close(self.fd)
+                    self.fd = None
+        finally:
+            self.threadLock.release()
+
+    def close(self) -> None:
+        with self.threadLock:
+            if self.depth:
+                # Closed while held, e.g. by a rekey that swaps the vault under the lock;
+                # the descriptor goes when the lock is released.
+                self.closing = True
+            elif self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+
+    def __enter__(self) -> 'VaultLock':
+        self.acquire()
+        return self
+
+    def __exit__(self, excType, excValue, traceback) -> None:
+        self.release()
+
+
+if os.name == 'nt':
+    def lockFile(fd: int) -> None:
+        os.lseek(fd, 0, os.SEEK_SET)
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # LK_LOCK gives up after ten seconds; keep waiting like flock does.
+                continue
+
+    def unlockFile(fd: int) -> None:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+else:
+    def lockFile(fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+    def unlockFile(fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def fileSignature(path: Optional[str]) -> FileSignature:
+    # Atomic rewrites change the inode and appends change the size, so a stat
+    # is enough to tell whether another instance has written since.
+    if path is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+class VaultKeyChangedError(Exception):
+    # The master password was changed by another instance, so this one holds a
+    # key that no longer opens the vault.
+    pass
+
+
+class VaultConflict:
+    # An entry another instance changed while this one had an unsaved edit of it.
+    # The local edit is kept; `external` is the other value, or None if it was deleted there.
+    __slots__ = ('website', 'email', 'external')
+
+    def __init__(self, website: str, email: str, external: Optional[str]):
+        self.website = website
+        self.email = email
+        self.external = external
+
+    def __repr__(self) -> str:
+        return f"VaultConflict({self.website!r}, {self.email!r})"
+
+
+def diffPasswords(ours: Dict[str, Dict[str, Any]], theirs: Dict[str, Dict[str, str]],
+                  unseal: Callable[[Any], str]) -> Dict[Account, Optional[str]]:
+    # Every entry whose value on disk differs from the one in memory, mapped to the disk value.
+    changes: Dict[Account, Optional[str]] = {}
+    for website, entries in theirs.items():
+        current = ours.get(website, {})
+        for email, password in entries.items():
+            secret = current.get(email)
+            if secret is None or unseal(secret) != password:
+                changes[(website, email)] = password
+    for website, entries in ours.items():
+        other = theirs.get(website, {})
+        for email in entries:
+            if email not in other:
+                changes[(website, email)] = None
+    return changes
@@ -0,0 +1,124 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+REPO_ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STARTUP_MODULE: str = 'frontend.mainWindow'
+# Modules that must stay out of the import graph until the user has logged in or copied something.
+DEFERRED_MODULES: List[str] = ['cryptography', 'pyperclip', 'backend.encryption', 'backend.passwordManager']
+IMPORT_BUDGET_MS: float = 300
+DIALOG_BUDGET_MS: float = 1000
+DIALOG_TIMEOUT: float = 30
+
+FIRST_DIALOG_PROBE: str = '''
+import os
+from frontend.mainWindow import MainWindow
+app = MainWindow()
+def probe():
+    if any(child.winfo_viewable() for child in app.winfo_children() if child.winfo_class() == 'Toplevel'):
+        print('ready', flush=True)
+        os._exit(0)
+    app.after(1, probe)
+app.after(0, probe)
+app.login()
+'''
+
+
+def runPython(arguments: List[str]) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *arguments], cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+
+
+def profileImports(module: str = STARTUP_MODULE, depth: int = 1) -> List[Tuple[str, int, int]]:
+    # Aggregates `-X importtime` self times, so each package is charged only for its own modules.
+    totals: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+    stderr = runPython(['-X', 'importtime', '-c', f'import {module}']).stderr
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        selfTime, _, name = line[len('import time:'):].split('|')
+        package = '.'.join(name.strip().split('.')[:depth])
+        totals[package][0] += int(selfTime)
+        totals[package][1] += 1
+    return sorted(((package, micros, count) for package, (micros, count) in totals.items()), key=lambda row: -row[1])
+
+
+def deferredModulesLoaded(module: str = STARTUP_MODULE) -> List[str]:
+    check = f'import sys, {module}; print(" ".join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))'
+    return runPython(['-c', check]).stdout.split()
+
+
+def measureImport(module: str = STARTUP_MODULE, runs: int = 5) -> float:
+    # Wall time of a fresh interpreter importing the module, which is what a cold launch pays.
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        runPython(['-c', f'import {module}'])
+        samples.append(time.perf_counter() - start)
+    return min(samples)
+
+
+def measureFirstDialog(runs: int = 3) -> Optional[float]:
+    if sys.platform != 'win32' and not os.environ.get('DISPLAY'):
+        return None
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, '-c', FIRST_DIALOG_PROBE], cwd=REPO_ROOT, stdout=subprocess.PIPE, text=True)
+        try:
+            line = process.stdout.readline()
+            samples.append(time.perf_counter() - start)
+        finally:
+            process.kill()
+            process.wait(DIALOG_TIMEOUT)
+        if line.strip() != 'ready':
+            raise RuntimeError("The login dialog never appeared.")
+    return min(samples)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Cold-start profiling and regression checks.")
+    parser.add_argument('--profile', action='store_true', help="Summarize -X importtime per package.")
+    parser.add_argument('--depth', type=int, default=1, help="Package depth to group modules by when profiling.")
+    parser.add_argument('--module', default=STARTUP_MODULE)
+    parser.add_argument('--check', action='store_true', help="Exit non-zero if startup exceeds its budget.")
+    parser.add_argument('--import-budget-ms', type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument('--dialog-budget-ms', type=float, default=DIALOG_BUDGET_MS)
+    args = parser.parse_args(argv)
+
+    if args.profile:
+        rows = profileImports(args.module, args.depth)
+        total = sum(micros for _, micros, _ in rows)
+        print(f"{'package':<40} {'self ms':>9} {'share':>7} {'modules':>8}")
+        for package, micros, count in rows:
+            print(f"{package:<40} {micros / 1000:9.2f} {micros / total:7.1%} {count:8}")
+        print(f"{'total':<40} {total / 1000:9.2f}")
+        return 0
+
+    failures = []
+    loaded = deferredModulesLoaded(args.module)
+    print(f"deferred modules imported at startup: {', '.join(loaded) or 'none'}")
+    if loaded:
+        failures.append('deferred imports')
+    importTime = measureImport(args.module) * 1000
+    print(f"import {args.module}: {importTime:.1f} ms (budget {args.import_budget_ms:.0f} ms)")
+    if importTime > args.import_budget_ms:
+        failures.append('import time')
+    dialogTime = measureFirstDialog()
+    if dialogTime is None:
+        print("time to first dialog: skipped, no display")
+    else:
+        print(f"time to first dialog: {dialogTime * 1000:.1f} ms (budget {args.dialog_budget_ms:.0f} ms)")
+        if dialogTime * 1000 > args.dialog_budget_ms:
+            failures.append('time to first dialog')
+    if args.check and failures:
+        print(f"Startup regression: {', '.join(failures)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
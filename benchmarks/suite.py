@@ -0,0 +1,445 @@
+import argparse
+import csv
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import string
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.startup import STARTUP_MODULE, runPython
+from backend.clipboard import TkClipboard
+from backend.backup import BackupRepository
+from backend.breachCheck import BreachCorpus, buildBloomFilter, buildPrefixIndex, passwordHash
+from backend.domains import normalizeCached, normalizeMany
+from backend.importer import importFile
+from backend.encryption import EncryptionManager, getFernetKey, hashMasterPassword
+from backend.passwordGenerator import PasswordGenerator
+from backend.passwordHealth import PasswordAudit
+from backend.passwordManager import PasswordStore
+from backend.chunkedVault import ChunkedVault
+from backend.sqliteVault import SqliteStorage
+from backend.vaultFormat import CHUNKED_VAULT_PATH, LEGACY_VAULT_PATH, SQLITE_VAULT_PATH, VAULT_PATH, readVault, writeVault
+from backend.vaultMerge import mergeVaults
+from backend.utilities import generateStrongPassword, shortenURLtoWebsiteName, validateEmail, validatePassword
+
+DEFAULT_SIZES: List[int] = [1000, 10000, 100000]
+REGRESSION_THRESHOLD: float = 0.25
+# The fastest sample is the least disturbed by scheduling and fsync noise.
+COMPARE_STAT: str = 'min'
+BENCH_USERNAME: str = 'bench'
+BENCH_PASSWORD: str = 'abcDE12!benchmark'
+
+
+def timeIt(func: Callable[[], Any], repeat: int, number: int = 1) -> Dict[str, float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+    return {'median': statistics.median(samples), 'min': min(samples), 'repeat': repeat, 'number': number}
+
+
+def syntheticVault(size: int, seed: int = 0) -> Dict[str, Dict[str, str]]:
+    rng = random.Random(seed)
+    passwords: Dict[str, Dict[str, str]] = {}
+    count = 0
+    while count < size:
+        website = ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 12))) + rng.choice(['.com', '.org', '.co.uk'])
+        entries = passwords.setdefault(website, {})
+        for _ in range(min(rng.randint(1, 3), size - count)):
+            email = ''.join(rng.choices(string.ascii_lowercase, k=8)) + '@gmail.com'
+            if email not in entries:
+                entries[email] = ''.join(rng.choices(string.ascii_letters + string.digits, k=16))
+                count += 1
+    return passwords
+
+
+def syntheticUrls(count: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    suffixes = ['com', 'org', 'co.uk', 'com.au', 'co.in', 'io']
+    urls = []
+    for _ in range(count):
+        host = '.'.join(''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))) for _ in range(rng.randint(1, 3)))
+        urls.append(rng.choice(['', 'http://', 'https://']) + host + '.' + rng.choice(suffixes) + rng.choice(['', '/login', ':8443/a?b=c']))
+    return urls
+
+
+def benchCrypto(results: Dict[str, Any], encryptionManager: EncryptionManager) -> None:
+    salt = encryptionManager.salt
+    results['kdf.getFernetKey'] = timeIt(lambda: getFernetKey(BENCH_PASSWORD, salt), repeat=5)
+    results['kdf.hashMasterPassword'] = timeIt(lambda: hashMasterPassword(BENCH_USERNAME + BENCH_PASSWORD, salt), repeat=5)
+    record = json.dumps({'op': 'add', 'website': 'example.com', 'email': 'someone@gmail.com', 'password': 'x' * 16})
+    token = encryptionManager.encrypt(record)
+    results['encryption.encrypt[record]'] = timeIt(lambda: encryptionManager.encrypt(record), repeat=5, number=1000)
+    results['encryption.decrypt[record]'] = timeIt(lambda: encryptionManager.decrypt(token), repeat=5, number=1000)
+
+
+def benchStore(results: Dict[str, Any], encryptionManager: EncryptionManager, size: int, useJournal: bool) -> None:
+    mode = 'journal' if useJournal else 'file'
+    passwords = syntheticVault(size)
+    data = json.dumps(passwords, indent=4)
+    for path in (LEGACY_VAULT_PATH, VAULT_PATH, 'data/passwords.journal'):
+        if os.path.exists(path):
+            os.remove(path)
+    with open(LEGACY_VAULT_PATH, 'wb') as f:
+        f.write(encryptionManager.encrypt(data))
+    repeat = 3 if size >= 100000 else 5
+
+    if not useJournal:
+        token = encryptionManager.encrypt(data)
+        results[f'encryption.encrypt[{size}]'] = timeIt(lambda: encryptionManager.encrypt(data), repeat=repeat)
+        results[f'encryption.decrypt[{size}]'] = timeIt(lambda: encryptionManager.decrypt(token), repeat=repeat)
+
+    # Opened and closed as a pair, so no run leaks a lock descriptor or a writer thread.
+    results[f'store.load[{mode},{size}]'] = timeIt(lambda: PasswordStore(encryptionManager, useJournal=useJournal).close(), repeat=repeat)
+    store = PasswordStore(encryptionManager, useJournal=useJournal)
+    try:
+        website = next(iter(passwords))
+        email = next(iter(passwords[website]))
+        counter = iter(range(sys.maxsize))
+        results[f'store.addPassword[{mode},{size}]'] = timeIt(
+            lambda: store.addPassword(f'bench{next(counter)}.com', 'bench@gmail.com', 'abcDE12!xyz'), repeat=repeat)
+        results[f'store.updatePassword[{mode},{size}]'] = timeIt(
+            lambda: store.updatePassword(website, email, f'abcDE12!{next(counter)}'), repeat=repeat)
+
+        def renameEmail() -> None:
+            nonlocal email
+            newEmail = f'renamed{next(counter)}@gmail.com'
+            store.updateEmail(website, email, newEmail)
+            email = newEmail
+        results[f'store.updateEmail[{mode},{size}]'] = timeIt(renameEmail, repeat=repeat)
+
+        victims = iter([(site, address) for site, entries in passwords.items() for address in entries if site != website])
+        results[f'store.deletePassword[{mode},{size}]'] = timeIt(lambda: store.deletePassword(*next(victims)), repeat=repeat)
+    finally:
+        store.close()
+
+
+def benchVaultFormat(results: Dict[str, Any], fileSizes: Dict[str, Any], encryptionManager: EncryptionManager, size: int) -> None:
+    passwords = syntheticVault(size)
+    payload = sum(len(website) + len(email) + len(password) for website, entries in passwords.items() for email, password in entries.items())
+    legacy = encryptionManager.encrypt(json.dumps(passwords, indent=4))
+    buffer = io.BytesIO()
+    writeVault(buffer, encryptionManager, passwords)
+    binary = buffer.getvalue()
+    fileSizes[f'vault[{size}]'] = {'payload': payload, 'json': len(legacy), 'binary': len(binary)}
+    repeat = 3 if size >= 100000 else 5
+    results[f'format.load[json,{size}]'] = timeIt(lambda: json.loads(encryptionManager.decrypt(legacy)), repeat=repeat)
+    results[f'format.load[binary,{size}]'] = timeIt(lambda: readVault(io.BytesIO(binary), encryptionManager), repeat=repeat)
+    results[f'format.write[json,{size}]'] = timeIt(lambda: encryptionManager.encrypt(json.dumps(passwords, indent=4)), repeat=repeat)
+    results[f'format.write[binary,{size}]'] = timeIt(lambda: writeVault(io.BytesIO(), encryptionManager, passwords), repeat=repeat)
+
+
+def benchChunked(results: Dict[str, Any], encryptionManager: EncryptionManager, size: int) -> None:
+    passwords = syntheticVault(size)
+    ChunkedVault.create(CHUNKED_VAULT_PATH, encryptionManager, passwords)
+    repeat = 3 if size >= 100000 else 5
+    store = None
+    try:
+        results[f'chunked.open[{size}]'] = timeIt(lambda: PasswordStore(encryptionManager).close(), repeat=repeat)
+        store = PasswordStore(encryptionManager)
+        websites = list(passwords)
+        rng = random.Random(size)
+
+        def coldLookup() -> None:
+            # Dropping decrypted buckets makes every lookup pay for its chunk.
+            store.passwords.reset()
+            website = rng.choice(websites)
+            store.getPassword(website, next(iter(passwords[website])))
+        results[f'chunked.lookup[{size}]'] = timeIt(coldLookup, repeat=5, number=100)
+
+        def update() -> None:
+            website = rng.choice(websites)
+            store.updatePassword(website, next(iter(passwords[website])), 'abcDE12!updated')
+        results[f'chunked.updatePassword[{size}]'] = timeIt(update, repeat=repeat, number=10)
+    finally:
+        if store:
+            store.close()
+        os.remove(CHUNKED_VAULT_PATH)
+
+
+def writeSqliteVault(path: str, encryptionManager: EncryptionManager, passwords: Dict[str, Dict[str, str]]) -> None:
+    storage = SqliteStorage(path, encryptionManager)
+    try:
+        storage.write(passwords)
+    finally:
+        storage.close()
+
+
+def benchSqlite(results: Dict[str, Any], encryptionManager: EncryptionManager, size: int) -> None:
+    passwords = syntheticVault(size)
+    writeSqliteVault(SQLITE_VAULT_PATH, encryptionManager, passwords)
+    repeat = 3 if size >= 100000 else 5
+    store = None
+    try:
+        results[f'sqlite.open[{size}]'] = timeIt(lambda: PasswordStore(encryptionManager).close(), repeat=repeat)
+        store = PasswordStore(encryptionManager)
+        websites = list(passwords)
+        rng = random.Random(size)
+
+        def coldLookup() -> None:
+            # Dropping the loaded websites makes every lookup query and decrypt its rows.
+            store.passwords.reset()
+            website = rng.choice(websites)
+            store.getPassword(website, next(iter(passwords[website])))
+        results[f'sqlite.lookup[{size}]'] = timeIt(coldLookup, repeat=5, number=100)
+
+        def update() -> None:
+            website = rng.choice(websites)
+            store.updatePassword(website, next(iter(passwords[website])), 'abcDE12!updated')
+        results[f'sqlite.updatePassword[{size}]'] = timeIt(update, repeat=repeat, number=10)
+    finally:
+        if store:
+            store.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(SQLITE_VAULT_PATH + suffix):
+                os.remove(SQLITE_VAULT_PATH + suffix)
+
+
+def benchImport(results: Dict[str, Any], encryptionManager: EncryptionManager, size: int) -> None:
+    passwords = syntheticVault(size)
+    generated = iter(PasswordGenerator().generate(size))
+    with open('import.csv', 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['name', 'url', 'username', 'password'])
+        for website, entries in passwords.items():
+            for email in entries:
+                writer.writerow([website, f'https://www.{website}/login', email, next(generated)])
+
+    def importIntoEmptyVault() -> None:
+        for path in (LEGACY_VAULT_PATH, VAULT_PATH, 'data/passwords.journal'):
+            if os.path.exists(path):
+                os.remove(path)
+        store = PasswordStore(encryptionManager)
+        importFile(store, 'import.csv')
+        store.close()
+    try:
+        results[f'import.csv[{size}]'] = timeIt(importIntoEmptyVault, repeat=3 if size >= 100000 else 5)
+    finally:
+        os.remove('import.csv')
+
+
+def benchBackup(results: Dict[str, Any], encryptionManager: EncryptionManager, size: int) -> None:
+    passwords = syntheticVault(size)
+    for path in (LEGACY_VAULT_PATH, VAULT_PATH, 'data/passwords.journal'):
+        if os.path.exists(path):
+            os.remove(path)
+    with open(VAULT_PATH, 'wb') as f:
+        writeVault(f, encryptionManager, passwords)
+    encryptionManager.saveHashedPassword()
+    store = PasswordStore(encryptionManager)
+    repository = BackupRepository('backups')
+    repeat = 3 if size >= 100000 else 5
+    try:
+        results[f'backup.full[{size}]'] = timeIt(lambda: repository.create(store, full=True), repeat=repeat)
+        websites = list(passwords)
+        rng = random.Random(size)
+
+        def editAndBackup() -> None:
+            with store.batch():
+                for _ in range(10):
+                    website = rng.choice(websites)
+                    store.updatePassword(website, next(iter(passwords[website])), f'abcDE12!{rng.random()}')
+            repository.create(store)
+        results[f'backup.incremental[{size}]'] = timeIt(editAndBackup, repeat=repeat)
+        results[f'backup.restore[{size}]'] = timeIt(
+            lambda: repository.restore(repository.sequences()[-1], BENCH_USERNAME, BENCH_PASSWORD, 'restored', force=True), repeat=repeat)
+    finally:
+        store.close()
+        repository.lock.close()
+        shutil.rmtree('backups', ignore_errors=True)
+        shutil.rmtree('restored', ignore_errors=True)
+
+
+def benchMerge(results: Dict[str, Any], encryptionManager: EncryptionManager, size: int) -> None:
+    passwords = syntheticVault(size)
+    roots = ('mergeOurs', 'mergeTheirs')
+    for root in roots:
+        os.makedirs(os.path.join(root, 'data'))
+        writeSqliteVault(os.path.join(root, SQLITE_VAULT_PATH), encryptionManager, passwords)
+    ours, theirs = (PasswordStore(encryptionManager, root=root) for root in roots)
+    try:
+        # The first merge builds both indexes; later ones only walk the branches that differ.
+        results[f'merge.first[{size}]'] = timeIt(lambda: mergeVaults(ours, theirs), repeat=1)
+        websites = list(passwords)
+        rng = random.Random(size)
+
+        def editAndMerge() -> None:
+            for store in (ours, theirs):
+                with store.batch():
+                    for _ in range(10):
+                        website = rng.choice(websites)
+                        store.updatePassword(website, next(iter(passwords[website])), f'abcDE12!{rng.random()}')
+            mergeVaults(ours, theirs, prefer='ours')
+        results[f'merge.incremental[{size}]'] = timeIt(editAndMerge, repeat=3 if size >= 100000 else 5)
+    finally:
+        ours.close()
+        theirs.close()
+        for root in roots:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def benchAudit(results: Dict[str, Any], size: int) -> None:
+    passwords = syntheticVault(size)
+    generated = iter(PasswordGenerator().generate(size))
+    for entries in passwords.values():
+        for email in entries:
+            entries[email] = next(generated)
+    repeat = 3 if size >= 100000 else 5
+    results[f'audit.build[{size}]'] = timeIt(lambda: PasswordAudit.build(passwords).report(), repeat=repeat)
+    audit = PasswordAudit.build(passwords)
+    websites = list(passwords)
+    rng = random.Random(size)
+
+    def editAndReport() -> None:
+        website = rng.choice(websites)
+        audit.setEntry(website, next(iter(passwords[website])), generateStrongPassword())
+        audit.report()
+    results[f'audit.editAndReport[{size}]'] = timeIt(editAndReport, repeat=5, number=10)
+
+
+def benchUtilities(results: Dict[str, Any]) -> None:
+    urls = syntheticUrls(1000)
+    emails = [f'user{index}@example.com' for index in range(1000)]
+    candidates = [generateStrongPassword() for _ in range(1000)]
+    results['utilities.generateStrongPassword'] = timeIt(generateStrongPassword, repeat=5, number=1000)
+    generator = PasswordGenerator()
+    results['generator.generate[10000]'] = timeIt(lambda: generator.generate(10000), repeat=5)
+    # Clear the LRU so every repeat measures normalization rather than cache hits.
+    results['utilities.shortenURLtoWebsiteName'] = timeIt(
+        lambda: (normalizeCached.cache_clear(), [shortenURLtoWebsiteName(url) for url in urls]), repeat=5)
+    bulkUrls = syntheticUrls(100000)
+    results['domains.normalizeMany[100000]'] = timeIt(lambda: normalizeMany(bulkUrls), repeat=3)
+    results['utilities.validateEmail'] = timeIt(lambda: [validateEmail(email) for email in emails], repeat=5)
+    results['utilities.validatePassword'] = timeIt(lambda: [validatePassword(password) for password in candidates], repeat=5)
+
+
+def benchBreach(results: Dict[str, Any], lines: int = 200000) -> None:
+    # A synthetic corpus in the Pwned Passwords layout, half of the queries hits and half misses.
+    rng = random.Random(lines)
+    hashes = sorted(passwordHash(str(rng.random())) for _ in range(lines))
+    with open('corpus.txt', 'wb') as f:
+        f.write(b''.join(hashValue + b':%d\r\n' % rng.randint(1, 1000) for hashValue in hashes))
+    queries = rng.sample(hashes, 500) + [passwordHash(str(rng.random())) for _ in range(500)]
+    with BreachCorpus('corpus.txt') as corpus:
+        results[f'breach.lookup[plain,{lines}]'] = timeIt(lambda: [corpus.lookup(query) for query in queries], repeat=5)
+        results[f'breach.lookupMany[plain,{lines}]'] = timeIt(lambda: corpus.lookupMany(queries), repeat=5)
+    buildPrefixIndex('corpus.txt')
+    with BreachCorpus('corpus.txt') as corpus:
+        results[f'breach.lookup[prefix,{lines}]'] = timeIt(lambda: [corpus.lookup(query) for query in queries], repeat=5)
+        results[f'breach.lookupMany[prefix,{lines}]'] = timeIt(lambda: corpus.lookupMany(queries), repeat=5)
+    buildBloomFilter('corpus.txt')
+    with BreachCorpus('corpus.txt') as corpus:
+        results[f'breach.lookup[prefix+bloom,{lines}]'] = timeIt(lambda: [corpus.lookup(query) for query in queries], repeat=5)
+    for path in ('corpus.txt', 'corpus.txt.prefix', 'corpus.txt.bloom'):
+        os.remove(path)
+
+
+def benchClipboard(results: Dict[str, Any]) -> None:
+    # Needs a display; the copy is what the UI thread waits for when Copy Password is pressed.
+    if sys.platform != 'win32' and not os.environ.get('DISPLAY'):
+        return
+    import tkinter as tk
+    root = tk.Tk()
+    root.withdraw()
+    try:
+        clipboard = TkClipboard(root, clearAfter=None)
+        password = generateStrongPassword()
+        results['clipboard.copy[tk]'] = timeIt(lambda: clipboard.copy(password), repeat=5, number=100)
+        clipboard.close()
+    finally:
+        root.destroy()
+
+
+def benchStartup(results: Dict[str, Any]) -> None:
+    results[f'startup.import[{STARTUP_MODULE}]'] = timeIt(lambda: runPython(['-c', f'import {STARTUP_MODULE}']), repeat=5)
+
+
+def runSuite(sizes: List[int]) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    fileSizes: Dict[str, Any] = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='pm-bench-') as workdir:
+        # PasswordStore and EncryptionManager use paths relative to the working directory.
+        os.chdir(workdir)
+        try:
+            os.makedirs('data')
+            os.makedirs('resources')
+            encryptionManager = EncryptionManager(BENCH_USERNAME, BENCH_PASSWORD)
+            benchCrypto(results, encryptionManager)
+            for size in sizes:
+                for useJournal in (False, True):
+                    benchStore(results, encryptionManager, size, useJournal)
+                benchVaultFormat(results, fileSizes, encryptionManager, size)
+                benchChunked(results, encryptionManager, size)
+                benchSqlite(results, encryptionManager, size)
+                benchAudit(results, size)
+                benchImport(results, encryptionManager, size)
+                benchBackup(results, encryptionManager, size)
+                benchMerge(results, encryptionManager, size)
+            benchUtilities(results)
+            benchBreach(results)
+            benchClipboard(results)
+            benchStartup(results)
+        finally:
+            os.chdir(cwd)
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z')
+        },
+        'results': results,
+        'fileSizes': fileSizes
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    regressions = []
+    for name, stats in sorted(current['results'].items()):
+        previous = baseline['results'].get(name)
+        if previous is None:
+            print(f"{name:<45} {stats[COMPARE_STAT] * 1000:10.3f} ms   (new)")
+            continue
+        ratio = stats[COMPARE_STAT] / previous[COMPARE_STAT]
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = 'REGRESSION'
+            regressions.append(name)
+        print(f"{name:<45} {stats[COMPARE_STAT] * 1000:10.3f} ms   {ratio:6.2f}x baseline {flag}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Headless benchmarks for crypto, store operations and utilities.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--output', help="Write results as JSON to this file.")
+    parser.add_argument('--compare', metavar='BASELINE', help="Compare against a stored JSON baseline.")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="Relative slowdown of the fastest sample that counts as a regression.")
+    args = parser.parse_args(argv)
+
+    report = runSuite(args.sizes)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        return 1 if compare(report, baseline, args.threshold) else 0
+    if not args.output:
+        json.dump(report, sys.stdout, indent=4)
+        print()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
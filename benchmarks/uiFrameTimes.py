@@ -0,0 +1,78 @@
+import argparse
+import statistics
+import time
+import tkinter as tk
+from tkinter import ttk
+from typing import Callable, Dict, List
+
+from frontend.virtualList import VirtualList
+
+
+def frameTime(root: tk.Tk, action: Callable[[], None]) -> float:
+    start = time.perf_counter()
+    action()
+    root.update_idletasks()
+    return (time.perf_counter() - start) * 1000
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    return {
+        'p50': statistics.median(samples),
+        'p95': samples[int(len(samples) * 0.95) - 1],
+        'max': samples[-1]
+    }
+
+
+def repopulate(listbox: tk.Listbox, items: List[str]) -> None:
+    # What MainWindow did before the virtual list: clear and re-insert every row.
+    listbox.delete(0, tk.END)
+    for item in items:
+        listbox.insert(tk.END, item)
+
+
+def filterSteps(items: List[str], query: str) -> List[List[str]]:
+    return [[item for item in items if item.startswith(query[:length])] for length in range(len(query) + 1)]
+
+
+def measure(rowCount: int, scrollSteps: int) -> Dict[str, Dict[str, float]]:
+    root = tk.Tk()
+    listbox = tk.Listbox(root, width=40)
+    listbox.grid(row=0, column=0)
+    scrollbar = ttk.Scrollbar(root, orient='vertical')
+    scrollbar.grid(row=0, column=1, sticky='ns')
+    root.update()
+
+    items = [f'site{index:07d}.com' for index in range(rowCount)]
+    steps = filterSteps(items, 'site00012')
+    results: Dict[str, Dict[str, float]] = {}
+
+    results['naive load'] = summarize([frameTime(root, lambda: repopulate(listbox, items))])
+    results['naive filter'] = summarize([frameTime(root, lambda step=step: repopulate(listbox, step)) for step in steps])
+    results['naive scroll'] = summarize([frameTime(root, lambda: listbox.yview_scroll(1, 'units'))
+                                         for _ in range(scrollSteps)])
+    listbox.delete(0, tk.END)
+
+    virtualList = VirtualList(listbox, scrollbar)
+    results['virtual load'] = summarize([frameTime(root, lambda: virtualList.setItems(items))])
+    results['virtual filter'] = summarize([frameTime(root, lambda step=step: virtualList.setItems(step)) for step in steps])
+    virtualList.setItems(items)
+    results['virtual scroll'] = summarize([frameTime(root, lambda: virtualList.yview('scroll', '1', 'units'))
+                                           for _ in range(scrollSteps)])
+    results['virtual jump'] = summarize([frameTime(root, lambda step=step: virtualList.yview('moveto', str(step / scrollSteps)))
+                                         for step in range(scrollSteps)])
+    root.destroy()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Frame times for filling, filtering and scrolling the result list.")
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--scroll-steps', type=int, default=200)
+    args = parser.parse_args()
+    for name, stats in measure(args.rows, args.scroll_steps).items():
+        print(f"{name:<16} p50 {stats['p50']:8.2f} ms   p95 {stats['p95']:8.2f} ms   max {stats['max']:8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,517 @@
+import argparse
+import getpass
+import os
+import sys
+import time
+from typing import TYPE_CHECKING, List, Optional
+
+from backend.agentClient import AgentError, agentRunning, defaultSocketPath, sendRequest
+
+if TYPE_CHECKING:
+    from backend.passwordManager import PasswordStore
+
+# The vault, crypto and generator modules are imported inside the handlers that
+# need them, so agent lookups only pay for the socket client.
+
+
+def unlockVault(**storeOptions) -> 'PasswordStore':
+    from backend.encryption import EncryptionManager
+    from backend.passwordManager import PasswordStore
+    username = input("Username: ")
+    password = getpass.getpass("Master password: ")
+    encryptionManager = EncryptionManager(username, password)
+    encryptionManager.saveHashedPassword()
+    if not encryptionManager.verifyPassword(username, password):
+        raise SystemExit("Incorrect Details.")
+    return PasswordStore(encryptionManager, **storeOptions)
+
+
+def migrateJournal(args: argparse.Namespace) -> int:
+    from backend.chunkedVault import isChunkedVault
+    from backend.journal import migrateToJournal
+    from backend.vaultFormat import activeDataPath, isSqliteVault
+    if isChunkedVault(activeDataPath()):
+        print("Chunked vaults already write only the changed chunk; no journal needed.")
+        return 0
+    if isSqliteVault(activeDataPath()):
+        print("SQLite vaults already write only the changed entries; no journal needed.")
+        return 0
+    if migrateToJournal():
+        print("Vault migrated to journal storage.")
+    else:
+        print("Vault already uses journal storage.")
+    return 0
+
+
+def convertVault(args: argparse.Namespace) -> int:
+    from backend.vaultFormat import CHUNKED_VAULT_PATH, SQLITE_VAULT_PATH, VAULT_PATH, activeDataPath
+    sourcePath = activeDataPath()
+    targetPath = CHUNKED_VAULT_PATH if args.chunked else SQLITE_VAULT_PATH if args.sqlite else VAULT_PATH
+    sourceSize = os.path.getsize(sourcePath) if os.path.exists(sourcePath) else 0
+    passwordStore = unlockVault()
+    try:
+        converted = passwordStore.convertFormat(targetPath)
+    finally:
+        passwordStore.close()
+    if not converted:
+        print(f"Vault is already stored as {targetPath}.")
+        return 0
+    print(f"Converted {sourcePath} ({sourceSize:,} bytes) to {targetPath} ({os.path.getsize(targetPath):,} bytes).")
+    return 0
+
+
+def calibrate(args: argparse.Namespace) -> int:
+    from backend.encryption import calibrateKdf, timeKdf
+    kdfParams = calibrateKdf(args.target_ms / 1000, args.kdf)
+    print(f"Selected {kdfParams} ({timeKdf(kdfParams) * 1000:.0f} ms per unlock).")
+    if args.apply:
+        passwordStore = unlockVault()
+        try:
+            passwordStore.changeKdf(kdfParams)
+        finally:
+            passwordStore.close()
+        print("Vault re-encrypted with the new KDF parameters.")
+    return 0
+
+
+def rekey(args: argparse.Namespace) -> int:
+    from backend.encryption import calibrateKdf
+    from backend.rekey import RekeyError, discardRekey, rekeyVault
+    from backend.utilities import validatePassword
+    if agentRunning(defaultSocketPath()):
+        raise SystemExit("Stop the running agent before changing the master password.")
+    if args.restart:
+        discardRekey()
+    passwordStore = unlockVault()
+    username = input("New username (blank to keep): ") or passwordStore.encryptionManager.username
+    password = getpass.getpass("New master password: ")
+    if not validatePassword(password):
+        raise SystemExit("Password does not meet criteria.")
+    if getpass.getpass("Repeat new master password: ") != password:
+        raise SystemExit("Passwords do not match.")
+    kdfParams = calibrateKdf(args.target_ms / 1000, args.kdf) if args.kdf else None
+
+    def progress(done: int, total: int) -> None:
+        print(f"\rRe-encrypting: {done}/{total} units", end='', file=sys.stderr, flush=True)
+    try:
+        report = rekeyVault(passwordStore, username, password, kdfParams, args.workers, progress)
+    except RekeyError as e:
+        print(file=sys.stderr)
+        raise SystemExit(str(e))
+    print(file=sys.stderr)
+    if report['resumedUnits']:
+        print(f"Resumed after {report['resumedUnits']} of {report['units']} units.")
+    encryptSeconds = max(report['encryptSeconds'], 1e-9)
+    print(f"Re-encrypted {report['records']:,} entries ({report['bytes']:,} bytes) with {report['workers']} workers: "
+          f"{report['records'] / encryptSeconds:,.0f} entries/s, {report['bytes'] / encryptSeconds / 1e6:.1f} MB/s.")
+    print(f"Key derivation {report['kdfSeconds'] * 1000:.0f} ms, encryption {report['encryptSeconds'] * 1000:.0f} ms, "
+          f"verification {report['verifySeconds'] * 1000:.0f} ms, swap {report['swapSeconds'] * 1000:.0f} ms.")
+    return 0
+
+
+def breachIndex(args: argparse.Namespace) -> int:
+    from backend.breachCheck import buildBloomFilter, buildPrefixIndex
+    start = time.perf_counter()
+    indexPath = buildPrefixIndex(args.corpus)
+    print(f"Wrote {indexPath} ({os.path.getsize(indexPath):,} bytes) in {time.perf_counter() - start:.1f} s.")
+    if args.bloom_bits:
+        start = time.perf_counter()
+        bloomPath = buildBloomFilter(args.corpus, args.bloom_bits)
+        print(f"Wrote {bloomPath} ({os.path.getsize(bloomPath):,} bytes) in {time.perf_counter() - start:.1f} s.")
+    return 0
+
+
+def breachCheck(args: argparse.Namespace) -> int:
+    from backend.breachCheck import BreachCorpus, BreachCorpusError, auditBreaches
+    try:
+        corpus = BreachCorpus(args.corpus, useIndexes=not args.no_index)
+    except (OSError, BreachCorpusError) as e:
+        raise SystemExit(f"Cannot open breach corpus: {e}")
+    passwordStore = unlockVault()
+    try:
+        with corpus:
+            start = time.perf_counter()
+            breached = auditBreaches(passwordStore, corpus, args.batch)
+            elapsed = time.perf_counter() - start
+            reads = corpus.corpusReads
+    finally:
+        passwordStore.close()
+    for website, email, count in breached:
+        print(f"{website}\t{email}\tseen {count:,} times")
+    print(f"{len(breached)} breached passwords found in {elapsed * 1000:.1f} ms ({reads} corpus reads).", file=sys.stderr)
+    return 1 if breached else 0
+
+
+def auditVault(args: argparse.Namespace) -> int:
+    passwordStore = unlockVault()
+    try:
+        start = time.perf_counter()
+        report = passwordStore.auditHealth()
+        elapsed = time.perf_counter() - start
+        breached = []
+        if args.breach_corpus:
+            from backend.breachCheck import BreachCorpus, auditBreaches
+            with BreachCorpus(args.breach_corpus) as corpus:
+                breached = auditBreaches(passwordStore, corpus, batch=True)
+    finally:
+        passwordStore.close()
+    for group in report.reused:
+        print("Reused: " + ', '.join(f"{email} at {website}" for website, email in group))
+    for website, email, bits, strength in report.weak:
+        print(f"Weak ({strength}, ~{bits:.0f} bits): {email} at {website}")
+    for website, email, failures in report.failing:
+        print(f"Below policy ({'; '.join(failures)}): {email} at {website}")
+    issues = report.issueCount()
+    for website, email, count in breached:
+        print(f"Breached (seen {count:,} times): {email} at {website}")
+    issues += len(breached)
+    print(f"{report.summary()} Audited in {elapsed * 1000:.1f} ms.", file=sys.stderr)
+    return 1 if issues else 0
+
+
+def generate(args: argparse.Namespace) -> int:
+    from backend.passwordGenerator import PasswordGenerator, PasswordPolicy
+    policy = PasswordPolicy(
+        length=args.length,
+        lowercase=None if args.no_lowercase else 3,
+        uppercase=None if args.no_uppercase else 2,
+        digits=None if args.no_digits else 2,
+        special=None if args.no_special else 1,
+        excludeAmbiguous=args.exclude_ambiguous
+    )
+    start = time.perf_counter()
+    passwords = PasswordGenerator(policy).generate(args.count)
+    elapsed = time.perf_counter() - start
+    sys.stdout.write('\n'.join(passwords) + '\n')
+    print(f"Generated {args.count} passwords in {elapsed * 1000:.1f} ms ({args.count / elapsed:,.0f}/s).", file=sys.stderr)
+    return 0
+
+
+def importPasswords(args: argparse.Namespace) -> int:
+    from backend.importer import ImportFormatError, ImportReport, importFile
+
+    def showProgress(report: ImportReport) -> None:
+        print(f"\r{report.rows:,} rows, {report.rowsPerSecond():,.0f} rows/s", end='', file=sys.stderr, flush=True)
+    rejectPath = args.rejects or args.file + '.rejects.csv'
+    passwordStore = unlockVault()
+    try:
+        report = importFile(
+            passwordStore, args.file, args.format, rejectPath,
+            onConflict=args.on_conflict,
+            workers=args.workers or os.cpu_count() or 1,
+            allowWeak=args.allow_weak,
+            batchSize=args.batch_size,
+            onProgress=showProgress
+        )
+    except ImportFormatError as e:
+        raise SystemExit(str(e))
+    finally:
+        passwordStore.close()
+    print(file=sys.stderr)
+    print(report.summary())
+    if report.rejected:
+        print(f"Rejected rows are listed in {rejectPath}.")
+    return 0
+
+
+def createBackup(args: argparse.Namespace) -> int:
+    from backend.backup import BackupRepository
+    passwordStore = unlockVault()
+    try:
+        start = time.perf_counter()
+        manifest = BackupRepository(args.dir).create(passwordStore, args.full)
+        elapsed = time.perf_counter() - start
+    finally:
+        passwordStore.close()
+    if manifest is None:
+        print("Nothing changed since the last backup.")
+    else:
+        kind = 'Full' if manifest['full'] else 'Incremental'
+        print(f"{kind} snapshot {manifest['sequence']}: {manifest['changed']:,} entries written, {manifest['deleted']:,} deleted, "
+              f"{manifest['segment']['size']:,} bytes in {elapsed * 1000:.0f} ms.")
+    return 0
+
+
+def listBackups(args: argparse.Namespace) -> int:
+    from backend.backup import BackupRepository
+    for manifest in BackupRepository(args.dir).manifests():
+        kind = 'full' if manifest['full'] else f"on {manifest['parent']}"
+        print(f"{manifest['sequence']:>6}  {manifest['created']}  {kind:<10}  {manifest['entries']:>8,} entries  "
+              f"{manifest['segment']['size']:>12,} bytes")
+    return 0
+
+
+def verifyBackups(args: argparse.Namespace) -> int:
+    from backend.backup import BackupRepository
+    repository = BackupRepository(args.dir)
+    problems = repository.verify()
+    for problem in problems:
+        print(problem)
+    if not problems:
+        print(f"All {len(repository.sequences())} snapshots are intact.")
+    return 1 if problems else 0
+
+
+def pruneBackups(args: argparse.Namespace) -> int:
+    from backend.backup import BackupRepository
+    removed = BackupRepository(args.dir).prune(args.keep)
+    print(f"Removed {len(removed)} snapshots.")
+    return 0
+
+
+def restoreBackup(args: argparse.Namespace) -> int:
+    from backend.backup import BackupError, BackupRepository
+    if agentRunning(defaultSocketPath()):
+        raise SystemExit("Stop the running agent before restoring a backup.")
+    repository = BackupRepository(args.dir)
+    sequences = repository.sequences()
+    if not sequences:
+        raise SystemExit(f"No backups in {args.dir}.")
+    username = input("Username: ")
+    password = getpass.getpass("Master password: ")
+    start = time.perf_counter()
+    try:
+        manifest = repository.restore(args.snapshot or sequences[-1], username, password, args.into, args.force)
+    except BackupError as e:
+        raise SystemExit(str(e))
+    print(f"Restored snapshot {manifest['sequence']} from {manifest['created']} ({manifest['entries']:,} entries) "
+          f"in {(time.perf_counter() - start) * 1000:.0f} ms.")
+    return 0
+
+
+def mergeCopies(args: argparse.Namespace) -> int:
+    from backend.vaultMerge import MergeError, mergeVaults, openCopy
+    passwordStore = unlockVault()
+    encryptionManager = passwordStore.encryptionManager
+    try:
+        other = openCopy(args.other, encryptionManager.username, encryptionManager.password)
+    except MergeError as e:
+        passwordStore.close()
+        raise SystemExit(str(e))
+    try:
+        report = mergeVaults(passwordStore, other, args.prefer, args.dry_run)
+    except MergeError as e:
+        raise SystemExit(str(e))
+    finally:
+        passwordStore.close()
+        other.close()
+    print(report.summary())
+    settled = f" (took {args.prefer})" if args.prefer else ''
+    for conflict in report.conflicts:
+        print(f"Conflict: {conflict.website} / {conflict.email}{settled}")
+    if report.conflicts and args.prefer is None:
+        print("Each copy kept its own value; edit one of them, or merge again with --prefer ours|theirs.")
+    return 0
+
+
+def startAgent(args: argparse.Namespace) -> int:
+    from backend.agent import AgentServer
+    socketPath = args.socket or defaultSocketPath()
+    passwordStore = unlockVault(lazySecrets=True)
+    try:
+        server = AgentServer(passwordStore, socketPath, args.timeout * 60)
+    except (RuntimeError, PermissionError) as e:
+        raise SystemExit(str(e))
+    print(f"PASSWORD_MANAGER_AGENT_SOCK={socketPath}; export PASSWORD_MANAGER_AGENT_SOCK;")
+    sys.stdout.flush()
+    if not args.foreground and os.fork() != 0:
+        return 0
+    if not args.foreground:
+        os.setsid()
+        with open(os.devnull, 'r+') as devnull:
+            for stream in (sys.stdin, sys.stdout, sys.stderr):
+                os.dup2(devnull.fileno(), stream.fileno())
+    server.serveUntilIdle()
+    return 0
+
+
+def stopAgent(args: argparse.Namespace) -> int:
+    sendRequest({'command': 'lock'}, args.socket)
+    print("Agent locked.")
+    return 0
+
+
+def getPassword(args: argparse.Namespace) -> int:
+    response = sendRequest({'command': 'get', 'website': args.website, 'email': args.email}, args.socket)
+    print(response['password'])
+    return 0
+
+
+def listEntries(args: argparse.Namespace) -> int:
+    if args.website:
+        response = sendRequest({'command': 'list', 'website': args.website}, args.socket)
+        print('\n'.join(response['emails']))
+    else:
+        response = sendRequest({'command': 'list', 'query': args.query or ''}, args.socket)
+        print('\n'.join(response['websites']))
+    return 0
+
+
+def addEntry(args: argparse.Namespace) -> int:
+    if args.generate:
+        from backend.utilities import generateStrongPassword
+        password = generateStrongPassword()
+    else:
+        password = getpass.getpass("Password: ")
+    response = sendRequest({'command': 'add', 'website': args.website, 'email': args.email, 'password': password}, args.socket)
+    print(f"Saved {response['email']} at {response['website']}.")
+    for website, email in response.get('conflicts', []):
+        print(f"Warning: {email} at {website} was also changed elsewhere; the agent's version was kept.", file=sys.stderr)
+    if args.generate:
+        print(password)
+    return 0
+
+
+def buildParser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='cli.py', description="Password Manager command-line tools.")
+    parser.add_argument('--trace', metavar='PREFIX',
+                        help="Record timings of the hot paths to PREFIX.metrics.json and PREFIX.trace.json.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    migrateParser = subparsers.add_parser(
+        'migrate-journal', help="Switch the vault to append-only journal storage.")
+    migrateParser.set_defaults(handler=migrateJournal)
+
+    convertParser = subparsers.add_parser(
+        'convert-vault', help="Rewrite the vault in the compact binary format.")
+    convertFormat = convertParser.add_mutually_exclusive_group()
+    convertFormat.add_argument('--chunked', action='store_true',
+                               help="Use the chunked format, where lookups and edits touch a single chunk.")
+    convertFormat.add_argument('--sqlite', action='store_true',
+                               help="Use an SQLite database, where lookups and edits touch only their own rows.")
+    convertParser.set_defaults(handler=convertVault)
+
+    calibrateParser = subparsers.add_parser(
+        'calibrate-kdf', help="Pick KDF parameters that hit a target unlock time on this machine.")
+    calibrateParser.add_argument('--kdf', choices=['pbkdf2', 'scrypt'], default='scrypt')
+    calibrateParser.add_argument('--target-ms', type=float, default=500)
+    calibrateParser.add_argument('--apply', action='store_true',
+                                 help="Unlock the vault and re-encrypt it with the selected parameters.")
+    calibrateParser.set_defaults(handler=calibrate)
+
+    rekeyParser = subparsers.add_parser(
+        'rekey', help="Change the master password and re-encrypt the whole vault under the new key.")
+    rekeyParser.add_argument('--kdf', choices=['pbkdf2', 'scrypt'],
+                             help="Calibrate new KDF parameters instead of keeping the current ones.")
+    rekeyParser.add_argument('--target-ms', type=float, default=500)
+    rekeyParser.add_argument('--workers', type=int, help="Encryption processes (defaults to the number of CPUs).")
+    rekeyParser.add_argument('--restart', action='store_true', help="Discard an interrupted rekey instead of resuming it.")
+    rekeyParser.set_defaults(handler=rekey)
+
+    auditParser = subparsers.add_parser(
+        'audit', help="Report reused, weak and below-policy passwords across the vault.")
+    auditParser.add_argument('--breach-corpus', help="Also check passwords against a local Pwned Passwords file.")
+    auditParser.set_defaults(handler=auditVault)
+
+    breachIndexParser = subparsers.add_parser(
+        'breach-index', help="Build the lookup index for a local breached-password corpus.")
+    breachIndexParser.add_argument('corpus', help="Pwned Passwords SHA-1 file, ordered by hash.")
+    breachIndexParser.add_argument('--bloom-bits', type=int, default=0,
+                                   help="Also build a Bloom filter with this many bits per entry, so most misses skip the corpus.")
+    breachIndexParser.set_defaults(handler=breachIndex)
+
+    breachCheckParser = subparsers.add_parser(
+        'breach-check', help="Flag stored passwords that appear in a local breached-password corpus.")
+    breachCheckParser.add_argument('corpus', help="Pwned Passwords SHA-1 file, ordered by hash.")
+    breachCheckParser.add_argument('--batch', action='store_true',
+                                   help="Check every password in one sequential pass over the corpus.")
+    breachCheckParser.add_argument('--no-index', action='store_true', help="Ignore a prebuilt index or Bloom filter.")
+    breachCheckParser.set_defaults(handler=breachCheck)
+
+    generateParser = subparsers.add_parser(
+        'generate', help="Generate strong passwords in bulk from the system CSPRNG.")
+    generateParser.add_argument('--count', type=int, default=1)
+    generateParser.add_argument('--length', type=int, default=16)
+    generateParser.add_argument('--exclude-ambiguous', action='store_true', help="Leave out characters like I, l, 1, O and 0.")
+    for characterClass in ('lowercase', 'uppercase', 'digits', 'special'):
+        generateParser.add_argument(f'--no-{characterClass}', action='store_true')
+    generateParser.set_defaults(handler=generate)
+
+    importParser = subparsers.add_parser(
+        'import', help="Import passwords from a browser or password-manager CSV or JSON export.")
+    importParser.add_argument('file')
+    importParser.add_argument('--format', choices=['csv', 'json'], help="Defaults to the file extension.")
+    importParser.add_argument('--on-conflict', choices=['skip', 'overwrite'], default='skip',
+                              help="What to do when an account is already saved with a different password.")
+    importParser.add_argument('--batch-size', type=int, default=2000, help="Rows written to the vault per commit.")
+    importParser.add_argument('--workers', type=int, help="Validation processes (defaults to the number of CPUs).")
+    importParser.add_argument('--allow-weak', action='store_true', help="Import passwords that do not meet the password policy.")
+    importParser.add_argument('--rejects', help="Where to list rejected rows (defaults to FILE.rejects.csv).")
+    importParser.set_defaults(handler=importPasswords)
+
+    backupParser = subparsers.add_parser(
+        'backup', help="Take, check and restore incremental encrypted backups of the vault.")
+    backupSubparsers = backupParser.add_subparsers(dest='backupCommand', required=True)
+    createParser = backupSubparsers.add_parser('create', help="Snapshot the entries changed since the last backup.")
+    createParser.add_argument('--full', action='store_true', help="Store every entry, starting a new chain that older snapshots can be pruned from.")
+    createParser.set_defaults(handler=createBackup)
+    listBackupsParser = backupSubparsers.add_parser('list', help="List the snapshots.")
+    listBackupsParser.set_defaults(handler=listBackups)
+    verifyParser = backupSubparsers.add_parser('verify', help="Check every snapshot's segment against its hash, without decrypting.")
+    verifyParser.set_defaults(handler=verifyBackups)
+    pruneParser = backupSubparsers.add_parser(
+        'prune', help="Delete all but the newest snapshots, and the parents they need.")
+    pruneParser.add_argument('--keep', type=int, required=True)
+    pruneParser.set_defaults(handler=pruneBackups)
+    restoreParser = backupSubparsers.add_parser('restore', help="Rebuild the vault as it was at a snapshot.")
+    restoreParser.add_argument('snapshot', type=int, nargs='?', help="Defaults to the newest.")
+    restoreParser.add_argument('--into', default='.', help="Directory to restore data/ and resources/ into.")
+    restoreParser.add_argument('--force', action='store_true', help="Replace an existing vault.")
+    restoreParser.set_defaults(handler=restoreBackup)
+    for backupCommandParser in (createParser, listBackupsParser, verifyParser, pruneParser, restoreParser):
+        backupCommandParser.add_argument('--dir', default='backups', help="Backup directory (defaults to backups/).")
+
+    mergeParser = subparsers.add_parser(
+        'merge', help="Merge this vault with another copy of it, e.g. one synced from another machine.")
+    mergeParser.add_argument('other', help="Directory holding the other copy's data/ and resources/.")
+    mergeParser.add_argument('--prefer', choices=['ours', 'theirs'],
+                             help="Settle entries both copies changed with this side's value.")
+    mergeParser.add_argument('--dry-run', action='store_true', help="Report what would change without writing either copy.")
+    mergeParser.set_defaults(handler=mergeCopies)
+
+    agentParser = subparsers.add_parser(
+        'agent', help="Keep an unlocked vault in a background agent for fast lookups.")
+    agentSubparsers = agentParser.add_subparsers(dest='agentCommand', required=True)
+    startParser = agentSubparsers.add_parser('start', help="Unlock the vault and start the agent.")
+    startParser.add_argument('--timeout', type=float, default=15, help="Lock after this many idle minutes.")
+    startParser.add_argument('--foreground', action='store_true', help="Serve from this process instead of detaching.")
+    startParser.set_defaults(handler=startAgent)
+    stopParser = agentSubparsers.add_parser('stop', help="Lock the vault and stop the agent.")
+    stopParser.set_defaults(handler=stopAgent)
+
+    getParser = subparsers.add_parser('get', help="Print a stored password using the running agent.")
+    getParser.add_argument('website')
+    getParser.add_argument('--email', help="Required when the website has more than one account.")
+    getParser.set_defaults(handler=getPassword)
+
+    listParser = subparsers.add_parser('list', help="List websites, or the accounts for one website, using the running agent.")
+    listParser.add_argument('query', nargs='?')
+    listParser.add_argument('--website')
+    listParser.set_defaults(handler=listEntries)
+
+    addParser = subparsers.add_parser('add', help="Store a password using the running agent.")
+    addParser.add_argument('website')
+    addParser.add_argument('email')
+    addParser.add_argument('--generate', action='store_true', help="Generate a strong password instead of prompting.")
+    addParser.set_defaults(handler=addEntry)
+
+    for agentCommandParser in (startParser, stopParser, getParser, listParser, addParser):
+        agentCommandParser.add_argument('--socket', help="Agent socket path (defaults to $PASSWORD_MANAGER_AGENT_SOCK).")
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = buildParser().parse_args(argv)
+    if args.trace:
+        from backend.instrumentation import enableTracing
+        enableTracing(args.trace)
+    try:
+        return args.handler(args)
+    except AgentError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,57 @@
+import tkinter as tk
+from tkinter import ttk
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from backend.passwordManager import PasswordStore
+
+
+class HealthReportWindow(tk.Toplevel):
+    def __init__(self, parent: tk.Tk, passwordStore: 'PasswordStore') -> None:
+        super().__init__(parent)
+        self.title("Password Health")
+        self.passwordStore: 'PasswordStore' = passwordStore
+        self.createWidgets()
+        self.transient(parent)
+        self.refresh()
+
+    def createWidgets(self) -> None:
+        self.summaryVar: tk.StringVar = tk.StringVar()
+        summaryLabel = ttk.Label(self, textvariable=self.summaryVar, wraplength=520)
+        summaryLabel.grid(row=0, column=0, columnspan=2, sticky='w', padx=10, pady=10)
+
+        self.tree: ttk.Treeview = ttk.Treeview(self, columns=('account', 'detail'), show='tree headings', height=15)
+        self.tree.heading('#0', text="Issue")
+        self.tree.heading('account', text="Account")
+        self.tree.heading('detail', text="Details")
+        self.tree.column('#0', width=140)
+        self.tree.column('account', width=260)
+        self.tree.column('detail', width=240)
+        self.tree.grid(row=1, column=0, sticky='nsew', padx=(10, 0))
+
+        scrollbar = ttk.Scrollbar(self, orient='vertical', command=self.tree.yview)
+        scrollbar.grid(row=1, column=1, sticky='ns', padx=(0, 10))
+        self.tree.configure(yscrollcommand=scrollbar.set)
+
+        refreshButton = ttk.Button(self, text="Refresh", command=self.refresh)
+        refreshButton.grid(row=2, column=0, sticky='e', padx=5, pady=10)
+        closeButton = ttk.Button(self, text="Close", command=self.destroy)
+        closeButton.grid(row=2, column=1, sticky='e', padx=10, pady=10)
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(1, weight=1)
+
+    def refresh(self) -> None:
+        # Only entries edited since the last report are analysed again.
+        report = self.passwordStore.auditHealth()
+        self.summaryVar.set(report.summary())
+        self.tree.delete(*self.tree.get_children())
+        reused = self.tree.insert('', tk.END, text=f"Reused ({len(report.reused)})", open=True)
+        for index, group in enumerate(report.reused, 1):
+            for website, email in group:
+                self.tree.insert(reused, tk.END, text=f"Group {index}", values=(f"{email} at {website}", f"shared by {len(group)} accounts"))
+        weak = self.tree.insert('', tk.END, text=f"Weak ({len(report.weak)})", open=True)
+        for website, email, bits, strength in report.weak:
+            self.tree.insert(weak, tk.END, values=(f"{email} at {website}", f"{strength}, about {bits:.0f} bits"))
+        failing = self.tree.insert('', tk.END, text=f"Below policy ({len(report.failing)})", open=True)
+        for website, email, failures in report.failing:
+            self.tree.insert(failing, tk.END, values=(f"{email} at {website}", '; '.join(failures)))
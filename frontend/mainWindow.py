@@ -1,12 +1,26 @@
+import threading
 import tkinter as tk
 from tkinter import ttk, messagebox
-from typing import Any, Optional
+from typing import TYPE_CHECKING, Any, List, Optional, Tuple
 from .dialogs import MasterPasswordDialog
+from .healthReport import HealthReportWindow
 from .passwordForms import AddNewPasswordForm, EditPasswordForm
-from backend.passwordManager import PasswordStore
-from backend.encryption import EncryptionManager
+from .virtualList import VirtualList
+from backend.clipboard import attachClipboard
+from backend.instrumentation import instrumented
+from backend.persistence import PersistenceError
 from backend.utilities import copyToClipboard, validateEmail
 
+if TYPE_CHECKING:
+    from backend.vaultSync import VaultConflict
+
+SEARCH_DEBOUNCE_MS: int = 150
+# Websites fetched per search; scrolling to the end of them fetches as many again.
+SEARCH_PAGE_ROWS: int = 200
+# How often to look for edits saved by another window or the agent; a quiet check is one stat.
+VAULT_POLL_MS: int = 2000
+VAULT_POLL_CHECK_MS: int = 50
+
 
 class MainWindow(tk.Tk):
     def __init__(self, *args, **kwargs):
@@ -14,7 +28,14 @@ class MainWindow(tk.Tk):
         self.title("Password Manager")
         self.passwordStore = None
         self.displayingEmails = False
+        self.pendingSearch: Optional[str] = None
+        self.websiteQuery = ''
+        self.websiteLimit = SEARCH_PAGE_ROWS
+        self.pollThread: Optional[threading.Thread] = None
+        self.pollResult: Optional[Tuple[int, Optional[Exception]]] = None
+        self.clipboard = attachClipboard(self)
         self.createWidgets()
+        self.protocol('WM_DELETE_WINDOW', self.onClose)
 
     def createWidgets(self) -> None:
         # Search Bar
@@ -29,21 +50,27 @@ class MainWindow(tk.Tk):
         def onFocusout(event): return self.onFocusout(placeholderText, event)
         self.searchEntry.bind('<FocusIn>', onEntryClick)
         self.searchEntry.bind('<FocusOut>', onFocusout)
-        self.searchVar.trace_add('write', self.updateListbox)
+        self.searchVar.trace_add('write', self.scheduleListboxUpdate)
 
         # Listbox and Scrollbar
         self.listbox = tk.Listbox(self, width=40)
-        self.listbox.bind('<<ListboxSelect>>', self.onWebsiteSelect)
         self.listbox.grid(row=1, column=0, columnspan=3,
                           rowspan=4, padx=10, pady=10)
 
-        self.scrollbar = ttk.Scrollbar(
-            self, orient="vertical", command=self.listbox.yview)
-        self.listbox.config(yscrollcommand=self.scrollbar.set)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical")
         self.scrollbar.grid(row=1, column=3, sticky='ns', rowspan=4)
 
+        # Only the visible rows are materialized, however large the vault is.
+        self.resultList = VirtualList(self.listbox, self.scrollbar, onReachEnd=self.loadMoreWebsites)
+        self.resultList.bindSelect(self.onWebsiteSelect)
+
         # Create email buttons
         self.createEmailButtons()
+
+        # Save status reported by the background writer
+        self.statusVar = tk.StringVar()
+        self.statusLabel = ttk.Label(self, textvariable=self.statusVar, foreground='grey')
+        self.statusLabel.grid(row=5, column=0, columnspan=4, sticky='w', padx=10, pady=(0, 5))
     
     def onEntryClick(self, placeholderText, event):
         if self.searchEntry.get() == placeholderText:
@@ -66,34 +93,52 @@ class MainWindow(tk.Tk):
                                saveCallback=self.updateListbox)
         self.addButton.focus_set()
 
+    def scheduleListboxUpdate(self, *args) -> None:
+        # Wait for a pause in typing instead of searching on every keystroke.
+        if self.pendingSearch:
+            self.after_cancel(self.pendingSearch)
+        self.pendingSearch = self.after(SEARCH_DEBOUNCE_MS, self.updateListbox)
+
+    @instrumented('MainWindow.updateListbox')
     def updateListbox(self, *args, **kwargs) -> None:
+        if self.pendingSearch:
+            self.after_cancel(self.pendingSearch)
+            self.pendingSearch = None
+        if not self.passwordStore:
+            return
         searchTerm = self.searchVar.get().lower()
-        self.listbox.delete(0, tk.END)            
         if searchTerm == "search the list...":
             searchTerm = ""
 
         if self.displayingEmails:
-            for email in sorted(self.passwordStore.getEmails(self.selectedWebsite)):
-                if email.lower().startswith(searchTerm):
-                    self.listbox.insert(tk.END, email)
+            emails = sorted(self.passwordStore.getEmails(self.selectedWebsite))
+            # Prefix matches first, then the remaining substring matches.
+            emails.sort(key=lambda email: not email.lower().startswith(searchTerm))
+            self.resultList.setItems([email for email in emails if searchTerm in email.lower()])
         else:
-            for website in sorted(self.passwordStore.passwords.keys()):
-                if website.lower().startswith(searchTerm):
-                    self.listbox.insert(tk.END, website)
+            self.showWebsites(searchTerm)
+
+    def showWebsites(self, searchTerm: str) -> None:
+        self.websiteQuery = searchTerm
+        self.websiteLimit = SEARCH_PAGE_ROWS
+        self.resultList.setItems(self.passwordStore.search(searchTerm, self.websiteLimit))
+
+    def loadMoreWebsites(self) -> None:
+        # A short page means the search had nothing more to give.
+        if self.displayingEmails or not self.passwordStore or len(self.resultList.items) < self.websiteLimit:
+            return
+        self.websiteLimit *= 2
+        self.resultList.extendItems(self.passwordStore.search(self.websiteQuery, self.websiteLimit))
 
     def onWebsiteSelect(self, event: Any) -> None:
         if not self.passwordStore:
             return
         self.clearButtons()
-        selection = self.listbox.curselection()
+        selection = self.resultList.selectedItem()
         if selection:
-            index = selection[0]
-            self.selectedWebsite = self.listbox.get(index)
-            emails = sorted(self.passwordStore.getEmails(self.selectedWebsite))
-            self.listbox.delete(0, tk.END)
-            for email in emails:
-                self.listbox.insert(tk.END, email)
-            self.listbox.bind('<<ListboxSelect>>', self.onEmailSelect)
+            self.selectedWebsite = selection
+            self.resultList.setItems(sorted(self.passwordStore.getEmails(self.selectedWebsite)))
+            self.resultList.bindSelect(self.onEmailSelect)
             self.goBackButton['state'] = 'normal'
             self.displayingEmails = True
 
@@ -108,18 +153,20 @@ class MainWindow(tk.Tk):
             self, text="Delete Password", state='disabled', command=self.deletePassword, width=15)
         self.goBackButton = ttk.Button(
             self, text="Go Back", state='disabled', command=self.goBack, width=15)
+        self.healthButton = ttk.Button(
+            self, text="Health Report", command=self.showHealthReport, width=15)
 
         self.addButton.grid(row=0, column=4, padx=10, pady=10)
         self.copyButton.grid(row=1, column=4, padx=5)
         self.editButton.grid(row=2, column=4, padx=5)
         self.deleteButton.grid(row=3, column=4, padx=5)
         self.goBackButton.grid(row=4, column=4, padx=5)
+        self.healthButton.grid(row=5, column=4, padx=5, pady=(0, 10))
 
     def onEmailSelect(self, event: Any) -> None:
-        selection = self.listbox.curselection()
+        selection = self.resultList.selectedItem()
         if selection:
-            index = selection[0]
-            self.selectedEmail = self.listbox.get(index)
+            self.selectedEmail = selection
             self.copyButton['state'] = 'normal'
             self.editButton['state'] = 'normal'
             self.deleteButton['state'] = 'normal'
@@ -140,16 +187,18 @@ class MainWindow(tk.Tk):
         if messagebox.askyesno("Confirm Delete", f"Delete password for {self.selectedEmail} at {self.selectedWebsite}?"):
             self.passwordStore.deletePassword(
                 self.selectedWebsite, self.selectedEmail)
-            self.listbox.delete(self.listbox.curselection()[0])
+            self.resultList.removeSelected()
             self.clearButtons()
 
+    def showHealthReport(self) -> None:
+        if self.passwordStore:
+            HealthReportWindow(self, self.passwordStore)
+
     def goBack(self):
         self.displayingEmails = False
-        self.listbox.bind('<<ListboxSelect>>', self.onWebsiteSelect)
-        self.listbox.delete(0, tk.END)
+        self.resultList.bindSelect(self.onWebsiteSelect)
         if self.passwordStore:
-            for website in sorted(self.passwordStore.passwords.keys()):
-                self.listbox.insert(tk.END, website)
+            self.showWebsites('')
         self.clearButtons()
         self.goBackButton['state'] = 'disabled'
 
@@ -158,19 +207,96 @@ class MainWindow(tk.Tk):
         self.editButton['state'] = 'disabled'
         self.deleteButton['state'] = 'disabled'
 
+    def onSaveStatus(self, error: Optional[BaseException]) -> None:
+        # Called on the writer thread; hand over to the Tk thread.
+        self.after(0, self.showSaveStatus, error)
+
+    def showSaveStatus(self, error: Optional[BaseException]) -> None:
+        if error:
+            self.statusVar.set("Saving failed.")
+            messagebox.showerror("Error", f"Could not save your changes: {error}")
+        else:
+            self.statusVar.set("All changes saved.")
+
+    def pollVault(self) -> None:
+        # A reload waits for the vault lock and may decrypt the whole vault, so it runs
+        # off the Tk thread, which only picks up the outcome.
+        self.pollResult = None
+        self.pollThread = threading.Thread(target=self.checkVault, name='vault-poll', daemon=True)
+        self.pollThread.start()
+        self.after(VAULT_POLL_CHECK_MS, self.showVaultChanges)
+
+    def checkVault(self) -> None:
+        # No Tk calls here: onClose waits for this thread on the Tk thread.
+        try:
+            self.pollResult = (self.passwordStore.checkForChanges(), None)
+        except Exception as e:
+            self.pollResult = (0, e)
+
+    def showVaultChanges(self) -> None:
+        if self.pollThread.is_alive():
+            self.after(VAULT_POLL_CHECK_MS, self.showVaultChanges)
+            return
+        changed, error = self.pollResult
+        if error:
+            self.statusVar.set(f"Could not load outside changes: {error}")
+        elif changed:
+            self.updateListbox()
+            self.clearButtons()
+        self.after(VAULT_POLL_MS, self.pollVault)
+
+    def onConflict(self, conflicts: List['VaultConflict']) -> None:
+        # May be called on the writer thread; hand over to the Tk thread.
+        self.after(0, self.showConflicts, conflicts)
+
+    def showConflicts(self, conflicts: List['VaultConflict']) -> None:
+        accounts = '\n'.join(f"{conflict.email} at {conflict.website}" for conflict in conflicts[:10])
+        if len(conflicts) > 10:
+            accounts += f"\n...and {len(conflicts) - 10} more"
+        if not messagebox.askyesno("Conflicting Changes",
+                                   f"These passwords were also changed in another window:\n\n{accounts}\n\n"
+                                   "Your versions were kept. Use the other versions instead?"):
+            return
+        for conflict in conflicts:
+            if conflict.external is None:
+                self.passwordStore.deletePassword(conflict.website, conflict.email)
+            else:
+                self.passwordStore.addPassword(conflict.website, conflict.email, conflict.external)
+        self.updateListbox()
+        self.clearButtons()
+
+    def onClose(self) -> None:
+        if self.passwordStore:
+            if self.pollThread:
+                self.pollThread.join()
+            try:
+                self.passwordStore.close()
+            except PersistenceError as e:
+                if not messagebox.askyesno("Save Failed", f"{e.__cause__}\nQuit without saving the latest changes?"):
+                    return
+        # A copied password would otherwise outlive the app on platforms that keep the clipboard.
+        self.clipboard.close()
+        self.destroy()
+
     def login(self):
         self.withdraw()
         mpd: MasterPasswordDialog = MasterPasswordDialog(self)
         try:
             masterUsername = mpd.result[0]
             masterPassword = mpd.result[1]
-            self.encryptionManager: EncryptionManager = EncryptionManager(
+            # The crypto stack and the store load only once there are credentials to use them.
+            from backend.encryption import EncryptionManager
+            from backend.passwordManager import PasswordStore
+            self.encryptionManager: 'EncryptionManager' = EncryptionManager(
                 masterUsername, masterPassword)
             self.encryptionManager.saveHashedPassword()
             if self.encryptionManager.verifyPassword(masterUsername, masterPassword):
                 self.deiconify()
-                self.passwordStore = PasswordStore(self.encryptionManager)
+                self.passwordStore = PasswordStore(
+                    self.encryptionManager, lazySecrets=True, backgroundWrites=True,
+                    onSaveStatus=self.onSaveStatus, onConflict=self.onConflict, backgroundSearch=True)
                 self.updateListbox()
+                self.after(VAULT_POLL_MS, self.pollVault)
                 self.mainloop()
             else:
                 messagebox.showerror(
@@ -1,17 +1,19 @@
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
-from typing import Callable, Optional
+from typing import TYPE_CHECKING, Callable, Optional
 
-from backend.passwordManager import PasswordStore
 from backend.utilities import generateStrongPassword, validatePassword, copyToClipboard, shortenURLtoWebsiteName, validateEmail
 
+if TYPE_CHECKING:
+    from backend.passwordManager import PasswordStore
+
 
 class FormBase(tk.Toplevel):
     def __init__(
         self,
         parent: tk.Tk,
-        passwordStore: PasswordStore,
+        passwordStore: 'PasswordStore',
         title: str,
         website: str = '',
         email: str = '',
@@ -20,7 +22,7 @@ class FormBase(tk.Toplevel):
     ) -> None:
         super().__init__(parent)
         self.title(title)
-        self.passwordStore: PasswordStore = passwordStore
+        self.passwordStore: 'PasswordStore' = passwordStore
         self.website: str = website
         self.email: str = email
         self.password: str = password
@@ -99,7 +101,7 @@ class AddNewPasswordForm(FormBase):
     def __init__(
             self,
             parent: tk.Tk,
-            passwordStore: PasswordStore,
+            passwordStore: 'PasswordStore',
             prefillWebsite: str = '',
             saveCallback: Optional[Callable] = None
         ) -> None:
@@ -137,7 +139,7 @@ class EditPasswordForm(FormBase):
     def __init__(
         self,
         parent: tk.Tk,
-        passwordStore: PasswordStore,
+        passwordStore: 'PasswordStore',
         website: str,
         email: str,
         password: str,
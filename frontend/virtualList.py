@@ -0,0 +1,126 @@
+import tkinter as tk
+from tkinter import ttk
+from difflib import SequenceMatcher
+from typing import Callable, Optional, Sequence
+
+OVERSCAN_ROWS: int = 20
+
+
+# Shows a window of a (possibly huge) sequence in a tk.Listbox: only the visible
+# rows plus an overscan margin are inserted. Scrolling inside the margin is native
+# Tk scrolling; near either edge the window moves and only the rows that entered
+# or left it are inserted or deleted.
+class VirtualList:
+    def __init__(self, listbox: tk.Listbox, scrollbar: ttk.Scrollbar, overscan: int = OVERSCAN_ROWS,
+                 onReachEnd: Optional[Callable[[], None]] = None):
+        self.listbox = listbox
+        self.scrollbar = scrollbar
+        self.overscan = overscan
+        # Called once the window reaches the last item, e.g. to fetch the next page of results.
+        self.onReachEnd = onReachEnd
+        self.items: Sequence[str] = []
+        self.window: list[str] = []
+        self.windowStart = 0
+        self.top = 0
+        self.selectedIndex: Optional[int] = None
+        self.listbox.config(yscrollcommand=self.onListboxScroll)
+        self.scrollbar.config(command=self.yview)
+        self.listbox.bind('<<ListboxSelect>>', self.onSelect)
+
+    @property
+    def visibleRows(self) -> int:
+        return int(self.listbox.cget('height'))
+
+    def setItems(self, items: Sequence[str], keepPosition: bool = False) -> None:
+        self.items = items
+        self.selectedIndex = None
+        if not keepPosition:
+            self.top = 0
+        self.render()
+
+    def extendItems(self, items: Sequence[str]) -> None:
+        # The same items followed by more, so the position and selection stay.
+        self.items = items
+        self.render()
+
+    def get(self, index: int) -> str:
+        return self.items[index]
+
+    def selectedItem(self) -> Optional[str]:
+        if self.selectedIndex is None or self.selectedIndex >= len(self.items):
+            return None
+        return self.items[self.selectedIndex]
+
+    def bindSelect(self, callback: Callable[[tk.Event], None]) -> None:
+        def onSelect(event: tk.Event) -> None:
+            self.onSelect(event)
+            callback(event)
+        self.listbox.bind('<<ListboxSelect>>', onSelect)
+
+    def onSelect(self, event: tk.Event) -> None:
+        selection = self.listbox.curselection()
+        self.selectedIndex = self.windowStart + selection[0] if selection else None
+
+    def removeSelected(self) -> None:
+        if self.selectedIndex is None:
+            return
+        items = list(self.items)
+        del items[self.selectedIndex]
+        self.setItems(items, keepPosition=True)
+
+    def render(self) -> None:
+        total = len(self.items)
+        self.top = max(0, min(self.top, total - self.visibleRows))
+        start = max(0, self.top - self.overscan)
+        end = min(total, self.top + self.visibleRows + self.overscan)
+        self.applyWindow(start, list(self.items[start:end]))
+        self.listbox.yview(self.top - start)
+        self.updateScrollbar()
+        if self.onReachEnd and end == total:
+            self.listbox.after_idle(self.onReachEnd)
+
+    def applyWindow(self, start: int, window: list[str]) -> None:
+        opcodes = SequenceMatcher(None, self.window, window, autojunk=False).get_opcodes()
+        # Apply from the bottom up so earlier row indices stay valid.
+        for tag, i1, i2, j1, j2 in reversed(opcodes):
+            if tag in ('replace', 'delete'):
+                self.listbox.delete(i1, i2 - 1)
+            if tag in ('replace', 'insert'):
+                self.listbox.insert(i1, *window[j1:j2])
+        self.window = window
+        self.windowStart = start
+        self.listbox.selection_clear(0, tk.END)
+        if self.selectedIndex is not None and start <= self.selectedIndex < start + len(window):
+            self.listbox.selection_set(self.selectedIndex - start)
+
+    def updateScrollbar(self) -> None:
+        total = len(self.items)
+        if not total:
+            self.scrollbar.set(0.0, 1.0)
+            return
+        self.scrollbar.set(self.top / total, min(1.0, (self.top + self.visibleRows) / total))
+
+    def yview(self, action: str, amount: str, unit: str = '') -> None:
+        if action == 'moveto':
+            self.top = int(float(amount) * len(self.items))
+        elif action == 'scroll':
+            step = self.visibleRows if unit == 'pages' else 1
+            self.top += int(amount) * step
+        self.render()
+
+    def onListboxScroll(self, first: str, last: str) -> None:
+        if not self.window:
+            self.updateScrollbar()
+            return
+        # Tk scrolled natively (wheel, keys, drag-select) inside the window.
+        self.top = self.windowStart + round(float(first) * len(self.window))
+        nearTop = self.top - self.windowStart < self.overscan // 2 and self.windowStart > 0
+        nearBottom = (self.windowStart + len(self.window)) - (self.top + self.visibleRows) < self.overscan // 2 \
+            and self.windowStart + len(self.window) < len(self.items)
+        if nearTop or nearBottom:
+            active = self.windowStart + self.listbox.index(tk.ACTIVE)
+            self.render()
+            if self.windowStart <= active < self.windowStart + len(self.window):
+                self.listbox.activate(active - self.windowStart)
+        else:
+            self.updateScrollbar()
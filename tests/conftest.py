@@ -0,0 +1,77 @@
+import os
+import sys
+from typing import Dict, Iterator
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.encryption import EncryptionManager
+from backend.journal import JOURNAL_PATH, migrateToJournal
+from backend.passwordManager import PasswordStore
+from backend.storage import openStorage
+from backend.vaultFormat import CHUNKED_VAULT_PATH, LEGACY_VAULT_PATH, SQLITE_VAULT_PATH, VAULT_PATH
+
+USERNAME: str = 'tester'
+PASSWORD: str = 'abcDE12!testing'
+# Kept in the vault header, so every unlock in the tests derives keys cheaply.
+TEST_KDF: Dict[str, int] = {'name': 'pbkdf2', 'iterations': 1000}
+VAULT_FORMATS = ('legacy', 'binary', 'journal', 'chunked', 'sqlite')
+FORMAT_PATHS: Dict[str, str] = {
+    'legacy': LEGACY_VAULT_PATH,
+    'binary': VAULT_PATH,
+    'journal': VAULT_PATH,
+    'chunked': CHUNKED_VAULT_PATH,
+    'sqlite': SQLITE_VAULT_PATH
+}
+
+
+def sampleEntries(count: int = 40) -> Dict[str, Dict[str, str]]:
+    entries = {f'site{i}.com': {f'user{i}@example.com': f'Pw{i}!abcXYZ'} for i in range(count)}
+    entries['shared.com'] = {'first@example.com': 'First!pw1abc', 'second@example.com': 'Second!pw2abc'}
+    return entries
+
+
+def unlock(root: str = '', username: str = USERNAME, password: str = PASSWORD) -> EncryptionManager:
+    return EncryptionManager(username, password, os.path.join(root, 'resources/hashSalt'),
+                             os.path.join(root, 'data/masterHash'), TEST_KDF)
+
+
+def createVault(vaultFormat: str, entries: Dict[str, Dict[str, str]], root: str = '') -> None:
+    for directory in ('data', 'resources'):
+        os.makedirs(os.path.join(root, directory), exist_ok=True)
+    encryptionManager = unlock(root)
+    encryptionManager.saveHashedPassword()
+    openStorage(os.path.join(root, FORMAT_PATHS[vaultFormat]), encryptionManager).write(entries)
+    if vaultFormat == 'journal':
+        migrateToJournal(os.path.join(root, VAULT_PATH), os.path.join(root, JOURNAL_PATH))
+
+
+def contents(store: PasswordStore) -> Dict[str, Dict[str, str]]:
+    return {website: dict(entries) for website, entries in store.plaintextPasswords().items()}
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch) -> str:
+    # Vault paths are relative to the working directory.
+    monkeypatch.chdir(tmp_path)
+    return str(tmp_path)
+
+
+@pytest.fixture(params=VAULT_FORMATS)
+def vaultFormat(request, workdir) -> str:
+    createVault(request.param, sampleEntries())
+    return request.param
+
+
+@pytest.fixture
+def openStore() -> Iterator:
+    stores = []
+
+    def opener(root: str = '', username: str = USERNAME, password: str = PASSWORD, **storeOptions) -> PasswordStore:
+        store = PasswordStore(unlock(root, username, password), root=root, **storeOptions)
+        stores.append(store)
+        return store
+    yield opener
+    for store in stores:
+        store.close()
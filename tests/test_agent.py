@@ -0,0 +1,109 @@
+import os
+import shutil
+import socket
+import stat
+import tempfile
+import threading
+import time
+
+import pytest
+
+from backend.agent import AgentServer
+from backend.agentClient import AgentError, agentRunning, sendRequest
+from backend.passwordManager import PasswordStore
+from conftest import createVault, sampleEntries, unlock
+
+
+@pytest.fixture
+def socketPath():
+    # Unix socket paths are limited to about 100 bytes, too short for pytest's tmp_path.
+    directory = tempfile.mkdtemp(prefix='pm-agent-')
+    yield os.path.join(directory, 'agent', 'agent.sock')
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+@pytest.fixture
+def startAgent(workdir, socketPath):
+    createVault('binary', sampleEntries())
+    threads = []
+
+    def start(idleTimeout=60.0):
+        server = AgentServer(PasswordStore(unlock()), socketPath, idleTimeout)
+        thread = threading.Thread(target=server.serveUntilIdle, daemon=True)
+        thread.start()
+        threads.append((server, thread))
+        return server, thread
+    yield start
+    for server, thread in threads:
+        server.running = False
+        thread.join(5)
+
+
+def testCommands(startAgent, socketPath):
+    startAgent()
+    assert sendRequest({'command': 'get', 'website': 'https://www.site1.com/login'}, socketPath)['password'] == 'Pw1!abcXYZ'
+    with pytest.raises(AgentError, match='pass an email'):
+        sendRequest({'command': 'get', 'website': 'shared.com'}, socketPath)
+    added = sendRequest({'command': 'add', 'website': 'new.com', 'email': 'new@example.com', 'password': 'abcDE12!newPw'}, socketPath)
+    assert added['conflicts'] == []
+    assert sendRequest({'command': 'list', 'website': 'new.com'}, socketPath)['emails'] == ['new@example.com']
+    with pytest.raises(AgentError, match='criteria'):
+        sendRequest({'command': 'add', 'website': 'new.com', 'email': 'new@example.com', 'password': 'weak'}, socketPath)
+    with pytest.raises(AgentError, match='Unknown command'):
+        sendRequest({'command': 'dump'}, socketPath)
+
+
+def testSocketIsPrivate(startAgent, socketPath):
+    startAgent()
+    assert stat.S_IMODE(os.stat(socketPath).st_mode) == 0o600
+    assert stat.S_IMODE(os.stat(os.path.dirname(socketPath)).st_mode) == 0o700
+
+
+def testOtherUsersAreRefused(startAgent, socketPath, monkeypatch):
+    if not hasattr(socket, 'SO_PEERCRED'):
+        pytest.skip("The platform does not report the peer's uid.")
+    startAgent()
+    uid = os.getuid()
+    monkeypatch.setattr('backend.agent.os.getuid', lambda: uid + 1)
+    # Dropped before any reply, which the client sees as a closed or reset connection.
+    with pytest.raises((AgentError, ConnectionResetError)):
+        sendRequest({'command': 'get', 'website': 'site1.com'}, socketPath)
+
+
+def testFailedRequestKeepsAgentRunning(startAgent, socketPath, monkeypatch):
+    server, _ = startAgent()
+
+    def unreadable():
+        raise OSError("vault unreadable")
+    with monkeypatch.context() as patch:
+        patch.setattr(server.passwordStore, 'checkForChanges', unreadable)
+        with pytest.raises(AgentError, match='vault unreadable'):
+            sendRequest({'command': 'list'}, socketPath)
+    with pytest.raises(AgentError, match='Malformed'):
+        sendRequest({'command': 'get'}, socketPath)
+    assert agentRunning(socketPath)
+
+
+def testSilentClientDoesNotBlockOthers(startAgent, socketPath):
+    startAgent()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as silent:
+        silent.connect(socketPath)
+        started = time.monotonic()
+        assert sendRequest({'command': 'ping'}, socketPath, timeout=4)['ok']
+        assert time.monotonic() - started < 4
+
+
+def testAgentStopsWhenIdle(startAgent, socketPath):
+    server, thread = startAgent(idleTimeout=0.5)
+    assert agentRunning(socketPath)
+    thread.join(5)
+    assert not thread.is_alive()
+    assert not os.path.exists(socketPath)
+    assert not agentRunning(socketPath)
+
+
+def testLockStopsAgent(startAgent, socketPath):
+    _, thread = startAgent()
+    sendRequest({'command': 'lock'}, socketPath)
+    thread.join(5)
+    assert not thread.is_alive() and not os.path.exists(socketPath)
@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+from backend.backup import BackupError, BackupRepository
+from backend.vaultFormat import SQLITE_VAULT_PATH, VAULT_PATH, activeDataPath
+from conftest import FORMAT_PATHS, PASSWORD, USERNAME, contents, sampleEntries
+
+
+def snapshotHistory(store, repository):
+    # The vault's contents at each snapshot, after a full snapshot and two incremental ones.
+    history = {}
+    repository.create(store)
+    history[1] = sampleEntries()
+    store.updatePassword('site1.com', 'user1@example.com', 'Changed!pw1')
+    store.addPassword('new.com', 'new@example.com', 'New!pw1abcd')
+    repository.create(store)
+    history[2] = contents(store)
+    store.deletePassword('site2.com', 'user2@example.com')
+    store.updateEmail('site3.com', 'user3@example.com', 'renamed@example.com')
+    repository.create(store)
+    history[3] = contents(store)
+    return history
+
+
+def testRestoreEverySnapshot(vaultFormat, openStore):
+    repository = BackupRepository('backups')
+    history = snapshotHistory(openStore(), repository)
+    assert repository.sequences() == [1, 2, 3]
+    assert repository.verify() == []
+    for sequence, expected in history.items():
+        root = f'restored{sequence}'
+        repository.restore(sequence, USERNAME, PASSWORD, root)
+        assert contents(openStore(root)) == expected
+
+
+def testNothingChangedSkipsSnapshot(vaultFormat, openStore):
+    repository = BackupRepository('backups')
+    store = openStore()
+    assert repository.create(store) is not None
+    assert repository.create(store) is None
+
+
+def testRestoreReplacesVault(vaultFormat, openStore):
+    repository = BackupRepository('backups')
+    store = openStore()
+    history = snapshotHistory(store, repository)
+    store.close()
+    with pytest.raises(BackupError):
+        repository.restore(1, USERNAME, PASSWORD)
+    assert activeDataPath() == FORMAT_PATHS[vaultFormat]
+
+    repository.restore(1, USERNAME, PASSWORD, force=True)
+    assert activeDataPath() == VAULT_PATH
+    for suffix in ('', '-wal', '-shm'):
+        assert not os.path.exists(SQLITE_VAULT_PATH + suffix)
+    assert contents(openStore()) == history[1]
+
+
+def testRestoreRejectsWrongPassword(vaultFormat, openStore):
+    repository = BackupRepository('backups')
+    repository.create(openStore())
+    with pytest.raises(BackupError):
+        repository.restore(1, USERNAME, 'wrongPW1!xyz', 'restored')
+
+
+def testVerifyFindsCorruptSegment(vaultFormat, openStore):
+    repository = BackupRepository('backups')
+    snapshotHistory(openStore(), repository)
+    path = repository.segmentPath(repository.manifest(2)['segment']['address'])
+    with open(path, 'r+b') as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 1]))
+    problems = repository.verify()
+    assert len(problems) == 1 and 'Snapshot 2' in problems[0]
+    # Snapshot 1 does not need the corrupted segment; the later ones do.
+    repository.restore(1, USERNAME, PASSWORD, 'restored')
+    with pytest.raises(BackupError):
+        repository.restore(3, USERNAME, PASSWORD, 'restored3')
+
+
+def testPruneKeepsParents(vaultFormat, openStore):
+    repository = BackupRepository('backups')
+    store = openStore()
+    history = snapshotHistory(store, repository)
+    repository.create(store, full=True)
+    store.addPassword('later.com', 'later@example.com', 'Later!pw1abc')
+    repository.create(store)
+    repository.prune(2)
+    assert repository.sequences() == [4, 5]
+    assert repository.verify() == []
+    repository.restore(4, USERNAME, PASSWORD, 'restored')
+    assert contents(openStore('restored')) == history[3]
@@ -0,0 +1,96 @@
+import os
+import random
+
+import pytest
+
+from backend.breachCheck import (BreachCorpus, BreachCorpusError, auditBreaches, buildBloomFilter, buildPrefixIndex,
+                                 passwordHash)
+from conftest import createVault, sampleEntries
+
+BREACHED = {'password': 3861493, 'Pw1!abcXYZ': 2, 'Shared!pw1': 17}
+
+
+def writeCorpus(path, breached=BREACHED, padding=3000, newline='\r\n'):
+    # Laid out like the Have I Been Pwned download: `HASH:COUNT`, sorted by hash.
+    rng = random.Random(7)
+    lines = {passwordHash(password): count for password, count in breached.items()}
+    for _ in range(padding):
+        lines[f'{rng.getrandbits(160):040X}'.encode()] = rng.randint(1, 1000)
+    with open(path, 'w', newline='') as f:
+        f.writelines(f'{key.decode()}:{count}{newline}' for key, count in sorted(lines.items()))
+    return lines
+
+
+@pytest.fixture
+def corpusPath(workdir):
+    path = os.path.join(workdir, 'pwned.txt')
+    writeCorpus(path)
+    return path
+
+
+def absentHashes(count=500):
+    return [passwordHash(f'never breached {i}') for i in range(count)]
+
+
+@pytest.mark.parametrize('indexes', [(), ('prefix',), ('prefix', 'bloom')])
+def testLookup(corpusPath, indexes):
+    if 'prefix' in indexes:
+        buildPrefixIndex(corpusPath, bits=8)
+    if 'bloom' in indexes:
+        buildBloomFilter(corpusPath)
+    with BreachCorpus(corpusPath) as corpus:
+        assert (corpus.prefixOffsets is not None, corpus.bloom is not None) == ('prefix' in indexes, 'bloom' in indexes)
+        for password, count in BREACHED.items():
+            assert corpus.lookup(passwordHash(password)) == count
+            assert corpus.lookup(passwordHash(password).lower()) == count
+        assert not any(corpus.lookup(hashValue) for hashValue in absentHashes())
+        queries = [passwordHash(password) for password in BREACHED] + absentHashes()
+        assert corpus.lookupMany(queries) == {passwordHash(password): count for password, count in BREACHED.items()}
+
+
+def testLookupManyAcrossBlocks(corpusPath, monkeypatch):
+    lines = writeCorpus(corpusPath, newline='\n')
+    monkeypatch.setattr('backend.breachCheck.SCAN_BLOCK_SIZE', 4096)
+    with BreachCorpus(corpusPath) as corpus:
+        sample = random.Random(3).sample(sorted(lines), 200)
+        assert corpus.lookupMany(sample + absentHashes(50)) == {key: lines[key] for key in sample}
+        # Every block is read at most once however many queries fall in it.
+        assert corpus.corpusReads <= os.path.getsize(corpusPath) // 4096 + 1
+
+
+def testBloomFilterSkipsCorpus(corpusPath):
+    buildBloomFilter(corpusPath)
+    with BreachCorpus(corpusPath) as corpus:
+        for hashValue in absentHashes():
+            corpus.lookup(hashValue)
+        # About 1% false positives at ten bits per entry.
+        assert corpus.corpusReads < 25
+
+
+def testStaleIndexesAreIgnored(corpusPath):
+    buildPrefixIndex(corpusPath, bits=8)
+    buildBloomFilter(corpusPath)
+    writeCorpus(corpusPath, dict(BREACHED, newlyBreached=5))
+    with BreachCorpus(corpusPath) as corpus:
+        assert corpus.prefixOffsets is None and corpus.bloom is None
+        assert corpus.lookup(passwordHash('newlyBreached')) == 5
+
+
+def testDamagedFilesAreRejected(corpusPath):
+    with open(corpusPath + '.bloom', 'wb') as f:
+        f.write(b'garbage')
+    with pytest.raises(BreachCorpusError):
+        BreachCorpus(corpusPath)
+    open(corpusPath, 'w').close()
+    with pytest.raises(BreachCorpusError):
+        BreachCorpus(corpusPath, useIndexes=False)
+
+
+@pytest.mark.parametrize('batch', [False, True])
+def testAuditBreaches(corpusPath, openStore, batch):
+    entries = sampleEntries()
+    entries['other.com'] = {'reused@example.com': 'Pw1!abcXYZ'}
+    createVault('binary', entries)
+    with BreachCorpus(corpusPath) as corpus:
+        assert auditBreaches(openStore(), corpus, batch) == [
+            ('other.com', 'reused@example.com', 2), ('site1.com', 'user1@example.com', 2)]
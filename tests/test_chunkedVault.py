@@ -0,0 +1,109 @@
+import os
+
+import pytest
+
+from backend.chunkedVault import ChunkedVault
+from backend.vaultFormat import CHUNKED_VAULT_PATH, VaultFormatError
+from conftest import createVault, sampleEntries, unlock
+
+
+@pytest.fixture
+def vault(workdir):
+    createVault('chunked', sampleEntries())
+    vault = ChunkedVault(CHUNKED_VAULT_PATH, unlock())
+    yield vault
+    vault.close()
+
+
+def readAll(vault):
+    passwords = {}
+    for bucket in range(vault.buckets):
+        passwords.update(vault.readBucket(bucket))
+    return passwords
+
+
+def editBucket(vault, website, email, password):
+    bucket = vault.bucketOf(website)
+    passwords = vault.readBucket(bucket)
+    passwords.setdefault(website, {})[email] = password
+    vault.writeBuckets({bucket: passwords})
+
+
+def damageSlot(vault, slot):
+    with open(CHUNKED_VAULT_PATH, 'r+b') as f:
+        f.seek(vault.slotOffsets[slot] + vault.slotSize // 2)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 1]))
+
+
+def testWritesAlternateDirectorySlots(vault):
+    assert (vault.slot, vault.generation) == (0, 0)
+    editBucket(vault, 'site1.com', 'user1@example.com', 'First!pw1abc')
+    assert (vault.slot, vault.generation) == (1, 1)
+    editBucket(vault, 'site1.com', 'user1@example.com', 'Second!pw1ab')
+    assert (vault.slot, vault.generation) == (0, 2)
+    vault.reopen()
+    assert (vault.slot, vault.generation) == (0, 2)
+    assert vault.readBucket(vault.bucketOf('site1.com'))['site1.com'] == {'user1@example.com': 'Second!pw1ab'}
+
+
+def testOnlyTheTouchedChunkIsAppended(vault):
+    size = os.path.getsize(CHUNKED_VAULT_PATH)
+    bucket = vault.bucketOf('site1.com')
+    before = {index: vault.entry(index) for index in range(vault.buckets)}
+    editBucket(vault, 'site1.com', 'user1@example.com', 'Changed!pw1')
+    offset, length, records = vault.entry(bucket)
+    assert offset == size and os.path.getsize(CHUNKED_VAULT_PATH) == size + length
+    assert records == before[bucket][2]
+    assert all(vault.entry(index) == before[index] for index in range(vault.buckets) if index != bucket)
+
+
+def testTornDirectoryFallsBackToPreviousGeneration(vault):
+    editBucket(vault, 'site1.com', 'user1@example.com', 'First!pw1abc')
+    editBucket(vault, 'new.com', 'new@example.com', 'New!pw1abcd')
+    # The latest directory, in slot 0, is torn; slot 1 still describes the write before it.
+    damageSlot(vault, vault.slot)
+    vault.reopen()
+    assert (vault.slot, vault.generation) == (1, 1)
+    expected = sampleEntries()
+    expected['site1.com'] = {'user1@example.com': 'First!pw1abc'}
+    assert readAll(vault) == expected
+
+
+def testChunksWithoutDirectoryAreIgnored(vault):
+    # A crash after appending chunks but before the directory points at them.
+    with open(CHUNKED_VAULT_PATH, 'ab') as f:
+        f.write(os.urandom(500))
+    vault.reopen()
+    assert readAll(vault) == sampleEntries()
+    editBucket(vault, 'site1.com', 'user1@example.com', 'After!pw1abc')
+    vault.reopen()
+    assert vault.readBucket(vault.bucketOf('site1.com'))['site1.com'] == {'user1@example.com': 'After!pw1abc'}
+
+
+def testBothDirectoriesDamaged(vault):
+    editBucket(vault, 'site1.com', 'user1@example.com', 'First!pw1abc')
+    damageSlot(vault, 0)
+    damageSlot(vault, 1)
+    with pytest.raises(VaultFormatError):
+        vault.reopen()
+
+
+def testCompactionDropsDeadChunks(vault, monkeypatch):
+    monkeypatch.setattr('backend.chunkedVault.CHUNK_MIN_COMPACT_BYTES', 0)
+    monkeypatch.setattr('backend.chunkedVault.CHUNK_COMPACT_RATIO', 0.01)
+    assert not vault.shouldCompact()
+    for i in range(5):
+        editBucket(vault, 'site1.com', 'user1@example.com', f'Changed!pw{i}')
+    assert vault.shouldCompact()
+    grown, expected = os.path.getsize(CHUNKED_VAULT_PATH), readAll(vault)
+    vault.compact()
+    assert os.path.getsize(CHUNKED_VAULT_PATH) < grown
+    assert not vault.shouldCompact()
+    assert readAll(vault) == expected
+    reopened = ChunkedVault(CHUNKED_VAULT_PATH, unlock())
+    try:
+        assert readAll(reopened) == expected
+    finally:
+        reopened.close()
@@ -0,0 +1,121 @@
+import sys
+import time
+import types
+
+import pytest
+
+from backend.clipboard import ClipboardError, HelperClipboard, TkClipboard
+
+
+@pytest.fixture
+def systemClipboard(monkeypatch):
+    # Stands in for pyperclip, which needs a display and a clipboard tool.
+    module = types.ModuleType('pyperclip')
+    module.text = ''
+
+    def copy(text):
+        module.text = text
+    module.copy = copy
+    module.paste = lambda: module.text
+    monkeypatch.setitem(sys.modules, 'pyperclip', module)
+    return module
+
+
+def waitFor(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def testHelperClearsAfterTimeout(systemClipboard):
+    helper = HelperClipboard(clearAfter=0.2)
+    try:
+        helper.copy('Secret!pw1')
+        assert helper.flush(5)
+        assert systemClipboard.text == 'Secret!pw1'
+        assert waitFor(lambda: systemClipboard.text == '')
+    finally:
+        helper.close()
+
+
+def testHelperLeavesSomethingElseAlone(systemClipboard):
+    helper = HelperClipboard(clearAfter=0.2)
+    try:
+        helper.copy('Secret!pw1')
+        assert helper.flush(5)
+        systemClipboard.text = 'copied by the user elsewhere'
+        time.sleep(0.4)
+        assert systemClipboard.text == 'copied by the user elsewhere'
+    finally:
+        helper.close()
+
+
+def testCloseWipesTheSecret(systemClipboard):
+    helper = HelperClipboard(clearAfter=60)
+    helper.copy('Secret!pw1')
+    assert helper.flush(5)
+    helper.close()
+    assert systemClipboard.text == '' and not helper.thread.is_alive()
+
+
+def testMissingClipboardIsReported(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'pyperclip', None)
+    helper = HelperClipboard()
+    try:
+        helper.copy('Secret!pw1')
+        with pytest.raises(ClipboardError):
+            helper.flush(5)
+    finally:
+        helper.close()
+
+
+class TkRoot:
+    # The few Tk calls TkClipboard makes, with timers run by hand.
+    def __init__(self):
+        self.text = None
+        self.jobs = {}
+        self.tk = self
+
+    def call(self, *args):
+        return 'win32'
+
+    def clipboard_clear(self):
+        self.text = None
+
+    def clipboard_append(self, text):
+        self.text = (self.text or '') + text
+
+    def clipboard_get(self):
+        if self.text is None:
+            raise RuntimeError("CLIPBOARD selection doesn't exist")
+        return self.text
+
+    def after(self, milliseconds, callback):
+        job = f'after#{len(self.jobs)}'
+        self.jobs[job] = (milliseconds, callback)
+        return job
+
+    def after_cancel(self, job):
+        del self.jobs[job]
+
+
+def testTkCopyRestartsTheTimer():
+    root = TkRoot()
+    clipboard = TkClipboard(root, clearAfter=30)
+    clipboard.copy('First!pw1')
+    clipboard.copy('Second!pw2')
+    assert root.text == 'Second!pw2'
+    assert [milliseconds for milliseconds, _ in root.jobs.values()] == [30000]
+    _, (_, clear) = root.jobs.popitem()
+    clear()
+    assert root.text is None
+
+
+def testTkClearKeepsOtherContents():
+    root = TkRoot()
+    clipboard = TkClipboard(root, clearAfter=30)
+    clipboard.copy('Secret!pw1')
+    root.text = 'something else'
+    clipboard.close()
+    assert root.text == 'something else' and not root.jobs
@@ -0,0 +1,50 @@
+import pytest
+
+from backend.domains import compileSuffixTrie, normalizeMany, normalizeUrl
+
+
+@pytest.mark.parametrize('url, site', [
+    ('foo.github.io', 'github.io'),
+    ('https://site.blogspot.com/post', 'blogspot.com'),
+    ('bucket.s3.amazonaws.com', 'amazonaws.com'),
+])
+def testPrivateSuffixesAreNotSites(url, site):
+    # Vaults stored these under the provider's name before the public suffix list.
+    assert normalizeUrl(url) == site
+
+
+@pytest.mark.parametrize('url, site', [
+    ('https://www.example.co.uk/path', 'example.co.uk'),
+    ('user:pw@Login.Example.COM:443/?q=1', 'example.com'),
+    ('example.com.', 'example.com'),
+    ('example.com#frag', 'example.com'),
+    ('gmail', 'gmail.com'),
+    ('foo.unknowntld', 'foo.unknowntld'),
+    # Wildcard rules (*.ck, *.kawasaki.jp) and the exceptions to them.
+    ('foo.bar.ck', 'foo.bar.ck'),
+    ('www.ck', 'www.ck'),
+    ('x.y.kawasaki.jp', 'x.y.kawasaki.jp'),
+    ('a.b.city.kawasaki.jp', 'city.kawasaki.jp'),
+    # Internationalised suffixes, in Unicode and punycode.
+    ('shop.example.公司.cn', 'example.公司.cn'),
+    ('shop.example.xn--55qx5d.cn', 'example.xn--55qx5d.cn'),
+    ('https://münchen.de/x', 'münchen.de'),
+    # IP addresses have no suffix to strip.
+    ('192.168.1.10', '192.168.1.10'),
+    ('http://[2001:db8::1]:8080/x', '2001:db8::1'),
+])
+def testNormalizeUrl(url, site):
+    assert normalizeUrl(url) == site
+
+
+def testFallbackRules():
+    trie = compileSuffixTrie(['co.uk', '*.ck', '!www.ck'])
+    assert normalizeUrl('a.example.co.uk', trie) == 'example.co.uk'
+    assert normalizeUrl('a.b.ck', trie) == 'a.b.ck'
+    assert normalizeUrl('a.www.ck', trie) == 'www.ck'
+    assert normalizeUrl('a.example.com.au', trie) == 'com.au'
+
+
+def testNormalizeManyMatchesNormalizeUrl():
+    urls = ['a.example.co.uk', 'a.example.co.uk', 'b.github.io', 'x.y.kawasaki.jp', '10.0.0.1']
+    assert normalizeMany(urls) == [normalizeUrl(url) for url in urls]
@@ -0,0 +1,147 @@
+import csv
+import json
+import os
+
+import pytest
+
+from backend.importer import BulkImport, ImportFormatError, importFile, prepareRows, readRows
+from conftest import contents, createVault, sampleEntries
+
+
+def writeCsv(path, header, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return path
+
+
+def readRejects(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.reader(f))
+
+
+def countCommits(store, patch):
+    sizes = []
+    commit = store.commit
+
+    def counting(operations):
+        sizes.append(len(operations))
+        return commit(operations)
+    patch.setattr(store, 'commit', counting)
+    return sizes
+
+
+def testCsvImportListsRejectsWithoutPasswords(workdir, openStore):
+    createVault('binary', sampleEntries())
+    store = openStore()
+    # Chrome's export layout; the rejected rows each fail a different check.
+    source = writeCsv(os.path.join(workdir, 'chrome.csv'), ['name', 'url', 'username', 'password'], [
+        ['new', 'https://accounts.new.com/login', 'me@example.com', 'abcDE12!new'],
+        ['site2', 'https://site2.com', 'user2@example.com', 'abcDE12!other'],
+        ['empty', 'https://empty.com', 'me@example.com', ''],
+        ['bad', 'https://bad.com', 'not an email', 'abcDE12!bad'],
+        ['weak', 'https://weak.com', 'me@example.com', 'weak'],
+        ['repeat', 'https://new.com/again', 'me@example.com', 'abcDE12!new'],
+    ])
+    rejectPath = os.path.join(workdir, 'rejects.csv')
+    report = importFile(store, source, rejectPath=rejectPath)
+    assert (report.rows, report.added, report.updated, report.duplicates, report.rejected) == (6, 1, 0, 1, 4)
+    assert store.plaintextPasswords()['new.com'] == {'me@example.com': 'abcDE12!new'}
+    assert store.plaintextPasswords()['site2.com'] == {'user2@example.com': 'Pw2!abcXYZ'}
+    rejects = readRejects(rejectPath)
+    assert rejects == [
+        ['record', 'url', 'username', 'reason'],
+        ['3', 'https://site2.com', 'user2@example.com', 'a different password is already saved'],
+        ['4', 'https://empty.com', 'me@example.com', 'missing password'],
+        ['5', 'https://bad.com', 'not an email', 'email does not meet validation criteria'],
+        ['6', 'https://weak.com', 'me@example.com', 'password does not meet criteria'],
+    ]
+    with open(rejectPath, encoding='utf-8') as f:
+        assert 'abcDE12!' not in f.read()
+
+
+def testOverwriteReplacesConflicts(workdir, openStore):
+    createVault('binary', sampleEntries())
+    store = openStore()
+    source = writeCsv(os.path.join(workdir, 'plain.csv'), ['website', 'email', 'password'],
+                      [['site2.com', 'user2@example.com', 'abcDE12!other']])
+    report = importFile(store, source, onConflict='overwrite')
+    assert (report.added, report.updated, report.rejected) == (0, 1, 0)
+    assert store.plaintextPasswords()['site2.com'] == {'user2@example.com': 'abcDE12!other'}
+    with pytest.raises(ValueError):
+        BulkImport(store, onConflict='merge')
+
+
+def testJsonExportsStreamAcrossReads(workdir, openStore, monkeypatch):
+    monkeypatch.setattr('backend.importer.JSON_READ_SIZE', 16)
+    createVault('binary', {})
+    store = openStore()
+    bitwarden = os.path.join(workdir, 'bitwarden.json')
+    items = [{'name': f'Site {i}', 'login': {'uris': [{'uri': f'https://www.bw{i}.com/'}],
+                                             'username': f'user{i}@example.com', 'password': f'abcDE1{i}!bw'}}
+             for i in range(30)]
+    with open(bitwarden, 'w', encoding='utf-8') as f:
+        json.dump({'encrypted': False, 'folders': [], 'items': items, 'collections': []}, f)
+    lines = os.path.join(workdir, 'export.jsonl')
+    with open(lines, 'w', encoding='utf-8') as f:
+        f.writelines(json.dumps({'URL': f'lines{i}.org', 'Email': f'user{i}@example.com',
+                                 'Password': f'abcDE1{i}!jl'}) + '\n' for i in range(5))
+    assert importFile(store, bitwarden).added == 30
+    assert importFile(store, lines).added == 5
+    passwords = contents(store)
+    assert len(passwords) == 35
+    assert passwords['bw29.com'] == {'user29@example.com': 'abcDE129!bw'}
+    assert passwords['lines4.org'] == {'user4@example.com': 'abcDE14!jl'}
+
+
+@pytest.mark.parametrize('name, text', [
+    ('truncated.json', '[{"url": "a.com", "password": "abcDE12!"}'),
+    ('trailing.json', '[] junk'),
+    ('mixed.json', '[] {"url": "a.com"}'),
+])
+def testMalformedJsonIsReported(workdir, name, text):
+    path = os.path.join(workdir, name)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    with pytest.raises(ImportFormatError):
+        list(readRows(path))
+
+
+def testCsvWithoutPasswordColumnIsReported(workdir):
+    path = writeCsv(os.path.join(workdir, 'nopassword.csv'), ['url', 'username'], [['a.com', 'me@example.com']])
+    with pytest.raises(ImportFormatError):
+        list(readRows(path))
+
+
+def rowsFor(count):
+    return [['website', 'email', 'password']] + [[f'bulk{i}.com', f'user{i}@example.com', f'abcDE1{i}!bulk'] for i in range(count)]
+
+
+def testJournalVaultCommitsFixedBatches(workdir, openStore, monkeypatch):
+    createVault('journal', sampleEntries())
+    store = openStore()
+    sizes = countCommits(store, monkeypatch)
+    rows = rowsFor(7)
+    source = writeCsv(os.path.join(workdir, 'bulk.csv'), rows[0], rows[1:])
+    assert importFile(store, source, batchSize=3).added == 7
+    assert sizes == [3, 3, 1]
+
+
+def testSnapshotVaultBatchesGrowWithTheVault(workdir, openStore, monkeypatch):
+    createVault('binary', sampleEntries())
+    store = openStore()
+    sizes = countCommits(store, monkeypatch)
+    rows = rowsFor(50)
+    source = writeCsv(os.path.join(workdir, 'bulk.csv'), rows[0], rows[1:])
+    assert importFile(store, source, batchSize=3).added == 50
+    # 42 entries to start with, so each rewrite carries at least half the vault again.
+    assert sizes == [21, 29]
+    assert len(contents(store)) == 41 + 50
+
+
+def testWorkersPrepareRowsInFileOrder(workdir, monkeypatch):
+    monkeypatch.setattr('backend.importer.IMPORT_CHUNK_ROWS', 4)
+    rows = [(number, f'https://www.site{number}.com', f'user{number}@example.com', 'abcDE12!' if number % 3 else 'weak')
+            for number in range(1, 20)]
+    assert list(prepareRows(rows, 2, False)) == list(prepareRows(rows, 1, False))
@@ -0,0 +1,73 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from backend.instrumentation import TRACE_ENV, Histogram, Recorder, instrumented
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def testPercentilesStayWithinABucket():
+    histogram = Histogram()
+    for micros in range(1, 1001):
+        histogram.record(micros * 1000)
+    assert (histogram.count, histogram.minimum, histogram.maximum) == (1000, 1000, 1000000)
+    for fraction, exact in ((0.5, 500000), (0.9, 900000), (0.99, 990000)):
+        assert exact <= histogram.percentile(fraction) <= exact * 2 ** (1 / 8) * 1.001
+    assert histogram.percentile(1.0) == 1000000
+    summary = histogram.toDict()
+    assert summary['meanMs'] == pytest.approx(0.5005) and sum(summary['buckets'].values()) == 1000
+
+
+def testUntracedFunctionsAreLeftAlone(monkeypatch):
+    monkeypatch.setattr('backend.instrumentation.recorder', None)
+
+    def lookup(website):
+        return website
+    assert instrumented('lookup')(lookup) is lookup
+
+
+def testCallsAndErrorsAreRecorded(monkeypatch):
+    recorder = Recorder()
+    monkeypatch.setattr('backend.instrumentation.recorder', recorder)
+
+    @instrumented('unseal')
+    def unseal(secret):
+        if secret is None:
+            raise ValueError("nothing sealed")
+        return 'Secret!pw1'
+    for _ in range(3):
+        assert unseal(b'token') == 'Secret!pw1'
+    with pytest.raises(ValueError):
+        unseal(None)
+    metrics = recorder.metrics()
+    assert metrics['counters'] == {'unseal': 4, 'unseal.errors': 1}
+    assert metrics['histograms']['unseal']['count'] == 4
+    events = recorder.traceEvents()['traceEvents']
+    assert len(events) == 4 and all(event['name'] == 'unseal' and event['ph'] == 'X' for event in events)
+    # Neither arguments nor results end up in what is exported.
+    assert 'Secret' not in json.dumps(recorder.traceEvents()) + json.dumps(metrics)
+
+
+def testTraceStopsGrowing(monkeypatch):
+    monkeypatch.setattr('backend.instrumentation.MAX_TRACE_EVENTS', 3)
+    recorder = Recorder()
+    for start in range(5):
+        recorder.record('write', start, start + 10)
+    assert len(recorder.events) == 3 and recorder.droppedEvents == 2
+    assert recorder.metrics()['counters']['write'] == 5
+
+
+def testEnvironmentVariableExportsAtExit(tmp_path):
+    prefix = str(tmp_path / 'run')
+    script = "from backend.utilities import shortenURLtoWebsiteName\nfor _ in range(3): shortenURLtoWebsiteName('https://www.example.co.uk/login')"
+    subprocess.run([sys.executable, '-c', script], cwd=REPO_ROOT, check=True, env=dict(os.environ, **{TRACE_ENV: prefix}))
+    with open(prefix + '.metrics.json') as f:
+        metrics = json.load(f)
+    with open(prefix + '.trace.json') as f:
+        trace = json.load(f)
+    assert metrics['counters']['shortenURLtoWebsiteName'] == 3
+    assert [event['name'] for event in trace['traceEvents']].count('shortenURLtoWebsiteName') == 3
@@ -0,0 +1,101 @@
+import pytest
+
+from backend.journal import JOURNAL_MAGIC, JOURNAL_PATH, applyOperation, writeJournalHeader
+from backend.vaultFormat import VAULT_PATH
+from conftest import contents, createVault, sampleEntries
+
+
+@pytest.fixture
+def journalVault(workdir):
+    createVault('journal', sampleEntries())
+
+
+def journalLines():
+    with open(JOURNAL_PATH, 'rb') as f:
+        return f.read().splitlines()
+
+
+def readSnapshot():
+    with open(VAULT_PATH, 'rb') as f:
+        return f.read()
+
+
+def testEditsAppendWithoutRewritingSnapshot(journalVault, openStore):
+    snapshot = readSnapshot()
+    store = openStore()
+    store.addPassword('new.com', 'new@example.com', 'New!pw1abcd')
+    store.updatePassword('site1.com', 'user1@example.com', 'Changed!pw1')
+    store.deletePassword('site2.com', 'user2@example.com')
+    assert readSnapshot() == snapshot
+    assert len(journalLines()) == 4 and journalLines()[0].startswith(JOURNAL_MAGIC)
+
+    reopened = openStore()
+    assert reopened.journal.recordCount == 3
+    expected = sampleEntries()
+    expected['new.com'] = {'new@example.com': 'New!pw1abcd'}
+    expected['site1.com'] = {'user1@example.com': 'Changed!pw1'}
+    del expected['site2.com']
+    assert contents(reopened) == expected
+
+
+def testTornRecordIsDropped(journalVault, openStore):
+    store = openStore()
+    store.addPassword('first.com', 'a@example.com', 'First!pw1abc')
+    with open(JOURNAL_PATH, 'ab') as f:
+        # What an append cut short by a crash leaves behind.
+        f.write(b'gAAAAABtorn')
+    reopened = openStore()
+    assert reopened.journal.recordCount == 1
+    assert reopened.getPassword('first.com', 'a@example.com') == 'First!pw1abc'
+
+    reopened.addPassword('second.com', 'b@example.com', 'Second!pw2ab')
+    assert b'gAAAAABtorn' not in b''.join(journalLines())
+    final = openStore()
+    assert final.journal.recordCount == 2
+    assert final.getPassword('second.com', 'b@example.com') == 'Second!pw2ab'
+
+
+def testJournalOfOlderSnapshotIsIgnored(journalVault, openStore):
+    store = openStore()
+    store.updatePassword('site1.com', 'user1@example.com', 'Changed!pw1')
+    # As after a crash between writing a new snapshot and resetting the journal.
+    lines = journalLines()
+    writeJournalHeader(JOURNAL_PATH, 'older')
+    with open(JOURNAL_PATH, 'ab') as f:
+        f.write(b'\n'.join(lines[1:]) + b'\n')
+    reopened = openStore()
+    assert not reopened.journal.valid and reopened.journal.recordCount == 0
+    assert contents(reopened) == sampleEntries()
+
+
+@pytest.mark.parametrize('backgroundWrites', [False, True])
+def testCompactionFoldsJournalIntoSnapshot(journalVault, openStore, monkeypatch, backgroundWrites):
+    monkeypatch.setattr('backend.journal.JOURNAL_MIN_COMPACT_BYTES', 0)
+    monkeypatch.setattr('backend.journal.JOURNAL_COMPACT_RATIO', 0.01)
+    snapshot = readSnapshot()
+    store = openStore(backgroundWrites=backgroundWrites)
+    expected = sampleEntries()
+    for i in range(30):
+        store.updatePassword('site1.com', 'user1@example.com', f'Changed!pw{i}')
+        expected['site1.com'] = {'user1@example.com': f'Changed!pw{i}'}
+        assert store.flush()
+    assert readSnapshot() != snapshot
+    # Each compaction starts the journal over, so it never holds more than a few records.
+    assert len(journalLines()) < 30
+    assert contents(openStore()) == expected
+
+
+def testApplyOperation():
+    passwords = {'site.com': {'a@example.com': 'one'}}
+    assert applyOperation(passwords, {'op': 'add', 'website': 'site.com', 'email': 'b@example.com', 'password': 'two'})
+    assert applyOperation(passwords, {'op': 'updateEmail', 'website': 'site.com', 'oldEmail': 'b@example.com',
+                                      'newEmail': 'c@example.com'})
+    assert passwords == {'site.com': {'a@example.com': 'one', 'c@example.com': 'two'}}
+    # Operations on entries that are already gone change nothing, so replaying twice is harmless.
+    assert not applyOperation(passwords, {'op': 'update', 'website': 'gone.com', 'email': 'x', 'password': 'y'})
+    assert not applyOperation(passwords, {'op': 'delete', 'website': 'site.com', 'email': 'b@example.com'})
+    for email in ('a@example.com', 'c@example.com'):
+        assert applyOperation(passwords, {'op': 'delete', 'website': 'site.com', 'email': email})
+    assert passwords == {}
+    with pytest.raises(ValueError):
+        applyOperation(passwords, {'op': 'rename', 'website': 'site.com'})
@@ -0,0 +1,65 @@
+import sys
+
+from backend.lazySecrets import SecretCache, SecretSealer
+from conftest import createVault, sampleEntries
+
+
+def testSealRoundTrip():
+    sealer = SecretSealer()
+    secrets = ['Pw1!abcXYZ', '', 'exactly16bytes!!', 'Pässwörd mit Ümlauten', 'x' * 100]
+    sealed = sealer.sealMany(secrets)
+    sealed.append(sealer.seal('sealed alone'))
+    assert [sealer.unseal(secret) for secret in sealed] == secrets + ['sealed alone']
+    assert sealer.unsealMany(sealed) == secrets + ['sealed alone']
+    assert sealer.unsealMany(list(reversed(sealed))) == list(reversed(secrets + ['sealed alone']))
+
+
+def testSealedSecretsAreUniqueAndCompact():
+    sealer = SecretSealer()
+    first, second = sealer.seal('Same!pw1abc'), sealer.seal('Same!pw1abc')
+    # Never the same keystream twice, so equal secrets do not look equal sealed.
+    assert first != second and b'Same' not in first
+    assert type(first) is bytes
+    assert sys.getsizeof(first) < sys.getsizeof('Same!pw1abc')
+
+
+def testCacheEntriesExpire(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('backend.lazySecrets.time.monotonic', lambda: now[0])
+    cache = SecretCache(maxSize=10, ttl=30)
+    cache.put(('site.com', 'a@example.com'), 'Secret!pw1')
+    now[0] += 29
+    assert cache.get(('site.com', 'a@example.com')) == 'Secret!pw1'
+    now[0] += 1
+    assert cache.get(('site.com', 'a@example.com')) is None
+    assert not cache.entries
+
+
+def testCacheEvictsLeastRecentlyUsed():
+    cache = SecretCache(maxSize=2, ttl=60)
+    cache.put(('a.com', 'a'), 'first')
+    cache.put(('b.com', 'b'), 'second')
+    assert cache.get(('a.com', 'a')) == 'first'
+    cache.put(('c.com', 'c'), 'third')
+    assert cache.get(('b.com', 'b')) is None
+    assert cache.get(('a.com', 'a')) == 'first' and cache.get(('c.com', 'c')) == 'third'
+
+
+def testLazyStoreCachesAndInvalidates(workdir, openStore, monkeypatch):
+    createVault('binary', sampleEntries())
+    store = openStore(lazySecrets=True, cacheSize=4, cacheTtl=60)
+    assert type(store.passwords['site1.com']['user1@example.com']) is bytes
+    unsealed = []
+    unseal = store.sealer.unseal
+
+    def countingUnseal(secret):
+        unsealed.append(secret)
+        return unseal(secret)
+    monkeypatch.setattr(store.sealer, 'unseal', countingUnseal)
+    for _ in range(3):
+        assert store.getPassword('site1.com', 'user1@example.com') == 'Pw1!abcXYZ'
+    assert len(unsealed) == 1
+    # An edit drops the cached value, so the next read sees the new one.
+    store.updatePassword('site1.com', 'user1@example.com', 'Changed!pw1')
+    assert store.getPassword('site1.com', 'user1@example.com') == 'Changed!pw1'
+    assert unsealed[-1] == store.passwords['site1.com']['user1@example.com']
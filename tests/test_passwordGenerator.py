@@ -0,0 +1,57 @@
+from collections import Counter
+
+import pytest
+
+from backend.passwordGenerator import AMBIGUOUS_CHARACTERS, DIGITS, LOWERCASE, UPPERCASE, PasswordGenerator, PasswordPolicy
+from backend.utilities import generateStrongPassword, validatePassword
+
+
+def classCounts(password, policy):
+    return [sum(c in characters for c in password) for characters, _ in policy.classes]
+
+
+def testEveryByteValueMapsEvenly(monkeypatch):
+    policy = PasswordPolicy(length=8, lowercase=0, uppercase=0, digits=0, special=0)
+    generator = PasswordGenerator(policy)
+    # Every byte value once per password's worth of randomness: the accepted ones must
+    # land on each character of the alphabet the same number of times.
+    monkeypatch.setattr('backend.passwordGenerator.os.urandom', lambda size: bytes(range(256)) * (size // 256 + 1))
+    characters = Counter(''.join(generator.generate(len(policy.alphabet))))
+    assert set(characters) == set(policy.alphabet)
+    assert len(set(characters.values())) == 1
+    assert len(policy.alphabet) == len(set(policy.alphabet))
+
+
+def testPasswordsMeetThePolicy():
+    policy = PasswordPolicy(length=12, lowercase=2, uppercase=4, digits=3, special=2)
+    passwords = PasswordGenerator(policy).generate(500)
+    assert len(passwords) == 500 and len(set(passwords)) == 500
+    for password in passwords:
+        assert len(password) == 12
+        assert all(count >= minimum for count, (_, minimum) in zip(classCounts(password, policy), policy.classes))
+
+
+def testClassesCanBeLeftOut():
+    policy = PasswordPolicy(length=20, uppercase=None, special=None, excludeAmbiguous=True)
+    for password in PasswordGenerator(policy).generate(200):
+        assert set(password) <= set(LOWERCASE + DIGITS) - set(AMBIGUOUS_CHARACTERS)
+        assert not set(password) & set(UPPERCASE)
+
+
+@pytest.mark.parametrize('options', [
+    {'length': 4},
+    {'length': 0, 'lowercase': 0, 'uppercase': 0, 'digits': 0, 'special': 0},
+    {'lowercase': None, 'uppercase': None, 'digits': None, 'special': None},
+    {'digits': None, 'special': 1, 'specialCharacters': 'O0', 'excludeAmbiguous': True},
+])
+def testImpossiblePoliciesAreRejected(options):
+    with pytest.raises(ValueError):
+        PasswordPolicy(**options)
+
+
+def testStrongPasswords():
+    with pytest.raises(ValueError):
+        generateStrongPassword(7)
+    for length in (8, 16, 64):
+        password = generateStrongPassword(length)
+        assert len(password) == length and validatePassword(password)
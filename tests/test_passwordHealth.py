@@ -0,0 +1,91 @@
+import pytest
+
+from backend.passwordHealth import (CharacterClasses, PasswordAudit, estimateEntropy, meetsPolicy, policyFailures,
+                                    strengthLabel)
+from conftest import createVault, sampleEntries
+
+
+def reportOf(audit):
+    report = audit.report()
+    return report.entries, report.reused, report.weak, report.failing
+
+
+@pytest.mark.parametrize('password, expected', [
+    ('abcDE12!', True),
+    ('Pw1!abcXYZ1', True),
+    ('abcDE12', False),
+    ('abDE12!x', True),
+    ('abDE12!', False),
+    ('abcDEF1!', False),
+    ('abcdE12!', False),
+    ('abcDE12?', False),
+    ('abcDE12!\n', False),
+    ('äbcDE12!xy', True),
+    ('ÄÖÜäöü12!', False),
+])
+def testMeetsPolicy(password, expected):
+    assert meetsPolicy(password) == expected
+    assert (policyFailures(password, CharacterClasses(password)) == ()) == expected
+
+
+def testPolicyFailuresNameEachProblem():
+    assert policyFailures('aB1', CharacterClasses('aB1')) == (
+        'shorter than 8 characters', 'fewer than 3 lowercase letters', 'fewer than 2 uppercase letters',
+        'fewer than 2 digits', 'fewer than 1 of !@#$%^&*()-_+.')
+    assert policyFailures('abcDE12!\n', CharacterClasses('abcDE12!\n')) == ('contains a line break',)
+
+
+def testStrength():
+    assert strengthLabel(estimateEntropy(CharacterClasses('password'))) == 'very weak'
+    # Repeats count at most twice, so a long run of one character stays very weak.
+    assert estimateEntropy(CharacterClasses('a' * 40)) == estimateEntropy(CharacterClasses('aa'))
+    assert strengthLabel(estimateEntropy(CharacterClasses('abcDE12!'))) == 'weak'
+    assert strengthLabel(estimateEntropy(CharacterClasses('k7#Qm2!xRv'))) == 'good'
+    assert strengthLabel(estimateEntropy(CharacterClasses('k7#Qm2!xRv9@Lp4$'))) == 'strong'
+    # Characters outside the policy classes still widen the pool.
+    assert estimateEntropy(CharacterClasses('abcdefgh~')) > estimateEntropy(CharacterClasses('abcdefghi'))
+
+
+def testAuditClassifiesEntries():
+    audit = PasswordAudit.build({
+        'a.com': {'one@example.com': 'k7#Qm2!xRv9@Lp4$', 'two@example.com': 'password'},
+        'b.com': {'one@example.com': 'k7#Qm2!xRv9@Lp4$'},
+        'c.com': {'one@example.com': 'Unique!pw12XYZ#q'},
+    })
+    entries, reused, weak, failing = reportOf(audit)
+    assert entries == 4
+    assert reused == [[('a.com', 'one@example.com'), ('b.com', 'one@example.com')]]
+    assert [(website, email, strength) for website, email, _, strength in weak] == [('a.com', 'two@example.com', 'very weak')]
+    assert [(website, email) for website, email, _ in failing] == [('a.com', 'two@example.com')]
+    assert audit.report().issueCount() == 4
+    assert "4 passwords checked: 2 share a password (1 groups), 1 weak, 1 below policy." == audit.report().summary()
+    # Reuse is found through keyed hashes, never the passwords themselves.
+    assert all(len(fingerprint) == 32 for fingerprint in audit.groups)
+
+
+def testChangesMatchARebuild():
+    passwords = {'a.com': {'one@example.com': 'Same!pw12XYZ', 'two@example.com': 'Same!pw12XYZ'},
+                 'b.com': {'one@example.com': 'weak'}}
+    audit = PasswordAudit.build(passwords)
+    for operation in ({'op': 'update', 'website': 'a.com', 'email': 'two@example.com', 'password': 'Other!pw34XYZ'},
+                      {'op': 'add', 'website': 'c.com', 'email': 'new@example.com', 'password': 'Other!pw34XYZ'},
+                      {'op': 'updateEmail', 'website': 'b.com', 'oldEmail': 'one@example.com', 'newEmail': 'renamed@example.com'},
+                      {'op': 'delete', 'website': 'a.com', 'email': 'one@example.com'}):
+        audit.applyChange(operation)
+    rebuilt = PasswordAudit.build({'a.com': {'two@example.com': 'Other!pw34XYZ'},
+                                   'b.com': {'renamed@example.com': 'weak'},
+                                   'c.com': {'new@example.com': 'Other!pw34XYZ'}})
+    assert reportOf(audit) == reportOf(rebuilt)
+    assert audit.report().reused == [[('a.com', 'two@example.com'), ('c.com', 'new@example.com')]]
+
+
+def testStoreKeepsAuditCurrent(workdir, openStore):
+    createVault('binary', sampleEntries())
+    store = openStore(lazySecrets=True)
+    assert store.auditHealth().reused == []
+    store.addPassword('copy.com', 'user1@example.com', 'Pw1!abcXYZ')
+    store.updatePassword('site2.com', 'user2@example.com', 'weak')
+    report = store.auditHealth()
+    assert report.reused == [[('copy.com', 'user1@example.com'), ('site1.com', 'user1@example.com')]]
+    assert [(website, email) for website, email, _, _ in report.weak] == [('site2.com', 'user2@example.com')]
+    assert reportOf(store.healthAudit) == reportOf(PasswordAudit.build(store.plaintextPasswords()))
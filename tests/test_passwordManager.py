@@ -0,0 +1,98 @@
+import os
+
+import pytest
+
+from backend.encryption import rekeyDirectory
+from conftest import PASSWORD, USERNAME, contents, createVault, sampleEntries, unlock
+
+SLOWER_KDF = {'name': 'pbkdf2', 'iterations': 2000}
+
+
+def testChangeKdf(vaultFormat, openStore):
+    store = openStore()
+    store.addPassword('new.com', 'new@example.com', 'New!pw1abcd')
+    expected = contents(store)
+    store.changeKdf(SLOWER_KDF)
+    assert store.encryptionManager.header['kdf'] == SLOWER_KDF
+    assert contents(store) == expected
+    store.addPassword('after.com', 'after@example.com', 'After!pw1abc')
+    expected['after.com'] = {'after@example.com': 'After!pw1abc'}
+
+    reopened = unlock()
+    assert reopened.kdfParams == SLOWER_KDF and reopened.verifyPassword(USERNAME, PASSWORD)
+    assert contents(openStore()) == expected
+    assert not os.path.exists(rekeyDirectory('data/masterHash'))
+
+
+def testInterruptedKdfChangeIsFinished(vaultFormat, openStore, monkeypatch):
+    store = openStore()
+
+    def crash(*args):
+        raise KeyboardInterrupt
+    # Dies once the staged files and the swap list are on disk, before anything is replaced.
+    with monkeypatch.context() as patch, pytest.raises(KeyboardInterrupt):
+        patch.setattr('backend.rekey.finishPendingRekey', crash)
+        store.changeKdf(SLOWER_KDF)
+
+    assert unlock().kdfParams == SLOWER_KDF
+    assert contents(openStore()) == sampleEntries()
+
+
+def testFailedKdfChangeKeepsOldVault(vaultFormat, openStore, monkeypatch):
+    store = openStore()
+
+    def failingWrite(self, passwords):
+        raise OSError("disk full")
+    with monkeypatch.context() as patch, pytest.raises(OSError):
+        for storage in ('storage.FileStorage', 'storage.ChunkedStorage', 'sqliteVault.SqliteStorage'):
+            patch.setattr(f'backend.{storage}.write', failingWrite)
+        store.changeKdf(SLOWER_KDF)
+
+    assert unlock().kdfParams != SLOWER_KDF
+    assert contents(openStore()) == sampleEntries()
+
+
+def batchEdits(store):
+    store.addPassword('new.com', 'new@example.com', 'New!pw1abcd')
+    store.updatePassword('site1.com', 'user1@example.com', 'Changed!pw1')
+    store.deletePassword('site2.com', 'user2@example.com')
+
+
+@pytest.mark.parametrize('storeFormat', ['binary', 'sqlite'])
+def testFailedBatchRollsBack(workdir, openStore, storeFormat):
+    createVault(storeFormat, sampleEntries())
+    store = openStore(lazySecrets=True)
+    assert 'site2.com' in store.search('site2')
+    with pytest.raises(RuntimeError):
+        with store.batch() as outer:
+            batchEdits(store)
+            with store.batch() as inner:
+                # A nested batch folds into the outer one and rolls back with it.
+                assert inner is outer
+                store.addPassword('inner.com', 'inner@example.com', 'Inner!pw1ab')
+            assert store.getPassword('site1.com', 'user1@example.com') == 'Changed!pw1'
+            raise RuntimeError("import failed halfway")
+
+    assert contents(store) == sampleEntries()
+    assert store.getPassword('site1.com', 'user1@example.com') == 'Pw1!abcXYZ'
+    assert store.search('new') == [] and 'site2.com' in store.search('site2')
+    assert contents(openStore()) == sampleEntries()
+
+
+def testBatchFailingToWriteRollsBack(workdir, openStore, monkeypatch):
+    createVault('binary', sampleEntries())
+    store = openStore()
+
+    def failingWrite(passwords):
+        raise OSError("disk full")
+    with monkeypatch.context() as patch, pytest.raises(OSError):
+        patch.setattr(store.storage, 'write', failingWrite)
+        with store.batch() as batch:
+            batchEdits(store)
+    assert not batch.committed and batch.operationCount == 3
+    assert contents(store) == sampleEntries()
+
+    with store.batch() as batch:
+        batchEdits(store)
+    assert batch.committed
+    assert contents(openStore())['site1.com'] == {'user1@example.com': 'Changed!pw1'}
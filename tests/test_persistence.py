@@ -0,0 +1,93 @@
+import pytest
+
+from backend.passwordManager import PasswordStore
+from backend.persistence import PersistenceError, PersistenceWorker
+from conftest import contents, createVault, sampleEntries, unlock
+
+
+def testBrokenStatusCallbackKeepsWriterAlive(caplog):
+    writes = []
+
+    def onStatus(error):
+        raise RuntimeError("window already destroyed")
+    worker = PersistenceWorker(lambda: writes.append(True), onStatus, coalesceDelay=0)
+    worker.schedule()
+    assert worker.flush(5)
+    worker.schedule()
+    assert worker.flush(5)
+    assert worker.close(5)
+    assert len(writes) == 2
+    assert "Save status callback failed." in caplog.text
+
+
+def testFailedSaveStillClosesStore(workdir, monkeypatch):
+    createVault('binary', sampleEntries())
+    store = PasswordStore(unlock(), backgroundWrites=True)
+    closed = []
+    monkeypatch.setattr(store.storage, 'close', lambda: closed.append('storage'))
+    monkeypatch.setattr(store.vaultLock, 'close', lambda: closed.append('lock'))
+
+    def failingWrite():
+        raise OSError("disk full")
+    monkeypatch.setattr(store.writer, 'write', failingWrite)
+    store.addPassword('new.com', 'new@example.com', 'New!pw1abcd')
+    with pytest.raises(PersistenceError):
+        store.close(5)
+    assert closed == ['storage', 'lock']
+    assert not store.writer.thread.is_alive()
+
+
+def testBurstOfChangesIsCoalesced():
+    writes = []
+    worker = PersistenceWorker(lambda: writes.append(True), coalesceDelay=0.2)
+    for _ in range(50):
+        worker.schedule()
+    assert worker.flush(5)
+    assert len(writes) == 1
+    worker.schedule()
+    assert worker.close(5)
+    # Closing writes what is still pending, without waiting out the delay.
+    assert len(writes) == 2
+
+
+def testErrorsAreReportedUntilAWriteSucceeds():
+    statuses = []
+    failures = [OSError("disk full")]
+
+    def write():
+        if failures:
+            raise failures.pop()
+    worker = PersistenceWorker(write, statuses.append, coalesceDelay=0)
+    worker.schedule()
+    with pytest.raises(PersistenceError) as error:
+        worker.flush(5)
+    assert isinstance(error.value.__cause__, OSError)
+    worker.schedule()
+    assert worker.flush(5)
+    assert worker.close(5)
+    assert [type(status) for status in statuses] == [OSError, type(None)]
+
+
+def testFailedBackgroundWriteIsRetried(workdir, monkeypatch):
+    createVault('binary', sampleEntries())
+    statuses = []
+    store = PasswordStore(unlock(), backgroundWrites=True, onSaveStatus=statuses.append)
+    try:
+        def failingWrite(passwords):
+            raise OSError("disk full")
+        with monkeypatch.context() as patch:
+            patch.setattr(store.storage, 'write', failingWrite)
+            store.addPassword('first.com', 'a@example.com', 'First!pw1abc')
+            with pytest.raises(PersistenceError):
+                store.flush(5)
+        # The failed change stays pending and goes out with the next write.
+        store.addPassword('second.com', 'b@example.com', 'Second!pw2ab')
+        assert store.flush(5)
+        assert isinstance(statuses[0], OSError) and statuses[-1] is None
+    finally:
+        store.close(5)
+    reopened = PasswordStore(unlock())
+    saved = contents(reopened)
+    reopened.close()
+    assert saved['first.com'] == {'a@example.com': 'First!pw1abc'}
+    assert saved['second.com'] == {'b@example.com': 'Second!pw2ab'}
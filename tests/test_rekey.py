@@ -0,0 +1,90 @@
+import json
+import os
+import threading
+
+import pytest
+
+from backend.encryption import rekeyDirectory
+from backend.rekey import VaultRekey, rekeyVault
+from backend.vaultFormat import VAULT_PATH, activeDataPath
+from backend.vaultSync import VaultKeyChangedError
+from conftest import FORMAT_PATHS, PASSWORD, TEST_KDF, USERNAME, contents, createVault, sampleEntries, unlock
+
+NEW_USERNAME = 'renamed'
+NEW_PASSWORD = 'xyzAB34!rotated'
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def testRekey(vaultFormat, openStore, monkeypatch, workers):
+    # Small units, so the records are spread over the worker processes.
+    monkeypatch.setattr('backend.rekey.REKEY_UNIT_BYTES', 256)
+    store = openStore()
+    store.addPassword('new.com', 'new@example.com', 'New!pw1abcd')
+    report = rekeyVault(store, NEW_USERNAME, NEW_PASSWORD, TEST_KDF, workers)
+    expected = sampleEntries()
+    expected['new.com'] = {'new@example.com': 'New!pw1abcd'}
+    assert report['records'] == sum(len(entries) for entries in expected.values())
+
+    assert not unlock().verifyPassword(USERNAME, PASSWORD)
+    assert unlock(username=NEW_USERNAME, password=NEW_PASSWORD).verifyPassword(NEW_USERNAME, NEW_PASSWORD)
+    # Legacy JSON vaults come out in the binary format.
+    assert activeDataPath() == (VAULT_PATH if vaultFormat == 'legacy' else FORMAT_PATHS[vaultFormat])
+    assert contents(openStore(username=NEW_USERNAME, password=NEW_PASSWORD)) == expected
+
+
+def testRekeyKeepsOtherInstancesOut(vaultFormat, openStore, monkeypatch):
+    store = openStore()
+    other = openStore()
+    outcome = {}
+
+    def otherWrite():
+        try:
+            other.addPassword('late.com', 'late@example.com', 'Late!pw1abc')
+            outcome['wrote'] = True
+        except Exception as e:
+            outcome['error'] = e
+
+    verify = VaultRekey.verify
+
+    def verifyWhileOtherWrites(self, plaintext):
+        writer = threading.Thread(target=otherWrite)
+        writer.start()
+        writer.join(0.3)
+        outcome['blocked'] = writer.is_alive()
+        outcome['thread'] = writer
+        verify(self, plaintext)
+    monkeypatch.setattr(VaultRekey, 'verify', verifyWhileOtherWrites)
+    rekeyVault(store, NEW_USERNAME, NEW_PASSWORD, TEST_KDF, 1)
+    outcome['thread'].join()
+
+    # The other instance waited for the swap, then found a vault it can no longer
+    # read, instead of writing into the old one and losing the entry.
+    assert outcome['blocked']
+    assert isinstance(outcome.get('error'), VaultKeyChangedError)
+    assert contents(openStore(username=NEW_USERNAME, password=NEW_PASSWORD)) == sampleEntries()
+
+
+def testRekeyOfAnotherCopyStaysInIt(vaultFormat, openStore):
+    createVault(vaultFormat, sampleEntries(), 'copy')
+    rekeyVault(openStore('copy'), NEW_USERNAME, NEW_PASSWORD, TEST_KDF, 1)
+    assert not os.path.exists(os.path.join('copy', 'data', 'rekey'))
+    assert activeDataPath('copy') == os.path.join('copy', VAULT_PATH if vaultFormat == 'legacy' else FORMAT_PATHS[vaultFormat])
+    assert contents(openStore('copy', NEW_USERNAME, NEW_PASSWORD)) == sampleEntries()
+    # The working-directory vault was left alone.
+    assert contents(openStore()) == sampleEntries()
+
+
+def testPendingSwapForAnotherCopyIsNotApplied(vaultFormat, openStore):
+    createVault(vaultFormat, sampleEntries(), 'copy')
+    rekeyDir = rekeyDirectory('data/masterHash')
+    os.makedirs(rekeyDir)
+    staged = os.path.join(rekeyDir, 'masterHash')
+    with open(staged, 'w') as f:
+        f.write('{}')
+    # As if the state had been copied here along with the rest of another vault's data directory.
+    state = {'phase': 'swapping', 'swaps': [[os.path.abspath(staged), os.path.abspath('copy/data/masterHash')]], 'removes': []}
+    with open(os.path.join(rekeyDir, 'state.json'), 'w') as f:
+        json.dump(state, f)
+    assert unlock().verifyPassword(USERNAME, PASSWORD)
+    assert unlock('copy').verifyPassword(USERNAME, PASSWORD)
+    assert os.path.exists(staged)
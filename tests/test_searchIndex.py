@@ -0,0 +1,76 @@
+import threading
+
+from backend.searchIndex import SearchIndex
+from conftest import createVault, sampleEntries
+
+QUERIES = ('', 'si', 'site1', 'ite', 'user2', 'example', 'xample.com', 'shared', 'sitte12', 'nothing')
+
+
+def websites(count=300):
+    passwords = {f'site{i}.com': {f'user{i % 40}@example.com': 'x'} for i in range(count)}
+    passwords['Shared.org'] = {'first@example.com': 'x', 'second@elsewhere.net': 'x'}
+    return passwords
+
+
+def testLimitKeepsRanking():
+    index = SearchIndex.build(websites())
+    for query in QUERIES:
+        everything = index.search(query)
+        for limit in (1, 5, 50):
+            assert index.search(query, limit) == everything[:limit]
+
+
+def testBackgroundBuildMatchesEagerBuild(monkeypatch):
+    eager = SearchIndex.build(websites())
+    eager.buildTrigrams()
+    background = SearchIndex.build(websites())
+    release = threading.Event()
+    build = SearchIndex.finishTrigrams
+
+    def slowBuild(self, *args):
+        release.wait(5)
+        build(self, *args)
+    monkeypatch.setattr(SearchIndex, 'finishTrigrams', slowBuild)
+    background.buildTrigramsInBackground()
+
+    # Searches while the tables are being built fall back to a scan and never wait for them.
+    assert background.websiteTrigrams is None
+    for query in QUERIES[:-2]:
+        assert background.search(query) == eager.search(query)
+    assert background.websiteTrigrams is None
+    # Edits made meanwhile are replayed onto the finished tables.
+    for index in (eager, background):
+        index.addWebsite('newsite.io')
+        index.addEmail('newsite.io', 'fresh@example.io')
+        index.removeEmail('site7.com', 'user7@example.com')
+        index.removeWebsite('site7.com')
+    release.set()
+    background.builder.join(5)
+    assert background.websiteTrigrams is not None
+    assert background.websiteTrigrams.postings == eager.websiteTrigrams.postings
+    assert background.emailTrigrams.postings == eager.emailTrigrams.postings
+    for query in QUERIES + ('newsi', 'fresh', 'site7'):
+        assert background.search(query) == eager.search(query)
+
+
+def testStoreEditsKeepIndexCurrent(workdir, openStore):
+    createVault('binary', sampleEntries())
+    store = openStore()
+    store.search('ite1')
+    assert store.searchIndex.websiteTrigrams is not None
+    store.addPassword('brandnew.org', 'owner@brandnew.org', 'Brand!pw1abc')
+    store.addPassword('site1.com', 'second@example.com', 'Second!pw1ab')
+    store.updateEmail('site3.com', 'user3@example.com', 'renamed@example.net')
+    store.deletePassword('site2.com', 'user2@example.com')
+    store.deletePassword('shared.com', 'first@example.com')
+
+    rebuilt = SearchIndex.build(store.passwords)
+    rebuilt.buildTrigrams()
+    assert store.searchIndex.websiteTrigrams.postings == rebuilt.websiteTrigrams.postings
+    assert store.searchIndex.emailTrigrams.postings == rebuilt.emailTrigrams.postings
+    for query in ('brandn', 'owner', 'second@', 'renamed', 'user3', 'site2', 'shared', 'first@', 'ite', 'xample', 'brnadnew'):
+        assert store.search(query) == rebuilt.search(query), query
+    assert store.search('brandnew') == ['brandnew.org']
+    assert store.search('renamed') == ['site3.com']
+    assert 'site2.com' not in store.search('site2')
+    assert store.search('shared') == ['shared.com']
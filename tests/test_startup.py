@@ -0,0 +1,31 @@
+from benchmarks.startup import DEFERRED_MODULES, deferredModulesLoaded, main, profileImports, runPython
+
+
+def testStartupLeavesHeavyModulesUnloaded():
+    assert deferredModulesLoaded('frontend.mainWindow') == []
+    # Agent lookups from the command line only pay for the socket client.
+    assert deferredModulesLoaded('cli') == []
+
+
+def testCryptoLoadsWithTheVault():
+    check = f'import sys, backend.passwordManager; print(" ".join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))'
+    assert 'cryptography' in runPython(['-c', check]).stdout.split()
+
+
+def testProfileIsGroupedByPackage():
+    rows = profileImports('frontend.mainWindow')
+    packages = [package for package, _, _ in rows]
+    assert len(packages) == len(set(packages))
+    assert 'frontend' in packages and 'cryptography' not in packages
+    assert [micros for _, micros, _ in rows] == sorted((micros for _, micros, _ in rows), reverse=True)
+    frontend = profileImports('frontend.mainWindow', depth=2)
+    assert any(package == 'frontend.mainWindow' for package, _, _ in frontend)
+
+
+def testCheckFailsOnlyOnRegressions(capsys):
+    assert main(['--check', '--import-budget-ms', '60000', '--dialog-budget-ms', '60000']) == 0
+    assert "deferred modules imported at startup: none" in capsys.readouterr().out
+    # A module that pulls in the vault at import time is caught.
+    assert main(['--check', '--module', 'backend.passwordManager', '--import-budget-ms', '60000',
+                 '--dialog-budget-ms', '60000']) == 1
+    assert "Startup regression: deferred imports" in capsys.readouterr().err
@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+from backend.journal import JOURNAL_PATH
+from backend.sqliteVault import SqliteVault
+from backend.storage import VaultStorage
+from backend.vaultFormat import CHUNKED_VAULT_PATH, SQLITE_VAULT_PATH, VAULT_PATH, activeDataPath
+from conftest import FORMAT_PATHS, contents, createVault, sampleEntries, unlock
+
+
+def editedEntries():
+    entries = sampleEntries()
+    entries['new.com'] = {'new@example.com': 'New!pw1abcd'}
+    entries['site1.com'] = {'user1@example.com': 'Changed!pw1'}
+    del entries['site2.com']
+    entries['site3.com'] = {'renamed@example.com': entries['site3.com']['user3@example.com']}
+    del entries['shared.com']['first@example.com']
+    return entries
+
+
+def applyEdits(store):
+    store.addPassword('new.com', 'new@example.com', 'New!pw1abcd')
+    store.updatePassword('site1.com', 'user1@example.com', 'Changed!pw1')
+    store.deletePassword('site2.com', 'user2@example.com')
+    store.updateEmail('site3.com', 'user3@example.com', 'renamed@example.com')
+    store.deletePassword('shared.com', 'first@example.com')
+
+
+@pytest.mark.parametrize('lazySecrets', [False, True])
+@pytest.mark.parametrize('backgroundWrites', [False, True])
+def testRoundTrip(vaultFormat, openStore, lazySecrets, backgroundWrites):
+    assert activeDataPath() == FORMAT_PATHS[vaultFormat]
+    store = openStore(lazySecrets=lazySecrets, backgroundWrites=backgroundWrites)
+    assert contents(store) == sampleEntries()
+    assert store.getPassword('shared.com', 'second@example.com') == 'Second!pw2abc'
+    applyEdits(store)
+    assert store.flush()
+    assert contents(openStore()) == editedEntries()
+    assert contents(store) == editedEntries()
+
+
+def testBatchWritesOnce(vaultFormat, openStore):
+    store = openStore()
+    with store.batch():
+        applyEdits(store)
+        # Nothing reaches the disk before the batch ends.
+        assert contents(openStore()) == sampleEntries()
+    assert contents(openStore()) == editedEntries()
+
+
+@pytest.mark.parametrize('target', [VAULT_PATH, CHUNKED_VAULT_PATH, SQLITE_VAULT_PATH])
+def testConversion(vaultFormat, openStore, target):
+    store = openStore()
+    applyEdits(store)
+    converted = store.convertFormat(target)
+    assert converted == (FORMAT_PATHS[vaultFormat] != target)
+    assert activeDataPath() == target
+    if converted:
+        assert not os.path.exists(FORMAT_PATHS[vaultFormat])
+    if target != VAULT_PATH:
+        assert not os.path.exists(JOURNAL_PATH)
+    reopened = openStore()
+    assert contents(reopened) == editedEntries()
+    reopened.addPassword('after.com', 'after@example.com', 'After!pw1abc')
+    assert openStore().getPassword('after.com', 'after@example.com') == 'After!pw1abc'
+
+
+def testIncompleteBackendFailsOnConstruction(workdir):
+    class ReadOnlyStorage(VaultStorage):
+        def read(self):
+            return {}
+
+    with pytest.raises(TypeError):
+        ReadOnlyStorage('data/passwords.vault', None)
+
+
+def testFailedSqliteRewriteKeepsKey(workdir):
+    createVault('sqlite', sampleEntries())
+    encryptionManager = unlock()
+    vault = SqliteVault(SQLITE_VAULT_PATH, encryptionManager)
+    try:
+        oldKey = encryptionManager.vaultKey
+        encryptionManager.vaultKey = os.urandom(len(oldKey))
+        broken = dict(sampleEntries(), **{'broken.com': {'broken@example.com': None}})
+        with pytest.raises(AttributeError):
+            vault.rewrite(broken)
+        # Rolled back, so the rows are still under the old key and this instance still reads them.
+        assert vault.readAll() == sampleEntries()
+    finally:
+        vault.close()
@@ -0,0 +1,89 @@
+import io
+import os
+
+import pytest
+
+from backend.vaultFormat import FRAME_LENGTH, VaultFormatError, VaultReader, VaultWriter, readVault, writeVault
+from conftest import sampleEntries, unlock
+
+
+@pytest.fixture
+def encryptionManager(workdir):
+    os.makedirs('resources')
+    return unlock()
+
+
+def framedVault(encryptionManager, frameSize=256):
+    # Small frames, so the sample spans several of them.
+    stream = io.BytesIO()
+    with VaultWriter(stream, encryptionManager, frameSize=frameSize) as writer:
+        for website, entries in sampleEntries().items():
+            for email, password in entries.items():
+                writer.write(website, email, password)
+    return stream.getvalue()
+
+
+def frameOffsets(data, encryptionManager):
+    reader = VaultReader(io.BytesIO(data), encryptionManager)
+    offsets = [len(reader.preamble)]
+    while offsets[-1] < len(data):
+        length = FRAME_LENGTH.unpack_from(data, offsets[-1])[0] & 0x7FFFFFFF
+        offsets.append(offsets[-1] + FRAME_LENGTH.size + length)
+    return offsets
+
+
+def testRoundTrip(encryptionManager):
+    passwords = sampleEntries()
+    passwords['ünïcode.com'] = {'ユーザー@example.com': 'Pässwörd!1 with spaces'}
+    passwords['empty.com'] = {'blank@example.com': ''}
+    stream = io.BytesIO()
+    writeVault(stream, encryptionManager, passwords)
+    stream.seek(0)
+    assert readVault(stream, encryptionManager) == passwords
+
+
+def testEmptyVault(encryptionManager):
+    stream = io.BytesIO()
+    writeVault(stream, encryptionManager, {})
+    stream.seek(0)
+    assert readVault(stream, encryptionManager) == {}
+
+
+def testManyFrames(encryptionManager):
+    data = framedVault(encryptionManager)
+    assert len(frameOffsets(data, encryptionManager)) > 5
+    assert readVault(io.BytesIO(data), encryptionManager) == sampleEntries()
+
+
+def testWrongKeyIsRejected(encryptionManager):
+    data = framedVault(encryptionManager)
+    other = unlock(password='xyzAB34!other')
+    with pytest.raises(VaultFormatError):
+        readVault(io.BytesIO(data), other)
+
+
+@pytest.mark.parametrize('damage', ['flip', 'truncateFrame', 'dropFinalFrame', 'swapFrames', 'trailing', 'header', 'garbledHeader', 'magic'])
+def testDamageIsDetected(encryptionManager, damage):
+    data = bytearray(framedVault(encryptionManager))
+    offsets = frameOffsets(bytes(data), encryptionManager)
+    if damage == 'flip':
+        data[offsets[1] + 10] ^= 1
+    elif damage == 'truncateFrame':
+        del data[offsets[2] - 5:]
+    elif damage == 'dropFinalFrame':
+        del data[offsets[-2]:]
+    elif damage == 'swapFrames':
+        first, second = data[offsets[0]:offsets[1]], data[offsets[1]:offsets[2]]
+        data[offsets[0]:offsets[2]] = second + first
+    elif damage == 'trailing':
+        data += b'\0'
+    elif damage == 'header':
+        # Still a well-formed header; every frame authenticates it, so the change is caught.
+        salt = data.index(b'"fileSalt":"') + len(b'"fileSalt":"')
+        data[salt] = ord('B') if data[salt] == ord('A') else ord('A')
+    elif damage == 'garbledHeader':
+        data[offsets[0] - 3] ^= 1
+    else:
+        data[0] ^= 1
+    with pytest.raises(VaultFormatError):
+        readVault(io.BytesIO(bytes(data)), encryptionManager)
@@ -0,0 +1,157 @@
+import os
+import shutil
+
+import pytest
+
+from backend.storage import openStorage
+from backend.vaultFormat import activeDataPath
+from backend.vaultMerge import MergeError, mergeVaults, openCopy
+from conftest import PASSWORD, USERNAME, contents, createVault, sampleEntries, unlock
+
+
+@pytest.fixture
+def copies(vaultFormat, openStore):
+    # The working-directory vault, copied to two places as if synced between machines.
+    for root in ('ours', 'theirs'):
+        os.makedirs(root)
+        for directory in ('data', 'resources'):
+            shutil.copytree(directory, os.path.join(root, directory))
+
+    def opener(**storeOptions):
+        return openStore('ours', **storeOptions), openStore('theirs', **storeOptions)
+    return opener
+
+
+def divergentEdits(ours, theirs):
+    ours.addPassword('ours.com', 'a@example.com', 'Ours!new1abc')
+    ours.updatePassword('site1.com', 'user1@example.com', 'Ours!pw1abc')
+    ours.deletePassword('site2.com', 'user2@example.com')
+    theirs.addPassword('theirs.com', 'b@example.com', 'Theirs!new1ab')
+    theirs.updatePassword('site3.com', 'user3@example.com', 'Theirs!pw3ab')
+    theirs.deletePassword('site4.com', 'user4@example.com')
+    # Changed differently on both sides, and changed the same way on both.
+    ours.updatePassword('site5.com', 'user5@example.com', 'Ours!pw5abc')
+    theirs.updatePassword('site5.com', 'user5@example.com', 'Theirs!pw5ab')
+    ours.updatePassword('site6.com', 'user6@example.com', 'Same!pw6abc')
+    theirs.updatePassword('site6.com', 'user6@example.com', 'Same!pw6abc')
+
+
+@pytest.mark.parametrize('lazySecrets', [False, True])
+def testThreeWayMerge(copies, openStore, lazySecrets):
+    ours, theirs = copies(lazySecrets=lazySecrets)
+    first = mergeVaults(ours, theirs)
+    assert first.differences == 0 and first.compared == 1
+    divergentEdits(ours, theirs)
+    before = contents(ours), contents(theirs)
+
+    dryRun = mergeVaults(ours, theirs, dryRun=True)
+    assert (dryRun.pulled, dryRun.pushed, len(dryRun.conflicts)) == (3, 3, 1)
+    assert (contents(ours), contents(theirs)) == before
+
+    report = mergeVaults(ours, theirs)
+    assert report.hadBase
+    assert (report.pulled, report.pushed, len(report.conflicts)) == (3, 3, 1)
+    assert (report.conflicts[0].website, report.conflicts[0].email) == ('site5.com', 'user5@example.com')
+    merged = {root: contents(openStore(root)) for root in ('ours', 'theirs')}
+    # Each copy keeps its own value of the conflicting entry.
+    assert merged['ours'].pop('site5.com') == {'user5@example.com': 'Ours!pw5abc'}
+    assert merged['theirs'].pop('site5.com') == {'user5@example.com': 'Theirs!pw5ab'}
+    assert merged['ours'] == merged['theirs']
+    assert merged['ours']['theirs.com'] == {'b@example.com': 'Theirs!new1ab'}
+    assert merged['ours']['site1.com'] == {'user1@example.com': 'Ours!pw1abc'}
+    assert merged['ours']['site3.com'] == {'user3@example.com': 'Theirs!pw3ab'}
+    assert 'site2.com' not in merged['ours'] and 'site4.com' not in merged['ours']
+
+    again = mergeVaults(ours, theirs)
+    assert again.differences == 1 and len(again.conflicts) == 1 and again.pulled == again.pushed == 0
+    settled = mergeVaults(ours, theirs, prefer='theirs')
+    assert settled.resolved == 1
+    assert contents(ours) == contents(theirs)
+    assert contents(ours)['site5.com'] == {'user5@example.com': 'Theirs!pw5ab'}
+    assert mergeVaults(ours, theirs).compared == 1
+
+
+def testMergeSurvivesReopening(copies):
+    ours, theirs = copies()
+    mergeVaults(ours, theirs)
+    ours.close()
+    theirs.close()
+    # The indexes are kept current by the writes themselves, without another merge.
+    ours, theirs = copies()
+    assert ours.merkle is not None
+    divergentEdits(ours, theirs)
+    report = mergeVaults(ours, theirs, prefer='ours')
+    assert report.hadBase and report.resolved == 1
+    assert contents(ours) == contents(theirs)
+
+
+def testNoCommonAncestor(copies):
+    ours, theirs = copies()
+    divergentEdits(ours, theirs)
+    report = mergeVaults(ours, theirs)
+    assert not report.hadBase
+    # Without a base, an entry one side lacks is taken as added on the other, and
+    # every entry changed on either side is a conflict.
+    assert (report.pulled, report.pushed) == (2, 2)
+    assert sorted((c.website, c.email) for c in report.conflicts) == [
+        ('site1.com', 'user1@example.com'), ('site3.com', 'user3@example.com'), ('site5.com', 'user5@example.com')]
+    for website in ('ours.com', 'theirs.com', 'site2.com', 'site4.com'):
+        assert website in contents(ours) and website in contents(theirs)
+    # The merge recorded a base, so the next one knows both sides' values of the conflicts.
+    assert mergeVaults(ours, theirs, prefer='ours').hadBase
+    assert contents(ours) == contents(theirs)
+
+
+def testStaleIndexIsRebuilt(copies):
+    ours, theirs = copies()
+    mergeVaults(ours, theirs)
+    ours.close()
+    # Rewritten behind the store's back, e.g. by a file sync; the index no longer matches.
+    changed = sampleEntries()
+    changed['synced.com'] = {'synced@example.com': 'Synced!pw7ab'}
+    openStorage(activeDataPath('ours'), unlock('ours')).write(changed)
+    ours, _ = copies()
+    report = mergeVaults(ours, theirs)
+    assert report.pulled == 0 and report.pushed == 1
+    assert contents(theirs)['synced.com'] == {'synced@example.com': 'Synced!pw7ab'}
+
+
+def testSameVaultIsRejected(copies, openStore):
+    ours, _ = copies()
+    with pytest.raises(MergeError):
+        mergeVaults(ours, openStore('ours'))
+
+
+def testDifferentMasterKeyIsRejected(vaultFormat, openStore):
+    createVault(vaultFormat, sampleEntries(), 'elsewhere')
+    with pytest.raises(MergeError):
+        mergeVaults(openStore(), openStore('elsewhere'))
+
+
+def testOpenCopyChecksPassword(copies):
+    with pytest.raises(MergeError):
+        openCopy('ours', USERNAME, 'wrongPW1!xyz')
+    with pytest.raises(MergeError):
+        openCopy('missing', USERNAME, PASSWORD)
+
+
+def testJournalContentIdReadsNoFiles(workdir, openStore, monkeypatch):
+    createVault('journal', sampleEntries())
+    for root in ('ours', 'theirs'):
+        for directory in ('data', 'resources'):
+            shutil.copytree(directory, os.path.join(root, directory))
+    ours, theirs = openStore('ours'), openStore('theirs')
+    mergeVaults(ours, theirs)
+
+    def unexpected(path):
+        raise AssertionError(f"hashed {path}")
+    with monkeypatch.context() as patch:
+        for module in ('journal', 'storage'):
+            patch.setattr(f'backend.{module}.snapshotFingerprint', unexpected)
+        # Same-length edits on both sides still leave the copies with different ids.
+        ours.updatePassword('site1.com', 'user1@example.com', 'Ours!pw1abc')
+        theirs.updatePassword('site1.com', 'user1@example.com', 'Thrs!pw1abc')
+        assert ours.contentId() != theirs.contentId()
+        assert ours.merkle.contentId() == ours.contentId()
+    # A fresh instance arrives at the same id from the files, so the index is not rebuilt.
+    assert openStore('ours').contentId() == ours.contentId()
@@ -0,0 +1,109 @@
+import os
+from multiprocessing import Process
+
+import pytest
+
+from backend.passwordManager import PasswordStore
+from backend.vaultFormat import VAULT_PATH
+from conftest import contents, createVault, sampleEntries, unlock
+
+WORKER_ENTRIES = 60
+
+
+@pytest.mark.parametrize('lazySecrets', [False, True])
+def testExternalChangesAreMerged(vaultFormat, openStore, lazySecrets):
+    ours = openStore(lazySecrets=lazySecrets)
+    theirs = openStore()
+    ours.search('')
+    theirs.addPassword('new.com', 'new@example.com', 'New!pw1abcd')
+    theirs.updatePassword('site1.com', 'user1@example.com', 'Changed!pw1')
+    theirs.deletePassword('site2.com', 'user2@example.com')
+    theirs.updateEmail('site3.com', 'user3@example.com', 'renamed@example.com')
+
+    assert ours.checkForChanges() > 0
+    assert ours.getPassword('new.com', 'new@example.com') == 'New!pw1abcd'
+    assert ours.getPassword('site1.com', 'user1@example.com') == 'Changed!pw1'
+    assert ours.getPassword('site2.com', 'user2@example.com') is None
+    assert ours.getPassword('site3.com', 'renamed@example.com') == 'Pw3!abcXYZ'
+    assert 'new.com' in ours.search('new')
+    assert contents(ours) == contents(theirs)
+    assert ours.checkForChanges() == 0
+
+
+@pytest.mark.parametrize('backgroundWrites', [False, True])
+def testConflictingEditsAreReported(vaultFormat, openStore, backgroundWrites):
+    conflicts = []
+    ours = openStore(backgroundWrites=backgroundWrites, onConflict=conflicts.extend)
+    theirs = openStore()
+    with ours.batch():
+        ours.updatePassword('site4.com', 'user4@example.com', 'Ours!pw4abc')
+        ours.updatePassword('site5.com', 'user5@example.com', 'Ours!pw5abc')
+        theirs.updatePassword('site4.com', 'user4@example.com', 'Theirs!pw4ab')
+        theirs.addPassword('other.com', 'other@example.com', 'Other!pw1abc')
+    assert ours.flush()
+
+    # Our save keeps our value and reports theirs; their other edits survive it.
+    assert [(c.website, c.email, c.external) for c in conflicts] == [('site4.com', 'user4@example.com', 'Theirs!pw4ab')]
+    saved = contents(openStore())
+    assert saved['site4.com'] == {'user4@example.com': 'Ours!pw4abc'}
+    assert saved['site5.com'] == {'user5@example.com': 'Ours!pw5abc'}
+    assert saved['other.com'] == {'other@example.com': 'Other!pw1abc'}
+    assert contents(ours) == saved
+
+
+def testSameEditIsNoConflict(vaultFormat, openStore):
+    conflicts = []
+    ours = openStore(onConflict=conflicts.extend)
+    theirs = openStore()
+    with ours.batch():
+        ours.updatePassword('site4.com', 'user4@example.com', 'Same!pw4abc')
+        theirs.updatePassword('site4.com', 'user4@example.com', 'Same!pw4abc')
+    assert conflicts == []
+
+
+def addEntries(tag: str, backgroundWrites: bool) -> None:
+    store = PasswordStore(unlock(), backgroundWrites=backgroundWrites)
+    for i in range(WORKER_ENTRIES):
+        store.addPassword(f'{tag}{i % 10}.com', f'{tag}{i}@example.com', f'Pw{i}!{tag}xyz')
+        if i % 7 == 0:
+            store.checkForChanges()
+    store.close()
+
+
+@pytest.mark.parametrize('backgroundWrites', [False, True])
+def testConcurrentProcessesLoseNothing(vaultFormat, backgroundWrites):
+    workers = [Process(target=addEntries, args=(tag, backgroundWrites)) for tag in 'pq']
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+    store = PasswordStore(unlock())
+    try:
+        entries = contents(store)
+    finally:
+        store.close()
+    assert sum(len(accounts) for accounts in entries.values()) == \
+        sum(len(accounts) for accounts in sampleEntries().values()) + 2 * WORKER_ENTRIES
+    assert entries['q9.com']['q59@example.com'] == 'Pw59!qxyz'
+
+
+def testTouchedVaultIsNotReread(workdir, openStore, monkeypatch):
+    createVault('binary', sampleEntries())
+    ours = openStore()
+    theirs = openStore()
+    theirs.addPassword('new.com', 'new@example.com', 'New!pw1abcd')
+    assert ours.storage.generation()[0] == ours.generation[0] + 1
+    assert ours.checkForChanges() == 1
+
+    # A file sync put the same vault back with a new timestamp and inode.
+    with open(VAULT_PATH, 'rb') as f:
+        data = f.read()
+    os.remove(VAULT_PATH)
+    with open(VAULT_PATH, 'wb') as f:
+        f.write(data)
+    reads = []
+    monkeypatch.setattr(ours.storage, 'read', lambda: reads.append(True))
+    assert ours.checkForChanges() == 0
+    assert reads == []
+    assert ours.vaultSignature() == ours.signature
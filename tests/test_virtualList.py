@@ -0,0 +1,118 @@
+from frontend.virtualList import VirtualList
+
+
+class RecordingListbox:
+    # Just enough of tk.Listbox to run VirtualList without a display, counting the rows
+    # each call inserts or deletes.
+    def __init__(self, height=10):
+        self.height = height
+        self.rows = []
+        self.inserted = 0
+        self.deleted = 0
+        self.selected = set()
+        self.idle = []
+
+    def config(self, **options):
+        pass
+
+    def cget(self, option):
+        return str(self.height)
+
+    def bind(self, sequence, callback):
+        pass
+
+    def insert(self, index, *rows):
+        self.rows[index:index] = rows
+        self.inserted += len(rows)
+
+    def delete(self, first, last):
+        del self.rows[first:last + 1]
+        self.deleted += last + 1 - first
+
+    def yview(self, *args):
+        pass
+
+    def selection_clear(self, first, last):
+        self.selected.clear()
+
+    def selection_set(self, index):
+        self.selected.add(index)
+
+    def curselection(self):
+        return tuple(sorted(self.selected))
+
+    def after_idle(self, callback):
+        self.idle.append(callback)
+
+
+class RecordingScrollbar:
+    def __init__(self):
+        self.position = None
+
+    def config(self, **options):
+        pass
+
+    def set(self, first, last):
+        self.position = (first, last)
+
+
+def virtualList(items, overscan=5, **options):
+    listbox = RecordingListbox()
+    view = VirtualList(listbox, RecordingScrollbar(), overscan=overscan, **options)
+    view.setItems(items)
+    return view, listbox
+
+
+def testOnlyTheWindowIsInserted():
+    items = [f'site{i}.com' for i in range(100000)]
+    view, listbox = virtualList(items)
+    assert listbox.rows == items[:15]
+    view.yview('moveto', '0.5')
+    assert listbox.rows == items[49995:50015]
+    assert view.scrollbar.position == (0.5, 0.5001)
+    view.yview('moveto', '1.0')
+    assert listbox.rows == items[-15:]
+
+
+def testScrollingMovesOnlyTheEdges():
+    items = [f'site{i}.com' for i in range(1000)]
+    view, listbox = virtualList(items)
+    view.yview('moveto', '0.1')
+    listbox.inserted = listbox.deleted = 0
+    view.yview('scroll', '3', 'units')
+    assert listbox.rows == items[98:118]
+    assert listbox.inserted == listbox.deleted == 3
+
+
+def testFilteringAppliesADiff():
+    items = [f'site{i}.com' for i in range(20)]
+    view, listbox = virtualList(items)
+    listbox.inserted = listbox.deleted = 0
+    # One row gone from the top of the window: one delete, and one row shifts in at the bottom.
+    view.setItems(items[1:])
+    assert listbox.rows == items[1:16]
+    assert (listbox.inserted, listbox.deleted) == (1, 1)
+
+
+def testSelectionFollowsTheItem():
+    items = [f'site{i}.com' for i in range(100)]
+    view, listbox = virtualList(items)
+    listbox.selected = {3}
+    view.onSelect(None)
+    assert view.selectedItem() == 'site3.com'
+    view.removeSelected()
+    assert view.selectedItem() is None
+    assert listbox.rows[3] == 'site4.com' and len(view.items) == 99
+
+
+def testReachingTheEndAsksForMore():
+    pages = [[f'site{i}.com' for i in range(30)], [f'site{i}.com' for i in range(60)]]
+    requests = []
+    view, listbox = virtualList(pages[0], onReachEnd=lambda: requests.append(True))
+    assert not listbox.idle
+    view.yview('moveto', '1.0')
+    assert len(listbox.idle) == 1
+    listbox.idle.pop()()
+    view.extendItems(pages[1])
+    assert requests == [True]
+    assert listbox.rows == pages[1][15:35]